@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SalesStats, TopSellingBook, CustomerStats
+from .models import SalesStats, TopSellingBook, CustomerStats, CustomerLifetime, DashboardSnapshot, ExportJob
 
 
 @admin.register(SalesStats)
@@ -33,3 +33,27 @@ class CustomerStatsAdmin(admin.ModelAdmin):
 
 
 
+
+
+@admin.register(CustomerLifetime)
+class CustomerLifetimeAdmin(admin.ModelAdmin):
+    list_display = ("user", "order_count", "total_spent", "average_order_value", "first_order_date", "last_order_date")
+    list_filter = ("first_order_date",)
+    search_fields = ("user__username", "user__email")
+    raw_id_fields = ("user",)
+    readonly_fields = ("updated_at",)
+    ordering = ("-order_count",)
+
+
+@admin.register(DashboardSnapshot)
+class DashboardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("computed_at",)
+    readonly_fields = ("computed_at", "data")
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "report", "format", "status", "rows_written", "rows_total", "created_by", "created_at")
+    list_filter = ("status", "report", "format")
+    readonly_fields = ("created_at", "started_at", "finished_at")
+    ordering = ("-created_at",)
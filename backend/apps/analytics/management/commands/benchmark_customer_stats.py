@@ -0,0 +1,160 @@
+"""Команда для замера расчёта статистики клиентов на синтетических заказах.
+
+Сравнивает прежний расчёт (пять запросов с JOIN пользователей на каждый день)
+с CustomerStats.update_customer_stats_range за весь период, который читает
+даты первой покупки из CustomerLifetime.
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from backend.apps.analytics.models import CustomerLifetime, CustomerStats
+from backend.apps.orders.models import Order
+
+User = get_user_model()
+
+
+def legacy_customer_stats(date):
+    """Прежний расчёт CustomerStats.update_daily_customer_stats (без записи результата)"""
+    total_customers = User.objects.filter(
+        orders__created_at__date__lte=date,
+        orders__status='delivered'
+    ).distinct().count()
+    new_customers = User.objects.filter(
+        orders__created_at__date=date,
+        orders__status='delivered'
+    ).annotate(
+        first_order_date=models.Min('orders__created_at__date')
+    ).filter(first_order_date=date).count()
+    returning_customers = User.objects.filter(
+        orders__created_at__date=date,
+        orders__status='delivered'
+    ).annotate(
+        first_order_date=models.Min('orders__created_at__date')
+    ).exclude(first_order_date=date).count()
+    customer_revenue = User.objects.filter(
+        orders__created_at__date=date,
+        orders__status='delivered'
+    ).annotate(
+        daily_revenue=Sum('orders__total_amount')
+    ).aggregate(total=Sum('daily_revenue'))['total'] or 0
+    active_customers = User.objects.filter(
+        orders__created_at__date=date,
+        orders__status='delivered'
+    ).count()
+    average_customer_value = customer_revenue / active_customers if active_customers > 0 else 0
+    return total_customers, new_customers, returning_customers, average_customer_value
+
+
+class Command(BaseCommand):
+    help = 'Замер расчёта статистики клиентов: прежний подневный расчёт против расчёта за период'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000, help='Количество синтетических заказов')
+        parser.add_argument('--users', type=int, default=50_000, help='Количество синтетических клиентов')
+        parser.add_argument('--days', type=int, default=365, help='Длина периода истории, дней')
+        parser.add_argument(
+            '--sample-days',
+            type=int,
+            default=7,
+            help='Сколько дней считать прежним способом (время на период экстраполируется)'
+        )
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Не откатывать сгенерированные данные после замера'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            date_from, date_to = self._generate(rng, options)
+            self._run(rng, date_from, date_to, options)
+            if not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write(self.style.WARNING('Сгенерированные данные откатываются (используйте --keep)'))
+
+    def _generate(self, rng, options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        prefix = f'bench{rng.getrandbits(32):08x}'
+        users = User.objects.bulk_create(
+            [User(username=f'{prefix}-{i}', password='!') for i in range(options['users'])],
+            batch_size=batch_size
+        )
+        user_ids = [user.pk for user in users]
+
+        end = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        start = end - timedelta(days=options['days'] - 1)
+        span = int((end - start).total_seconds()) + 12 * 3600
+        statuses = ['delivered'] * 8 + ['shipped', 'cancelled']
+
+        # created_at задаётся явно: auto_now_add перезаписал бы его при bulk_create
+        created_at = Order._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        try:
+            for offset in range(0, options['orders'], batch_size):
+                Order.objects.bulk_create([
+                    Order(
+                        user_id=rng.choice(user_ids),
+                        status=rng.choice(statuses),
+                        total_amount=Decimal(rng.randint(100, 5000)),
+                        created_at=start + timedelta(seconds=rng.randrange(span)),
+                    )
+                    for _ in range(min(batch_size, options['orders'] - offset))
+                ], batch_size=batch_size)
+        finally:
+            created_at.auto_now_add = True
+
+        self.stdout.write(
+            f'Generated {options["orders"]} orders for {len(user_ids)} users over {options["days"]} days '
+            f'in {time.perf_counter() - started:.1f}s'
+        )
+
+        # bulk_create не отправляет сигналы, итоги клиентов строятся целиком
+        started = time.perf_counter()
+        CustomerLifetime.rebuild()
+        self.stdout.write(f'Rebuilt customer lifetimes in {time.perf_counter() - started:.1f}s')
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE orders_order; ANALYZE analytics_customerlifetime;')
+        return timezone.localdate(start), timezone.localdate(end)
+
+    def _run(self, rng, date_from, date_to, options):
+        days = (date_to - date_from).days + 1
+        sample = sorted(rng.sample(range(days), min(options['sample_days'], days)))
+        sample = [date_from + timedelta(days=i) for i in sample]
+
+        started = time.perf_counter()
+        legacy = {day: legacy_customer_stats(day) for day in sample}
+        legacy_per_day = (time.perf_counter() - started) / len(sample)
+
+        started = time.perf_counter()
+        stats = {s.date: s for s in CustomerStats.update_customer_stats_range(date_from, date_to)}
+        elapsed = time.perf_counter() - started
+
+        # Сверяется только общее число клиентов: прежний расчёт считал новых и постоянных
+        # по MIN() уже отфильтрованных заказов дня и учитывал клиента по числу его заказов
+        mismatches = [day for day, (total, _, _, _) in legacy.items() if stats[day].total_customers != total]
+        self.stdout.write(
+            f'legacy: {legacy_per_day * 1000:.0f} ms per day, '
+            f'~{legacy_per_day * days:.0f}s for {days} days (extrapolated from {len(sample)} days)'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'range: {elapsed:.1f}s for {days} days '
+            f'({legacy_per_day * days / elapsed:.0f}x faster)'
+        ))
+        if mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'Total customers differ from the legacy computation on: {", ".join(map(str, mismatches))}'
+            ))
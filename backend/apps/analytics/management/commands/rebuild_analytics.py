@@ -0,0 +1,107 @@
+"""Команда для пересчёта исторической аналитики за период.
+
+Период делится на отрезки по --chunk-days дней, отрезки считаются параллельно
+в пуле процессов (у каждого процесса своё соединение с БД). Внутри отрезка
+SalesStats и CustomerStats считаются группирующими запросами за весь отрезок и
+записываются одним bulk_create(update_conflicts=True), топ книг — одним
+INSERT ... SELECT (TopSellingBook.update_top_books_range). Перед этим один раз
+пересчитываются итоги клиентов (CustomerLifetime), от которых зависит CustomerStats.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from backend.apps.analytics.models import CustomerLifetime, CustomerStats, SalesStats, TopSellingBook
+from backend.apps.orders.models import Order
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def rebuild_chunk(date_from, date_to):
+    """Пересчитать аналитику за отрезок [date_from, date_to] одной транзакцией; возвращает число дней"""
+    with transaction.atomic():
+        SalesStats.update_stats_range(date_from, date_to)
+        TopSellingBook.update_top_books_range(date_from, date_to)
+        CustomerStats.update_customer_stats_range(date_from, date_to)
+    return (date_to - date_from).days + 1
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать SalesStats, TopSellingBook и CustomerStats за период'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            type=date.fromisoformat,
+            help='Первый день (YYYY-MM-DD); по умолчанию — день первого заказа'
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            type=date.fromisoformat,
+            help='Последний день (YYYY-MM-DD); по умолчанию — сегодня'
+        )
+        parser.add_argument('--workers', type=int, default=1, help='Количество процессов')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Длина отрезка, обрабатываемого процессом')
+
+    def handle(self, *args, **options):
+        date_to = options['date_to'] or timezone.now().date()
+        date_from = options['date_from']
+        if date_from is None:
+            first_order = Order.objects.aggregate(first=Min('created_at'))['first']
+            if first_order is None:
+                self.stdout.write('No orders found')
+                return
+            date_from = first_order.date()
+        if date_from > date_to:
+            raise CommandError('--from must not be later than --to')
+        workers = max(1, options['workers'])
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite допускает только одного пишущего, параллельные отрезки упрутся в блокировку
+            self.stdout.write(self.style.WARNING('SQLite does not support parallel writers, using 1 worker'))
+            workers = 1
+        chunk_days = max(1, options['chunk_days'])
+
+        started = time.perf_counter()
+        CustomerLifetime.rebuild()
+        self.stdout.write(f'Rebuilt customer lifetimes in {time.perf_counter() - started:.1f}s')
+
+        chunks = []
+        chunk_from = date_from
+        while chunk_from <= date_to:
+            chunk_to = min(chunk_from + timedelta(days=chunk_days - 1), date_to)
+            chunks.append((chunk_from, chunk_to))
+            chunk_from = chunk_to + timedelta(days=1)
+
+        started = time.perf_counter()
+        days = 0
+        if workers == 1:
+            for chunk in chunks:
+                days += rebuild_chunk(*chunk)
+                self._progress(chunk, days, started)
+        else:
+            # Дочерние процессы не должны наследовать соединение родителя
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = {pool.submit(rebuild_chunk, *chunk): chunk for chunk in chunks}
+                for future in as_completed(futures):
+                    days += future.result()
+                    self._progress(futures[future], days, started)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt analytics for {days} days in {elapsed:.1f}s '
+            f'({days / elapsed if elapsed else days:.1f} days/s, {workers} workers)'
+        ))
+
+    def _progress(self, chunk, days, started):
+        self.stdout.write(f'  {chunk[0]}..{chunk[1]} done, {days} days in {time.perf_counter() - started:.1f}s')
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:36
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+import django.db.models.deletion
+
+
+def backfill_customer_lifetime(apps, schema_editor):
+    """Заполнить итоги клиентов по уже доставленным заказам"""
+    Order = apps.get_model('orders', 'Order')
+    CustomerLifetime = apps.get_model('analytics', 'CustomerLifetime')
+    rows = (
+        Order.objects.filter(status='delivered')
+        .values('user_id')
+        .annotate(first=Min('created_at__date'), last=Max('created_at__date'), count=Count('pk'), spent=Sum('total_amount'))
+        .order_by()
+    )
+    CustomerLifetime.objects.bulk_create([
+        CustomerLifetime(
+            user_id=row['user_id'],
+            first_order_date=row['first'],
+            last_order_date=row['last'],
+            order_count=row['count'],
+            total_spent=row['spent'],
+            average_order_value=(row['spent'] / row['count']).quantize(Decimal('0.01')),
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0004_idempotencykey'),
+        ('analytics', '0002_customerstats_salesstats_topsellingbook_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerLifetime',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lifetime', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Клиент')),
+                ('first_order_date', models.DateField(db_index=True, null=True, verbose_name='Дата первого заказа')),
+                ('last_order_date', models.DateField(null=True, verbose_name='Дата последнего заказа')),
+                ('order_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество заказов')),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма покупок')),
+                ('average_order_value', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Средний чек')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Итоги клиента',
+                'verbose_name_plural': 'Итоги клиентов',
+            },
+        ),
+        migrations.RunPython(backfill_customer_lifetime, migrations.RunPython.noop),
+    ]
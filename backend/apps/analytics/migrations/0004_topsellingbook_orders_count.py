@@ -0,0 +1,60 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:41
+
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_top_books(apps, schema_editor):
+    """Пересчитать уже сохранённые строки топа: число заказов и выручку (цена × количество)"""
+    TopSellingBook = apps.get_model('analytics', 'TopSellingBook')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    bounds = TopSellingBook.objects.aggregate(first=Min('date'), last=Max('date'))
+    if bounds['first'] is None:
+        return
+    totals = {
+        (row['day'], row['book_id']): row
+        for row in OrderItem.objects.filter(
+            order__status='delivered',
+            order__created_at__range=(
+                timezone.make_aware(datetime.combine(bounds['first'], time.min)),
+                timezone.make_aware(datetime.combine(bounds['last'], time.max)),
+            ),
+        )
+        .values('book_id', day=TruncDate('order__created_at'))
+        .annotate(
+            quantity_sold=Sum('quantity'),
+            revenue=Sum(F('price') * F('quantity')),
+            orders_count=Count('order_id', distinct=True),
+        )
+        .order_by()
+    }
+    rows = []
+    for top in TopSellingBook.objects.iterator():
+        row = totals.get((top.date, top.book_id))
+        if row is not None:
+            top.quantity_sold = row['quantity_sold']
+            top.revenue = row['revenue']
+            top.orders_count = row['orders_count']
+            rows.append(top)
+    TopSellingBook.objects.bulk_update(rows, ['quantity_sold', 'revenue', 'orders_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_idempotencykey'),
+        ('analytics', '0003_customerlifetime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topsellingbook',
+            name='orders_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество заказов'),
+        ),
+        migrations.RunPython(backfill_top_books, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:46
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_topsellingbook_orders_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed_at', models.DateTimeField(verbose_name='Рассчитан')),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Показатели')),
+            ],
+            options={
+                'verbose_name': 'Снимок панели управления',
+                'verbose_name_plural': 'Снимки панели управления',
+            },
+        ),
+    ]
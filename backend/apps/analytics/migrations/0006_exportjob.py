@@ -0,0 +1,39 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('analytics', '0005_dashboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report', models.CharField(max_length=50, verbose_name='Отчёт')),
+                ('format', models.CharField(choices=[('csv', 'CSV (gzip)'), ('parquet', 'Parquet')], default='csv', max_length=10, verbose_name='Формат')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Параметры')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('rows_total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Всего строк')),
+                ('rows_written', models.PositiveIntegerField(default=0, verbose_name='Записано строк')),
+                ('file', models.FileField(blank=True, upload_to='exports/', verbose_name='Файл')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Создал')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка',
+                'verbose_name_plural': 'Выгрузки',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
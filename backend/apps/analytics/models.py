@@ -1,11 +1,28 @@
-from django.db import models
+import json
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 
 User = get_user_model()
 
 
+def _day_bounds(date_from, date_to):
+    """Границы периода [date_from, date_to] в текущем часовом поясе для фильтра по created_at.
+
+    В отличие от created_at__date, такой фильтр использует индекс по created_at.
+    """
+    start = timezone.make_aware(datetime.combine(date_from, time.min))
+    end = timezone.make_aware(datetime.combine(date_to, time.max))
+    return start, end
+
+
 class SalesStats(models.Model):
     """Статистика продаж по дням"""
     date = models.DateField(unique=True, verbose_name='Дата')
@@ -32,36 +49,90 @@ class SalesStats(models.Model):
 
     @classmethod
     def update_daily_stats(cls, date=None):
-        """Обновить статистику за день"""
+        """Пересчитать статистику за день с нуля (сверка с заказами, см. rebuild_analytics)"""
         if date is None:
             date = timezone.now().date()
+        return cls.update_stats_range(date, date)[0]
+
+    @classmethod
+    def update_stats_range(cls, date_from, date_to):
+        """Пересчитать статистику за каждый день периода с нуля.
+
+        Два группирующих по дню запроса (заказы и позиции) и одна пакетная запись,
+        независимо от длины периода. Возвращает список SalesStats по дням.
+        """
+        from backend.apps.orders.models import Order, OrderItem
+        from django.db.models.functions import TruncDate
         
-        from backend.apps.orders.models import Order
-        
-        # Получаем заказы за день
         orders = Order.objects.filter(
-            created_at__date=date,
-            status='delivered'
+            status='delivered', created_at__range=_day_bounds(date_from, date_to)
+        )
+        totals = {
+            row['day']: row
+            for row in orders.annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(total_orders=Count('pk'), total_revenue=Sum('total_amount'))
+            .order_by()
+        }
+        books_sold = dict(
+            OrderItem.objects.filter(order__in=orders)
+            .annotate(day=TruncDate('order__created_at'))
+            .values('day')
+            .annotate(total=Sum('quantity'))
+            .order_by()
+            .values_list('day', 'total')
         )
         
-        # Вычисляем статистику
-        total_orders = orders.count()
-        total_revenue = sum(order.total_amount for order in orders)
-        total_books_sold = sum(
-            sum(item.quantity for item in order.items.all()) 
-            for order in orders
+        stats = []
+        day = date_from
+        while day <= date_to:
+            row = totals.get(day)
+            total_orders = row['total_orders'] if row else 0
+            total_revenue = row['total_revenue'] if row else Decimal('0')
+            stats.append(cls(
+                date=day,
+                total_orders=total_orders,
+                total_revenue=total_revenue,
+                total_books_sold=books_sold.get(day, 0),
+                average_order_value=(total_revenue / total_orders).quantize(Decimal('0.01')) if total_orders else 0,
+            ))
+            day += timedelta(days=1)
+        
+        return cls.objects.bulk_create(
+            stats,
+            update_conflicts=True,
+            unique_fields=['date'],
+            update_fields=['total_orders', 'total_revenue', 'total_books_sold', 'average_order_value', 'updated_at'],
         )
-        average_order_value = total_revenue / total_orders if total_orders > 0 else 0
+
+    @classmethod
+    def apply_order_delta(cls, order, sign):
+        """Учесть (sign=1) или исключить (sign=-1) доставленный заказ в статистике его дня.
+
+        Один UPDATE с F-выражениями, без пересчёта дня. Средний чек считается
+        по значениям после изменения.
+        """
+        from backend.apps.orders.models import OrderItem
         
-        # Создаем или обновляем статистику
-        stats = cls.get_or_create_for_date(date)
-        stats.total_orders = total_orders
-        stats.total_revenue = total_revenue
-        stats.total_books_sold = total_books_sold
-        stats.average_order_value = average_order_value
-        stats.save()
+        books = OrderItem.objects.filter(order_id=order.pk).aggregate(total=Sum('quantity'))['total'] or 0
+        # День в текущем часовом поясе, как у пересчёта (TruncDate, _day_bounds)
+        date = timezone.localdate(order.created_at)
+        cls.objects.get_or_create(date=date)
         
-        return stats
+        total_orders = F('total_orders') + sign
+        total_revenue = F('total_revenue') + sign * order.total_amount
+        money = models.DecimalField(max_digits=10, decimal_places=2)
+        cls.objects.filter(date=date).update(
+            total_orders=Greatest(total_orders, Value(0)),
+            total_revenue=total_revenue,
+            total_books_sold=Greatest(F('total_books_sold') + sign * books, Value(0)),
+            average_order_value=Case(
+                When(total_orders__gt=-sign, then=ExpressionWrapper(total_revenue / total_orders, output_field=money)),
+                default=Value(Decimal('0')),
+                output_field=money,
+            ),
+            updated_at=timezone.now(),
+        )
 
     @classmethod
     def get_weekly_stats(cls, weeks=4):
@@ -92,6 +163,7 @@ class TopSellingBook(models.Model):
     book = models.ForeignKey('catalog.Book', on_delete=models.CASCADE, verbose_name='Книга')
     quantity_sold = models.PositiveIntegerField(verbose_name='Количество проданных')
     revenue = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Выручка')
+    orders_count = models.PositiveIntegerField(default=0, verbose_name='Количество заказов')
     rank = models.PositiveIntegerField(verbose_name='Позиция в рейтинге')
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -105,38 +177,66 @@ class TopSellingBook(models.Model):
         return f"{self.book.title} - {self.date} (позиция {self.rank})"
 
     @classmethod
-    def update_daily_top_books(cls, date=None, top_count=10):
+    def update_daily_top_books(cls, date=None, top_count=None):
         """Обновить топ книг за день"""
         if date is None:
             date = timezone.now().date()
+        return cls.update_top_books_range(date, date, top_count)
+
+    @classmethod
+    def update_top_books_range(cls, date_from, date_to, top_count=None):
+        """Пересчитать топ книг за каждый день периода одним INSERT ... SELECT.
+
+        Продажи группируются по (день, книга), выручка — сумма цена × количество,
+        места назначаются ROW_NUMBER() внутри дня. top_count — сколько книг хранить
+        на день (по умолчанию ANALYTICS_TOP_BOOKS_LIMIT); 0 — все проданные книги,
+        тогда по таблице можно строить полный отчёт по книгам.
+        Возвращает число записанных строк.
+        """
+        from backend.apps.orders.models import OrderItem
+        from django.db.models.functions import TruncDate
         
-        from backend.apps.orders.models import Order
-        from django.db.models import Sum, Count
-        
-        # Получаем статистику по книгам за день
-        book_stats = cls.objects.filter(date=date).delete()  # Удаляем старые данные
+        if top_count is None:
+            top_count = settings.ANALYTICS_TOP_BOOKS_LIMIT
         
-        from backend.apps.catalog.models import Book
-        book_stats = Book.objects.annotate(
-            daily_quantity=Sum(
-                'orderitem__quantity',
-                filter=models.Q(orderitem__order__created_at__date=date, orderitem__order__status='delivered')
-            ),
-            daily_revenue=Sum(
-                'orderitem__price',
-                filter=models.Q(orderitem__order__created_at__date=date, orderitem__order__status='delivered')
+        per_book_day = (
+            OrderItem.objects.filter(
+                order__status='delivered',
+                order__created_at__range=_day_bounds(date_from, date_to),
             )
-        ).filter(daily_quantity__gt=0).order_by('-daily_quantity')[:top_count]
-        
-        # Создаем записи для топ книг
-        for rank, book in enumerate(book_stats, 1):
-            cls.objects.create(
-                date=date,
-                book=book,
-                quantity_sold=book.daily_quantity or 0,
-                revenue=book.daily_revenue or 0,
-                rank=rank
+            .values('book_id', day=TruncDate('order__created_at'))
+            .annotate(
+                quantity_sold=Sum('quantity'),
+                revenue=Sum(F('price') * F('quantity')),
+                orders_count=Count('order_id', distinct=True),
             )
+            .order_by()
+        )
+        inner_sql, inner_params = per_book_day.query.sql_with_params()
+        qn = connection.ops.quote_name
+        columns = ', '.join(qn(column) for column in (
+            'date', 'book_id', 'quantity_sold', 'revenue', 'orders_count', 'rank', 'created_at'
+        ))
+        sql = f"""
+            INSERT INTO {qn(cls._meta.db_table)} ({columns})
+            SELECT day, book_id, quantity_sold, revenue, orders_count, book_rank, %s
+            FROM (
+                SELECT t.*, ROW_NUMBER() OVER (
+                    PARTITION BY day ORDER BY quantity_sold DESC, revenue DESC, book_id
+                ) AS book_rank
+                FROM ({inner_sql}) t
+            ) ranked
+        """
+        params = [timezone.now(), *inner_params]
+        if top_count:
+            sql += " WHERE book_rank <= %s"
+            params.append(top_count)
+        
+        with transaction.atomic():
+            cls.objects.filter(date__gte=date_from, date__lte=date_to).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.rowcount
 
 
 class CustomerStats(models.Model):
@@ -162,53 +262,322 @@ class CustomerStats(models.Model):
         """Обновить статистику клиентов за день"""
         if date is None:
             date = timezone.now().date()
-        
+        return cls.update_customer_stats_range(date, date)[0]
+
+    @classmethod
+    def update_customer_stats_range(cls, date_from, date_to):
+        """Пересчитать статистику клиентов за каждый день периода.
+
+        Активные клиенты и выручка по дням берутся одним группирующим запросом
+        по заказам периода, а даты первой покупки — из CustomerLifetime, так что
+        история до начала периода не читается. Новые клиенты дня — те, чья
+        первая покупка пришлась на этот день, общее число клиентов — накопленная
+        сумма новых. Возвращает список CustomerStats по дням периода.
+        """
         from backend.apps.orders.models import Order
-        from django.db.models import Count, Sum
-        
-        # Общее количество клиентов
-        total_customers = User.objects.filter(
-            orders__created_at__date__lte=date,
-            orders__status='delivered'
-        ).distinct().count()
-        
-        # Новые клиенты (впервые заказали в этот день)
-        new_customers = User.objects.filter(
-            orders__created_at__date=date,
-            orders__status='delivered'
-        ).annotate(
-            first_order_date=models.Min('orders__created_at__date')
-        ).filter(first_order_date=date).count()
-        
-        # Постоянные клиенты (заказывали и раньше)
-        returning_customers = User.objects.filter(
-            orders__created_at__date=date,
-            orders__status='delivered'
-        ).annotate(
-            first_order_date=models.Min('orders__created_at__date')
-        ).exclude(first_order_date=date).count()
-        
-        # Средняя стоимость клиента
-        customer_revenue = User.objects.filter(
-            orders__created_at__date=date,
-            orders__status='delivered'
-        ).annotate(
-            daily_revenue=Sum('orders__total_amount')
-        ).aggregate(total=Sum('daily_revenue'))['total'] or 0
-        
-        active_customers = User.objects.filter(
-            orders__created_at__date=date,
-            orders__status='delivered'
-        ).count()
-        
-        average_customer_value = customer_revenue / active_customers if active_customers > 0 else 0
-        
-        # Создаем или обновляем статистику
-        stats, created = cls.objects.get_or_create(date=date)
-        stats.total_customers = total_customers
-        stats.new_customers = new_customers
-        stats.returning_customers = returning_customers
-        stats.average_customer_value = average_customer_value
-        stats.save()
-        
-        return stats
\ No newline at end of file
+        from django.db.models.functions import TruncDate
+
+        daily = {
+            row['day']: row
+            for row in Order.objects.filter(
+                status='delivered', created_at__range=_day_bounds(date_from, date_to)
+            )
+            .annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(active=Count('user_id', distinct=True), revenue=Sum('total_amount'))
+            .order_by()
+        }
+        first_orders = dict(
+            CustomerLifetime.objects.filter(first_order_date__lte=date_to)
+            .values('first_order_date')
+            .annotate(customers=Count('pk'))
+            .order_by()
+            .values_list('first_order_date', 'customers')
+        )
+        total_customers = sum(count for day, count in first_orders.items() if day < date_from)
+
+        stats = []
+        day = date_from
+        while day <= date_to:
+            new = first_orders.get(day, 0)
+            total_customers += new
+            row = daily.get(day)
+            active = row['active'] if row else 0
+            stats.append(cls(
+                date=day,
+                total_customers=total_customers,
+                new_customers=new,
+                returning_customers=max(active - new, 0),
+                average_customer_value=(row['revenue'] / active).quantize(Decimal('0.01')) if active else Decimal('0'),
+            ))
+            day += timedelta(days=1)
+
+        return cls.objects.bulk_create(
+            stats,
+            update_conflicts=True,
+            unique_fields=['date'],
+            update_fields=['total_customers', 'new_customers', 'returning_customers', 'average_customer_value'],
+        )
+
+
+class CustomerLifetime(models.Model):
+    """Итоги покупок клиента по доставленным заказам.
+
+    Поддерживается при смене статуса заказа (apply_order_delta), поэтому отчёты
+    и карточка пользователя не агрегируют заказы на каждый запрос.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='lifetime', verbose_name='Клиент'
+    )
+    first_order_date = models.DateField(null=True, db_index=True, verbose_name='Дата первого заказа')
+    last_order_date = models.DateField(null=True, verbose_name='Дата последнего заказа')
+    order_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name='Количество заказов')
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Сумма покупок')
+    average_order_value = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Средний чек')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Итоги клиента'
+        verbose_name_plural = 'Итоги клиентов'
+
+    def __str__(self):
+        return f"{self.user} — {self.order_count} заказов"
+
+    @classmethod
+    def apply_order_delta(cls, order, sign):
+        """Учесть (sign=1) или исключить (sign=-1) доставленный заказ в итогах клиента.
+
+        Добавление — один UPDATE с F-выражениями. Даты первого и последнего заказа
+        нельзя откатить дельтой, поэтому при исключении итоги клиента пересчитываются.
+        """
+        if sign < 0:
+            from backend.apps.orders.models import Order
+
+            # Заказ исключается явно: при удалении (pre_delete) он ещё в таблице
+            orders = Order.objects.filter(user_id=order.user_id, status='delivered').exclude(pk=order.pk)
+            return cls._rebuild_from(orders, cls.objects.filter(user_id=order.user_id))
+
+        # День в текущем часовом поясе, как у rebuild() (created_at__date)
+        date = timezone.localdate(order.created_at)
+        cls.objects.get_or_create(user_id=order.user_id)
+        order_count = F('order_count') + 1
+        total_spent = F('total_spent') + order.total_amount
+        cls.objects.filter(user_id=order.user_id).update(
+            first_order_date=Least(Coalesce('first_order_date', Value(date)), Value(date)),
+            last_order_date=Greatest(Coalesce('last_order_date', Value(date)), Value(date)),
+            order_count=order_count,
+            total_spent=total_spent,
+            average_order_value=ExpressionWrapper(
+                total_spent / order_count, output_field=models.DecimalField(max_digits=10, decimal_places=2)
+            ),
+            updated_at=timezone.now(),
+        )
+
+    @classmethod
+    def rebuild(cls, user_ids=None):
+        """Пересчитать итоги клиентов (всех или из user_ids) по заказам одним запросом"""
+        from backend.apps.orders.models import Order
+
+        orders = Order.objects.filter(status='delivered')
+        stale = cls.objects.all()
+        if user_ids is not None:
+            orders = orders.filter(user_id__in=user_ids)
+            stale = stale.filter(user_id__in=user_ids)
+        return cls._rebuild_from(orders, stale)
+
+    @classmethod
+    def _rebuild_from(cls, orders, stale):
+        """Записать итоги по доставленным заказам orders; записи stale без заказов удалить"""
+        rows = (
+            orders.values('user_id')
+            .annotate(
+                first=Min('created_at__date'),
+                last=Max('created_at__date'),
+                count=Count('pk'),
+                spent=Sum('total_amount'),
+            )
+            .order_by()
+        )
+        lifetimes = [
+            cls(
+                user_id=row['user_id'],
+                first_order_date=row['first'],
+                last_order_date=row['last'],
+                order_count=row['count'],
+                total_spent=row['spent'],
+                average_order_value=(row['spent'] / row['count']).quantize(Decimal('0.01')),
+                updated_at=timezone.now(),
+            )
+            for row in rows
+        ]
+        # Клиенты, у которых не осталось доставленных заказов
+        stale.exclude(user_id__in=orders.values('user_id')).delete()
+        return cls.objects.bulk_create(
+            lifetimes,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=[
+                'first_order_date', 'last_order_date', 'order_count', 'total_spent', 'average_order_value', 'updated_at',
+            ],
+        )
+
+
+class DashboardSnapshot(models.Model):
+    """Предрасчитанные показатели панелей администратора и менеджера.
+
+    Хранится одна запись; её пересчитывает периодическая задача
+    refresh_dashboard_snapshot (раз в DASHBOARD_SNAPSHOT_INTERVAL секунд) и кладёт
+    в кеш. Панели читают снимок из кеша или по первичному ключу, поэтому время
+    открытия страницы не зависит от числа заказов.
+    """
+    CACHE_KEY = 'analytics:dashboard-snapshot'
+
+    computed_at = models.DateTimeField(verbose_name='Рассчитан')
+    data = models.JSONField(encoder=DjangoJSONEncoder, verbose_name='Показатели')
+
+    class Meta:
+        verbose_name = 'Снимок панели управления'
+        verbose_name_plural = 'Снимки панели управления'
+
+    def __str__(self):
+        return f"Снимок панели на {self.computed_at:%d.%m.%Y %H:%M:%S}"
+
+    @classmethod
+    def current(cls):
+        """Последний снимок: из кеша, из таблицы или, если его ещё нет, рассчитанный сейчас"""
+        snapshot = cache.get(cls.CACHE_KEY)
+        if snapshot is None:
+            snapshot = cls.objects.filter(pk=1).first()
+            if snapshot is None:
+                return cls.refresh()
+            cache.set(cls.CACHE_KEY, snapshot, settings.DASHBOARD_SNAPSHOT_INTERVAL)
+        return snapshot
+
+    @classmethod
+    def refresh(cls):
+        """Пересчитать снимок, сохранить его в таблицу и в кеш"""
+        # Приводим к JSON сразу, чтобы в кеше были те же значения, что и в таблице (Decimal — строкой)
+        data = json.loads(json.dumps(cls.compute(), cls=DjangoJSONEncoder))
+        snapshot, _ = cls.objects.update_or_create(pk=1, defaults={'computed_at': timezone.now(), 'data': data})
+        cache.set(cls.CACHE_KEY, snapshot, settings.DASHBOARD_SNAPSHOT_INTERVAL)
+        return snapshot
+
+    @staticmethod
+    def compute():
+        """Рассчитать показатели обеих панелей"""
+        from backend.apps.orders.models import Order, OrderItem
+        from backend.apps.users.models import Profile
+
+        today = timezone.localdate()
+        today_start, _ = _day_bounds(today, today)
+        week_start, _ = _day_bounds(today - timedelta(days=7), today)
+        month_start, _ = _day_bounds(today.replace(day=1), today)
+        paid = Q(status__in=['delivered', 'shipped'])
+
+        # Счётчики заказов и выручка — одним запросом с условными агрегатами
+        orders = Order.objects.aggregate(
+            total_orders=Count('pk'),
+            orders_today=Count('pk', filter=Q(created_at__gte=today_start)),
+            orders_this_month=Count('pk', filter=Q(created_at__gte=month_start)),
+            week_orders=Count('pk', filter=Q(created_at__gte=week_start)),
+            total_revenue=Sum('total_amount'),
+            today_revenue=Sum('total_amount', filter=paid & Q(created_at__gte=today_start)),
+            week_revenue=Sum('total_amount', filter=paid & Q(created_at__gte=week_start)),
+        )
+        data = {key: value or 0 for key, value in orders.items()}
+        data['orders_by_status'] = dict(Order.objects.values_list('status').annotate(Count('pk')).order_by())
+
+        data['total_users'] = User.objects.count()
+        data.update(Profile.objects.aggregate(
+            active_users=Count('pk', filter=Q(is_blocked=False)),
+            blocked_users=Count('pk', filter=Q(is_blocked=True)),
+        ))
+        data['users_by_role'] = list(Profile.objects.values('role').annotate(count=Count('pk')).order_by('role'))
+
+        data['top_books'] = list(
+            OrderItem.objects.values('book_id', title=F('book__title'))
+            .annotate(total_sold=Sum('quantity'), revenue=Sum(F('price') * F('quantity')))
+            .order_by('-total_sold', 'book_id')[:5]
+        )
+        data['week_top_books'] = list(
+            OrderItem.objects.filter(order__created_at__gte=week_start)
+            .values('book_id', title=F('book__title'))
+            .annotate(week_orders=Count('order', distinct=True), week_quantity=Sum('quantity'))
+            .order_by('-week_orders', '-week_quantity', 'book_id')[:5]
+        )
+        # Сами последние заказы панели подгружают по первичным ключам, чтобы показать актуальный статус
+        data['recent_order_ids'] = list(Order.objects.order_by('-created_at').values_list('pk', flat=True)[:10])
+        return data
+
+
+class ExportJob(models.Model):
+    """Фоновая выгрузка отчёта (analytics.reports.REPORTS) в сжатый файл.
+
+    Создаётся запросом и выполняется задачей run_export_job; файл пишется в
+    MEDIA_ROOT/exports и отдаётся только через представление скачивания.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV (gzip)'),
+        ('parquet', 'Parquet'),
+    ]
+
+    report = models.CharField(max_length=50, verbose_name='Отчёт')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv', verbose_name='Формат')
+    params = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    rows_total = models.PositiveIntegerField(null=True, blank=True, verbose_name='Всего строк')
+    rows_written = models.PositiveIntegerField(default=0, verbose_name='Записано строк')
+    file = models.FileField(upload_to='exports/', blank=True, verbose_name='Файл')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_by = models.ForeignKey(
+        User, null=True, on_delete=models.SET_NULL, related_name='export_jobs', verbose_name='Создал'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Выгрузка'
+        verbose_name_plural = 'Выгрузки'
+
+    def __str__(self):
+        return f"Выгрузка #{self.pk} {self.report} ({self.status})"
+
+    @property
+    def report_title(self):
+        from .reports import REPORTS
+
+        report = REPORTS.get(self.report)
+        return report.title if report else self.report
+
+    @property
+    def progress(self):
+        """Процент выполнения или None, если число строк заранее неизвестно"""
+        if self.status == 'done':
+            return 100
+        if not self.rows_total:
+            return None
+        return min(99, self.rows_written * 100 // self.rows_total)
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'report': self.report,
+            'report_title': self.report_title,
+            'format': self.format,
+            'status': self.status,
+            'rows_total': self.rows_total,
+            'rows_written': self.rows_written,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
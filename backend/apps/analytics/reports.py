@@ -0,0 +1,164 @@
+"""Отчёты для выгрузки: строки CSV для потоковых ответов и фоновых выгрузок.
+
+Каждый отчёт из REPORTS — генератор строк (первая строка — заголовок), который
+читает БД пачками, поэтому один и тот же отчёт можно отдать
+StreamingHttpResponse (core.csv_export) или записать в файл задачей run_export_job
+(core.file_export).
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from backend.apps.catalog.exporter import BOOKS_TYPES, books_queryset, books_rows
+from backend.apps.core.file_export import write_csv_gz, write_parquet
+
+from .models import CustomerLifetime, TopSellingBook
+
+# Сколько строк читать из БД за один раз
+CHUNK_SIZE = 2000
+
+TOP_BOOKS_HEADER = ['Позиция', 'Название книги', 'ISBN', 'Категория', 'Цена', 'Количество заказов', 'Общее количество проданных', 'Общая выручка']
+USER_ACTIVITY_HEADER = ['Позиция', 'Имя пользователя', 'Email', 'Имя', 'Фамилия', 'Количество заказов', 'Общая сумма покупок', 'Средний чек', 'Дата регистрации']
+SALES_HEADER = ['order_id', 'book_id', 'book_title', 'price', 'quantity', 'created_at']
+# Типы колонок для Parquet (см. core.file_export.write_parquet)
+TOP_BOOKS_TYPES = ['int', 'str', 'str', 'str', 'decimal', 'int', 'int', 'decimal']
+USER_ACTIVITY_TYPES = ['int', 'str', 'str', 'str', 'str', 'int', 'decimal', 'decimal', 'str']
+SALES_TYPES = ['int', 'int', 'str', 'decimal', 'int', 'str']
+
+
+def top_books(limit=10, order_by=('-total_orders', '-total_quantity')):
+    """Книги с наибольшим числом доставленных заказов.
+
+    Берутся из дневного топа TopSellingBook. Если в нём хранятся только первые
+    ANALYTICS_TOP_BOOKS_LIMIT книг дня, суммы по нему занижены для книг, которые
+    попадали в топ не каждый день, поэтому тогда итоги считаются по позициям заказов.
+    """
+    if settings.ANALYTICS_TOP_BOOKS_LIMIT:
+        from backend.apps.orders.models import OrderItem
+
+        return OrderItem.objects.filter(order__status='delivered').values(
+            'book_id', 'book__title', 'book__isbn', 'book__category__name', 'book__price'
+        ).annotate(
+            total_orders=Count('order_id', distinct=True),
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('price') * F('quantity'))
+        ).order_by(*order_by, 'book_id')[:limit]
+    return TopSellingBook.objects.values(
+        'book_id', 'book__title', 'book__isbn', 'book__category__name', 'book__price'
+    ).annotate(
+        total_orders=Sum('orders_count'),
+        total_quantity=Sum('quantity_sold'),
+        total_revenue=Sum('revenue')
+    ).order_by(*order_by, 'book_id')[:limit]
+
+
+def top_customers(limit=20):
+    """Клиенты с наибольшим числом доставленных заказов (из CustomerLifetime)"""
+    return CustomerLifetime.objects.select_related('user', 'user__profile').filter(order_count__gt=0).order_by('-order_count')[:limit]
+
+
+def top_books_rows():
+    """Строки CSV топ-10 книг"""
+    yield TOP_BOOKS_HEADER
+    for i, book in enumerate(top_books(), 1):
+        yield [
+            i,
+            book['book__title'],
+            book['book__isbn'],
+            book['book__category__name'],
+            book['book__price'],
+            book['total_orders'],
+            book['total_quantity'],
+            book['total_revenue']
+        ]
+
+
+def user_activity_rows():
+    """Строки CSV активности пользователей"""
+    yield USER_ACTIVITY_HEADER
+    rows = top_customers().values_list(
+        'user__username', 'user__email', 'user__first_name', 'user__last_name',
+        'order_count', 'total_spent', 'average_order_value', 'user__date_joined'
+    )
+    for i, (username, email, first_name, last_name, order_count, total_spent, average, date_joined) in enumerate(rows, 1):
+        yield [
+            i,
+            username,
+            email or '',
+            first_name or '',
+            last_name or '',
+            order_count,
+            total_spent,
+            average,
+            date_joined.strftime('%d.%m.%Y %H:%M')
+        ]
+
+
+def combined_rows(created_at=None):
+    """Строки CSV комбинированного отчета"""
+    created_at = created_at or datetime.now()
+    # Заголовок отчета
+    yield ['КОМБИНИРОВАННЫЙ ОТЧЕТ']
+    yield [f'Дата создания: {created_at.strftime("%d.%m.%Y %H:%M")}']
+    yield []
+
+    # Топ-10 книг
+    yield ['ТОП-10 КНИГ ПО ПРОДАЖАМ']
+    yield from top_books_rows()
+    yield []
+
+    # Активность пользователей
+    yield ['АКТИВНОСТЬ ПОЛЬЗОВАТЕЛЕЙ']
+    yield from user_activity_rows()
+
+
+def sales_queryset(start=None, end=None):
+    """Позиции заказов за период [start, end] (datetime или ISO-строки)"""
+    from backend.apps.orders.models import OrderItem
+
+    if isinstance(start, str):
+        start = parse_datetime(start)
+    if isinstance(end, str):
+        end = parse_datetime(end)
+    # Период из формы (datetime-local) приходит без часового пояса
+    start, end = (timezone.make_aware(d) if d and timezone.is_naive(d) else d for d in (start, end))
+    qs = OrderItem.objects.all()
+    if start:
+        qs = qs.filter(order__created_at__gte=start)
+    if end:
+        qs = qs.filter(order__created_at__lte=end)
+    return qs
+
+
+def sales_rows(start=None, end=None):
+    """Строки CSV по позициям заказов; читаются из БД пачками, а не целиком"""
+    yield SALES_HEADER
+    rows = sales_queryset(start, end).values_list(
+        'order_id', 'book_id', 'book__title', 'price', 'quantity', 'order__created_at'
+    ).order_by('pk').iterator(chunk_size=CHUNK_SIZE)
+    for order_id, book_id, title, price, quantity, created_at in rows:
+        yield [order_id, book_id, title, price, quantity, created_at.isoformat()]
+
+
+# rows — генератор строк, count — число строк данных (для прогресса) или None,
+# types — типы колонок для Parquet; None у отчётов, которые не одна таблица с заголовком
+# (их нельзя выгрузить в Parquet)
+Report = namedtuple('Report', ['title', 'filename', 'rows', 'count', 'types'])
+
+REPORTS = {
+    'top_books': Report('Топ-10 книг', 'top_books_report', top_books_rows, None, TOP_BOOKS_TYPES),
+    'user_activity': Report('Активность пользователей', 'user_activity_report', user_activity_rows, None, USER_ACTIVITY_TYPES),
+    'combined': Report('Комбинированный отчет', 'combined_report', combined_rows, None, None),
+    'sales': Report('Продажи', 'sales', sales_rows, lambda **params: sales_queryset(**params).count(), SALES_TYPES),
+    'books': Report('Каталог книг', 'books_export', books_rows, lambda: books_queryset().count(), BOOKS_TYPES),
+}
+
+
+WRITERS = {
+    'csv': (write_csv_gz, 'csv.gz'),
+    'parquet': (write_parquet, 'parquet'),
+}
@@ -0,0 +1,162 @@
+"""Фоновый пересчёт дневной аналитики.
+
+Сохранение доставленного заказа обновляет в запросе только SalesStats (дельтой,
+см. SalesStats.apply_order_delta); топ книг и статистика клиентов за его день
+пересчитываются задачей, поставленной в очередь (schedule_daily_rollup). Постановка
+дедуплицируется по дате через cache.add: пока пересчёт дня ждёт своей очереди
+(ANALYTICS_ROLLUP_DELAY секунд), новые доставки того же дня ничего не ставят,
+поэтому пачка из сотен доставок даёт один пересчёт. Задача снимает отметку
+перед расчётом, так что заказы, доставленные во время расчёта, поставят
+следующий пересчёт и не потеряются.
+
+Снимок показателей панелей управления (DashboardSnapshot) пересчитывается
+периодически задачей refresh_dashboard_snapshot по расписанию CELERY_BEAT_SCHEDULE.
+
+Выгрузки отчётов в файл (ExportJob) выполняет run_export_job: файл пишется
+во временный и переименовывается по готовности, прогресс сохраняется в задании.
+Задания, оставшиеся «выполняющимися» дольше EXPORT_JOB_TIMEOUT (воркер упал
+или был перезапущен), purge_export_jobs отмечает ошибкой и удаляет их временные файлы.
+"""
+import functools
+import logging
+import os
+from datetime import date as date_cls, timedelta
+from pathlib import Path
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _pending_key(date):
+    return f"analytics:rollup:{date.isoformat()}"
+
+
+def schedule_daily_rollup(date):
+    """Поставить пересчёт статистики за date в очередь, если он ещё не ожидает выполнения.
+
+    Возвращает True, если задача поставлена.
+    """
+    delay = settings.ANALYTICS_ROLLUP_DELAY
+    # Запас к таймауту: если задача потеряется, отметка истечёт и день пересчитается снова
+    if not cache.add(_pending_key(date), 1, timeout=delay + 300):
+        return False
+    try:
+        rollup_daily_stats.apply_async(args=[date.isoformat()], countdown=delay)
+    except Exception:
+        cache.delete(_pending_key(date))
+        logger.exception("Не удалось поставить пересчёт статистики за %s", date)
+        return False
+    return True
+
+
+@shared_task(ignore_result=True)
+def rollup_daily_stats(date):
+    """Пересчитать TopSellingBook и CustomerStats за день (date — ISO-строка)"""
+    from .models import CustomerStats, TopSellingBook
+
+    date = date_cls.fromisoformat(date)
+    cache.delete(_pending_key(date))
+    TopSellingBook.update_daily_top_books(date)
+    CustomerStats.update_daily_customer_stats(date)
+
+
+@shared_task(ignore_result=True)
+def refresh_dashboard_snapshot():
+    """Пересчитать снимок показателей панелей управления"""
+    from .models import DashboardSnapshot
+
+    DashboardSnapshot.refresh()
+
+
+def enqueue_export_job(job):
+    """Поставить выгрузку в очередь; если брокер недоступен, отметить её ошибкой"""
+    try:
+        run_export_job.delay(job.pk)
+    except Exception as e:
+        logger.exception("Не удалось поставить выгрузку #%s в очередь", job.pk)
+        job.status = 'failed'
+        job.error = f'Не удалось поставить в очередь: {e}'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def _export_paths(job):
+    """Имя файла выгрузки в MEDIA_ROOT, его полный путь и путь временного файла"""
+    from .reports import REPORTS, WRITERS
+
+    name = f'exports/{REPORTS[job.report].filename}_{job.pk}.{WRITERS[job.format][1]}'
+    path = Path(settings.MEDIA_ROOT) / name
+    return name, path, path.with_name(path.name + '.part')
+
+
+@shared_task(ignore_result=True, time_limit=settings.EXPORT_JOB_TIMEOUT)
+def run_export_job(job_id):
+    """Выполнить выгрузку ExportJob в файл MEDIA_ROOT/exports"""
+    from .models import ExportJob
+    from .reports import REPORTS, WRITERS
+
+    updated = ExportJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=timezone.now())
+    if not updated:
+        # Уже выполняется или выполнена (повторная доставка задачи)
+        return
+    job = ExportJob.objects.get(pk=job_id)
+    report = REPORTS[job.report]
+    write, _ = WRITERS[job.format]
+    if job.format == 'parquet':
+        write = functools.partial(write, types=report.types)
+    name, path, partial = _export_paths(job)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if report.count:
+            job.rows_total = report.count(**job.params)
+            job.save(update_fields=['rows_total'])
+
+        def progress(rows):
+            ExportJob.objects.filter(pk=job.pk).update(rows_written=rows)
+
+        job.rows_written = write(report.rows(**job.params), partial, progress)
+        os.replace(partial, path)
+    except Exception as e:
+        logger.exception("Выгрузка #%s завершилась ошибкой", job.pk)
+        partial.unlink(missing_ok=True)
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return
+
+    job.file.name = name
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'status', 'rows_written', 'finished_at'])
+
+
+@shared_task(ignore_result=True)
+def purge_export_jobs():
+    """Отметить ошибкой зависшие выгрузки и удалить выгрузки и их файлы старше EXPORT_FILE_TTL"""
+    from .models import ExportJob
+
+    stale = ExportJob.objects.filter(
+        status='running', started_at__lt=timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+    )
+    for job in stale.iterator():
+        # Условие на статус: задание могло завершиться, пока шёл этот цикл
+        failed = ExportJob.objects.filter(pk=job.pk, status='running').update(
+            status='failed',
+            error='Выгрузка прервана: обработчик не завершил её за отведённое время',
+            finished_at=timezone.now(),
+        )
+        if failed:
+            _export_paths(job)[2].unlink(missing_ok=True)
+
+    cutoff = timezone.now() - timedelta(seconds=settings.EXPORT_FILE_TTL)
+    jobs = ExportJob.objects.filter(created_at__lt=cutoff).exclude(status__in=['pending', 'running'])
+    for job in jobs.iterator():
+        if job.file:
+            job.file.delete(save=False)
+    deleted, _ = jobs.delete()
+    return deleted
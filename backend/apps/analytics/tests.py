@@ -0,0 +1,724 @@
+import gzip
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APIClient
+from backend.apps.analytics.models import (
+    SalesStats, TopSellingBook, CustomerStats, CustomerLifetime, DashboardSnapshot, ExportJob
+)
+from backend.apps.analytics.tasks import purge_export_jobs, rollup_daily_stats, run_export_job
+from backend.apps.catalog.models import Category, Book
+from backend.apps.orders.models import Order, OrderItem
+
+User = get_user_model()
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'analytics-tests'}}
+
+
+class AnalyticsTestCase(TestCase):
+    """Общие данные для тестов аналитики"""
+
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", password="testpass")
+        self.category = Category.objects.create(name="Художественная литература", slug="fiction")
+        self.book = Book.objects.create(
+            title="Тестовая книга",
+            isbn="978-5-17-123456-7",
+            category=self.category,
+            price=Decimal("100")
+        )
+
+    def _order(self, status="processing", quantity=1, user=None):
+        order = Order.objects.create(
+            user=user or self.user, status=status, total_amount=self.book.price * quantity
+        )
+        OrderItem.objects.create(order=order, book=self.book, price=self.book.price, quantity=quantity)
+        return order
+
+    def _delivered_on(self, user, day, amount):
+        order = Order.objects.create(user=user, total_amount=Decimal(amount))
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime.combine(day, time(12))))
+        order = Order.objects.get(pk=order.pk)
+        order.status = "delivered"
+        order.save()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TestAnalyticsRollupScheduling(AnalyticsTestCase):
+    """Тесты постановки пересчёта статистики в очередь"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_deliveries_of_one_day_are_coalesced(self):
+        """Тест, что пачка доставок за день ставит один пересчёт и не считает статистику в запросе"""
+        orders = [self._order() for _ in range(5)]
+        with mock.patch.object(rollup_daily_stats, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                for order in orders:
+                    order.status = "delivered"
+                    order.save()
+
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs["args"], [orders[0].created_at.date().isoformat()])
+        self.assertFalse(TopSellingBook.objects.exists())
+
+    def test_only_delivery_status_changes_schedule_rollup(self):
+        """Тест, что пересчёт ставится только при переходе в статус «доставлен» и из него"""
+        order = self._order()
+        with mock.patch.object(rollup_daily_stats, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                order.status = "shipped"
+                order.save()
+            apply_async.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Order.objects.filter(pk=order.pk).update(status="delivered")
+                order = Order.objects.get(pk=order.pk)
+                order.notes = "Позвонить заранее"
+                order.save()
+            apply_async.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                order.status = "cancelled"
+                order.save()
+            apply_async.assert_called_once()
+
+
+class TestRollupDailyStats(AnalyticsTestCase):
+    """Тесты задачи пересчёта дневной статистики"""
+
+    def test_rollup_updates_daily_stats(self):
+        """Тест пересчёта топа книг и статистики клиентов за день"""
+        first = self._order(status="delivered", quantity=2)
+        self._order(status="delivered", quantity=1)
+        self._order(status="processing", quantity=5)
+        date = first.created_at.date()
+
+        rollup_daily_stats(date.isoformat())
+
+        self.assertEqual(TopSellingBook.objects.get(date=date).quantity_sold, 3)
+        self.assertEqual(CustomerStats.objects.get(date=date).total_customers, 1)
+
+
+class TestIncrementalSalesStats(AnalyticsTestCase):
+    """Тесты инкрементального обновления SalesStats"""
+
+    def _deliver(self, order):
+        order.status = "delivered"
+        order.save()
+
+    def _stats(self, order):
+        return SalesStats.objects.get(date=timezone.localdate(order.created_at))
+
+    def test_delivery_applies_delta(self):
+        """Тест, что доставка и отмена заказа меняют статистику дня на величину заказа"""
+        first = self._order(quantity=2)
+        second = self._order(quantity=1)
+        self._deliver(first)
+        self._deliver(second)
+
+        stats = self._stats(first)
+        self.assertEqual(stats.total_orders, 2)
+        self.assertEqual(stats.total_revenue, Decimal("300"))
+        self.assertEqual(stats.total_books_sold, 3)
+        self.assertEqual(stats.average_order_value, Decimal("150"))
+
+        first.status = "cancelled"
+        first.save()
+        stats = self._stats(first)
+        self.assertEqual(stats.total_orders, 1)
+        self.assertEqual(stats.total_revenue, Decimal("100"))
+        self.assertEqual(stats.total_books_sold, 1)
+        self.assertEqual(stats.average_order_value, Decimal("100"))
+
+        second.delete()
+        stats = self._stats(first)
+        self.assertEqual((stats.total_orders, stats.total_revenue, stats.average_order_value), (0, 0, 0))
+
+    @override_settings(TIME_ZONE="Europe/Moscow")
+    def test_delta_uses_local_day(self):
+        """Тест, что заказ сразу после местной полуночи попадает в тот же день, что и при пересчёте"""
+        day = date(2024, 3, 2)
+        order = self._order(quantity=2)
+        # 00:30 по Москве — ещё 1 марта по UTC
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime.combine(day, time(0, 30))))
+        order = Order.objects.get(pk=order.pk)
+        self._deliver(order)
+        self.assertEqual(list(SalesStats.objects.values_list("date", "total_orders")), [(day, 1)])
+
+        SalesStats.objects.all().delete()
+        SalesStats.update_daily_stats(day)
+        self.assertEqual(list(SalesStats.objects.values_list("date", "total_orders")), [(day, 1)])
+
+    def test_delta_costs_constant_queries(self):
+        """Тест, что обновление статистики не зависит от числа заказов за день"""
+        for _ in range(5):
+            self._deliver(self._order())
+        order = self._order(quantity=3)
+        # UPDATE заказа, сумма позиций, get_or_create и UPDATE для SalesStats и для CustomerLifetime
+        with self.assertNumQueries(6):
+            self._deliver(order)
+
+    def test_rebuild_matches_deltas(self):
+        """Тест, что полный пересчёт совпадает с инкрементальной статистикой и исправляет расхождения"""
+        for quantity in (1, 2, 3):
+            self._deliver(self._order(quantity=quantity))
+        order = Order.objects.first()
+        expected = SalesStats.objects.values("total_orders", "total_revenue", "total_books_sold").get()
+
+        SalesStats.objects.update(total_orders=0, total_revenue=0, total_books_sold=0)
+        day = order.created_at.date()
+        call_command(
+            "rebuild_analytics", "--from", (day - timedelta(days=2)).isoformat(), "--to", day.isoformat(),
+            "--chunk-days", "2", stdout=StringIO()
+        )
+        self.assertEqual(
+            SalesStats.objects.values("total_orders", "total_revenue", "total_books_sold").get(date=day), expected
+        )
+        self.assertEqual(SalesStats.objects.filter(total_orders=0).count(), 2)
+        self.assertEqual(CustomerStats.objects.count(), 3)
+        self.assertEqual(TopSellingBook.objects.get(date=day).quantity_sold, 6)
+
+
+class TestCustomerStats(AnalyticsTestCase):
+    """Тесты статистики клиентов"""
+
+    def test_range_computes_new_returning_and_totals(self):
+        """Тест новых, постоянных и всех клиентов по дням периода, включая дни без заказов"""
+        other = User.objects.create_user(username="other", password="testpass")
+        day = date(2024, 3, 1)
+        self._delivered_on(self.user, day, "100")
+        self._delivered_on(self.user, day + timedelta(days=2), "200")
+        # Два заказа одного клиента за день — один активный клиент
+        self._delivered_on(other, day + timedelta(days=2), "50")
+        self._delivered_on(other, day + timedelta(days=2), "50")
+
+        # Заказы периода по дням, даты первых покупок, запись статистики
+        with self.assertNumQueries(3):
+            CustomerStats.update_customer_stats_range(day + timedelta(days=1), day + timedelta(days=3))
+
+        stats = {
+            s.date: (s.total_customers, s.new_customers, s.returning_customers, s.average_customer_value)
+            for s in CustomerStats.objects.all()
+        }
+        self.assertEqual(stats, {
+            day + timedelta(days=1): (1, 0, 0, Decimal("0")),
+            day + timedelta(days=2): (2, 1, 1, Decimal("150")),
+            day + timedelta(days=3): (2, 0, 0, Decimal("0")),
+        })
+
+    def test_daily_update_overwrites_existing_row(self):
+        """Тест, что пересчёт дня обновляет существующую запись"""
+        day = date(2024, 3, 1)
+        CustomerStats.objects.create(date=day, total_customers=10)
+        self._delivered_on(self.user, day, "100")
+
+        CustomerStats.update_daily_customer_stats(day)
+
+        stats = CustomerStats.objects.get(date=day)
+        self.assertEqual((stats.total_customers, stats.new_customers), (1, 1))
+
+
+class TestCustomerLifetime(AnalyticsTestCase):
+    """Тесты итогов клиентов"""
+
+    def test_lifetime_follows_status_changes(self):
+        """Тест поддержки итогов клиента при доставке и отмене заказов"""
+        day = date(2024, 3, 1)
+        self._delivered_on(self.user, day + timedelta(days=5), "300")
+        self._delivered_on(self.user, day, "100")
+        self._order(status="processing")
+
+        lifetime = CustomerLifetime.objects.get(user=self.user)
+        self.assertEqual(
+            (lifetime.first_order_date, lifetime.last_order_date, lifetime.order_count, lifetime.total_spent),
+            (day, day + timedelta(days=5), 2, Decimal("400"))
+        )
+        self.assertEqual(lifetime.average_order_value, Decimal("200"))
+
+        last = Order.objects.filter(user=self.user, status="delivered").order_by("-created_at").first()
+        last.status = "cancelled"
+        last.save()
+        lifetime.refresh_from_db()
+        self.assertEqual(
+            (lifetime.first_order_date, lifetime.last_order_date, lifetime.order_count, lifetime.average_order_value),
+            (day, day, 1, Decimal("100"))
+        )
+
+        Order.objects.filter(user=self.user, status="delivered").delete()
+        self.assertFalse(CustomerLifetime.objects.exists())
+
+    def test_rebuild_matches_incremental_totals(self):
+        """Тест, что полный пересчёт совпадает с инкрементальными итогами"""
+        self._delivered_on(self.user, date(2024, 3, 1), "100")
+        self._delivered_on(self.user, date(2024, 3, 4), "250")
+        expected = list(CustomerLifetime.objects.values())
+        CustomerLifetime.objects.all().delete()
+
+        CustomerLifetime.rebuild()
+        self.assertEqual(
+            [dict(row, updated_at=None) for row in CustomerLifetime.objects.values()],
+            [dict(row, updated_at=None) for row in expected]
+        )
+
+    @override_settings(TIME_ZONE="Europe/Moscow")
+    def test_delta_uses_local_day(self):
+        """Тест, что даты заказов клиента после местной полуночи совпадают с пересчётом"""
+        day = date(2024, 3, 2)
+        order = self._order()
+        # 00:30 по Москве — ещё 1 марта по UTC
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime.combine(day, time(0, 30))))
+        order = Order.objects.get(pk=order.pk)
+        order.status = "delivered"
+        order.save()
+        self.assertEqual(
+            CustomerLifetime.objects.values_list("first_order_date", "last_order_date").get(), (day, day)
+        )
+
+        CustomerLifetime.rebuild()
+        self.assertEqual(
+            CustomerLifetime.objects.values_list("first_order_date", "last_order_date").get(), (day, day)
+        )
+
+    def test_admin_pages_read_lifetime(self):
+        """Тест, что карточка пользователя и отчёт по активности в админке берут итоги из CustomerLifetime"""
+        from backend.apps.users.models import Profile
+
+        admin = User.objects.create_user(username="admin", password="testpass")
+        Profile.objects.create(user=admin, role="admin")
+        self._delivered_on(self.user, date(2024, 3, 1), "100")
+        self._order(status="processing")
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse("admin-user-detail", args=[self.user.id]))
+        self.assertEqual(response.context["total_orders"], 1)
+        self.assertEqual(response.context["total_spent"], Decimal("100"))
+
+        response = self.client.get(reverse("admin-reports-user-activity"))
+        self.assertContains(response, self.user.username)
+
+
+class TestTopSellingBooks(AnalyticsTestCase):
+    """Тесты дневного топа книг"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_book = Book.objects.create(
+            title="Другая книга", isbn="978-5-17-765432-1", category=self.category, price=Decimal("250")
+        )
+        self.day = date(2024, 3, 1)
+
+    def _sell(self, book, quantity, day):
+        order = Order.objects.create(user=self.user, status="delivered", total_amount=book.price * quantity)
+        OrderItem.objects.create(order=order, book=book, price=book.price, quantity=quantity)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime.combine(day, time(12))))
+
+    def test_range_ranks_books_per_day(self):
+        """Тест мест, количества и выручки (цена × количество) по дням периода одним запросом"""
+        self._sell(self.book, 3, self.day)
+        self._sell(self.other_book, 2, self.day)
+        self._sell(self.other_book, 2, self.day)
+        self._sell(self.book, 1, self.day + timedelta(days=1))
+
+        # SAVEPOINT, удаление старых строк периода, INSERT ... SELECT, RELEASE
+        with self.assertNumQueries(4):
+            written = TopSellingBook.update_top_books_range(self.day, self.day + timedelta(days=1))
+
+        self.assertEqual(written, 3)
+        rows = list(TopSellingBook.objects.order_by("date", "rank").values_list(
+            "date", "book_id", "rank", "quantity_sold", "revenue", "orders_count"
+        ))
+        self.assertEqual(rows, [
+            (self.day, self.other_book.id, 1, 4, Decimal("1000"), 2),
+            (self.day, self.book.id, 2, 3, Decimal("300"), 1),
+            (self.day + timedelta(days=1), self.book.id, 1, 1, Decimal("100"), 1),
+        ])
+
+    def test_top_count_limits_books_per_day(self):
+        """Тест ограничения топа и пересчёта дня поверх старых строк"""
+        self._sell(self.book, 3, self.day)
+        self._sell(self.other_book, 1, self.day)
+        TopSellingBook.update_daily_top_books(self.day)
+
+        TopSellingBook.update_daily_top_books(self.day, top_count=1)
+        self.assertEqual(list(TopSellingBook.objects.values_list("book_id", flat=True)), [self.book.id])
+
+    def test_top_books_report_reads_table(self):
+        """Тест, что отчёт по книгам в админке строится по TopSellingBook"""
+        from backend.apps.users.models import Profile
+
+        admin = User.objects.create_user(username="admin", password="testpass")
+        Profile.objects.create(user=admin, role="admin")
+        self._sell(self.book, 3, self.day)
+        TopSellingBook.update_daily_top_books(self.day)
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse("admin-reports-export"), {"type": "top_books"})
+        row = b"".join(response.streaming_content).decode("utf-8-sig").splitlines()[1].split(",")
+        self.assertEqual(row[1:7], ["Тестовая книга", "978-5-17-123456-7", "Художественная литература", "100.00", "1", "3"])
+        self.assertEqual(Decimal(row[7]), Decimal("300"))
+
+        response = self.client.get(reverse("admin-reports-top-books"))
+        self.assertEqual([book["total_quantity"] for book in response.context["top_books"]], [3])
+
+
+    def test_report_falls_back_to_order_items_with_top_limit(self):
+        """Тест, что при ограниченном дневном топе отчёт не теряет продаж вне топа"""
+        from backend.apps.analytics.reports import top_books
+
+        # Другая книга каждый день вторая, но в сумме за два дня продаётся больше
+        self._sell(self.book, 3, self.day)
+        self._sell(self.other_book, 2, self.day)
+        self._sell(self.other_book, 2, self.day + timedelta(days=1))
+        self._sell(self.other_book, 2, self.day + timedelta(days=1))
+        self._sell(self.book, 5, self.day + timedelta(days=1))
+        TopSellingBook.update_top_books_range(self.day, self.day + timedelta(days=1), top_count=1)
+
+        with override_settings(ANALYTICS_TOP_BOOKS_LIMIT=1):
+            rows = [(row["book_id"], row["total_orders"], row["total_quantity"]) for row in top_books()]
+        self.assertEqual(rows, [(self.other_book.id, 3, 6), (self.book.id, 2, 8)])
+
+    def test_migration_backfills_existing_rows(self):
+        """Тест, что миграция 0004 пересчитывает заказы и выручку уже сохранённых строк топа"""
+        from importlib import import_module
+        from django.apps import apps
+
+        migration = import_module("backend.apps.analytics.migrations.0004_topsellingbook_orders_count")
+        self._sell(self.book, 3, self.day)
+        self._sell(self.book, 1, self.day)
+        # Строка, посчитанная до миграции: выручка — сумма цен, заказов 0
+        TopSellingBook.objects.create(
+            date=self.day, book=self.book, quantity_sold=4, revenue=Decimal("200"), orders_count=0, rank=1
+        )
+
+        migration.backfill_top_books(apps, None)
+        top = TopSellingBook.objects.get()
+        self.assertEqual((top.quantity_sold, top.revenue, top.orders_count, top.rank), (4, Decimal("400"), 2, 1))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TestDashboardSnapshot(AnalyticsTestCase):
+    """Тесты снимка показателей панелей управления"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        from backend.apps.users.models import Profile
+
+        cache.clear()
+        self.manager = User.objects.create_user(username="manager", password="testpass")
+        Profile.objects.create(user=self.manager, role="manager")
+        Profile.objects.create(user=self.user, role="buyer", is_blocked=True)
+
+    def test_refresh_computes_dashboard_data(self):
+        """Тест расчёта показателей и сохранения снимка в таблицу"""
+        self._order(status="processing", quantity=2)
+        delivered = self._order(status="delivered")
+        self._order(status="cancelled")
+
+        data = DashboardSnapshot.refresh().data
+        self.assertEqual(data["total_orders"], 3)
+        self.assertEqual(data["orders_today"], 3)
+        self.assertEqual(data["orders_by_status"], {"processing": 1, "delivered": 1, "cancelled": 1})
+        self.assertEqual(Decimal(data["total_revenue"]), Decimal("400"))
+        self.assertEqual(Decimal(data["today_revenue"]), Decimal("100"))
+        self.assertEqual((data["total_users"], data["active_users"], data["blocked_users"]), (2, 1, 1))
+        self.assertEqual(data["top_books"][0]["total_sold"], 4)
+        self.assertEqual(data["week_top_books"][0]["week_orders"], 3)
+        self.assertEqual(data["recent_order_ids"][1], delivered.pk)
+        self.assertEqual(DashboardSnapshot.objects.get().data, data)
+
+    def test_dashboard_reads_snapshot_until_refresh(self):
+        """Тест, что панель показывает снимок и пересчитывает его только по запросу"""
+        self._order(status="processing")
+        self.client.force_login(self.manager)
+
+        response = self.client.get(reverse("manager-dashboard"))
+        self.assertEqual(response.context["processing_orders"], 1)
+        self.assertContains(response, "Данные на")
+
+        self._order(status="processing")
+        response = self.client.get(reverse("manager-dashboard"))
+        self.assertEqual(response.context["processing_orders"], 1)
+
+        response = self.client.get(reverse("manager-dashboard"), {"refresh": 1})
+        self.assertRedirects(response, reverse("manager-dashboard"))
+        response = self.client.get(reverse("manager-dashboard"))
+        self.assertEqual(response.context["processing_orders"], 2)
+
+    def test_dashboard_falls_back_to_table(self):
+        """Тест чтения снимка из таблицы, когда в кеше его нет"""
+        from django.core.cache import cache
+
+        self._order(status="delivered")
+        saved = DashboardSnapshot.refresh()
+        cache.clear()
+        self._order(status="delivered")
+
+        with self.assertNumQueries(1):
+            snapshot = DashboardSnapshot.current()
+        self.assertEqual(snapshot.computed_at, saved.computed_at)
+        self.assertEqual(snapshot.data["total_orders"], 1)
+
+    def test_dashboard_queries_do_not_grow_with_orders(self):
+        """Тест, что число запросов панели не зависит от числа заказов"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_login(self.manager)
+        self._order()
+        DashboardSnapshot.refresh()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("manager-dashboard"))
+
+        for _ in range(5):
+            self._order()
+        DashboardSnapshot.refresh()
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse("manager-dashboard"))
+        self.assertEqual(len(few), len(many))
+
+
+class TestStreamingExports(AnalyticsTestCase):
+    """Тесты потоковых CSV-выгрузок"""
+
+    def _sell_items(self, count):
+        orders = Order.objects.bulk_create(
+            [Order(user=self.user, total_amount=Decimal("100")) for _ in range(count // 100)]
+        )
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, book=self.book, price=Decimal("100"), quantity=1) for order in orders for _ in range(100)],
+            batch_size=5000
+        )
+
+    def _export_sales(self, client):
+        """Выгрузить продажи в CSV; возвращает (строк, байт, пик памяти при чтении ответа)"""
+        import tracemalloc
+
+        response = client.get(reverse("analytics-sales"), {"export": "csv"})
+        self.assertTrue(response.streaming)
+        size = lines = 0
+        tracemalloc.start()
+        try:
+            for chunk in response.streaming_content:
+                size += len(chunk)
+                lines += chunk.count(b"\n")
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return lines, size, peak
+
+    def test_sales_export_streams_with_bounded_memory(self):
+        """Тест, что выгрузка продаж отдаётся потоком и память не растёт с числом строк"""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="staff", password="testpass", is_staff=True))
+
+        self._sell_items(10_000)
+        lines, _, small_peak = self._export_sales(client)
+        self.assertEqual(lines, 10_000 + 1)
+
+        self._sell_items(30_000)
+        lines, size, peak = self._export_sales(client)
+        self.assertEqual(lines, 40_000 + 1)
+        # Вчетверо больше строк — почти та же память; буферизованный ответ держал бы весь CSV
+        self.assertLess(peak, small_peak * 1.5)
+        self.assertLess(peak, size / 2)
+
+    def test_admin_exports_stream_csv(self):
+        """Тест потоковых выгрузок отчетов в админке"""
+        from backend.apps.users.models import Profile
+
+        admin = User.objects.create_user(username="admin", password="testpass")
+        Profile.objects.create(user=admin, role="admin")
+        self._delivered_on(self.user, date(2024, 3, 1), "250")
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse("admin-reports-export"), {"type": "user_activity"})
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+        self.assertEqual(content[1].split(",")[:2], ["1", "buyer"])
+        self.assertEqual(Decimal(content[1].split(",")[6]), Decimal("250"))
+
+        response = self.client.get(reverse("admin-reports-export"), {"type": "combined"})
+        content = b"".join(response.streaming_content).decode("utf-8-sig")
+        self.assertIn("АКТИВНОСТЬ ПОЛЬЗОВАТЕЛЕЙ", content)
+        self.assertIn("buyer", content)
+
+
+class TestExportJobs(AnalyticsTestCase):
+    """Тесты фоновых выгрузок отчетов"""
+
+    def setUp(self):
+        super().setUp()
+        from backend.apps.users.models import Profile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, EXPORT_ACCEL_REDIRECT='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(username="admin", password="testpass")
+        Profile.objects.create(user=self.admin, role="admin")
+        self.client.force_login(self.admin)
+
+    def test_job_writes_gzipped_csv(self):
+        """Тест выгрузки продаж в сжатый CSV с подсчётом строк"""
+        for quantity in (1, 2, 3):
+            self._order(quantity=quantity)
+        job = ExportJob.objects.create(report="sales", created_by=self.admin)
+
+        with mock.patch("backend.apps.core.file_export.PROGRESS_EVERY", 2):
+            run_export_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_total, job.rows_written, job.progress), ("done", 3, 3, 100))
+        self.assertTrue(job.file.name.endswith(".csv.gz"))
+        with gzip.open(job.file.path, "rt", encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[0], "order_id,book_id,book_title,price,quantity,created_at")
+        self.assertEqual([line.split(",")[4] for line in lines[1:]], ["1", "2", "3"])
+
+        # Повторная доставка задачи не перезапускает готовую выгрузку
+        run_export_job(job.pk)
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).finished_at, job.finished_at)
+
+    def test_failed_job_keeps_error(self):
+        """Тест, что ошибка выгрузки сохраняется в задании и не оставляет файла"""
+        from django.conf import settings
+        from backend.apps.analytics.reports import WRITERS
+
+        def write(rows, path, progress):
+            path.write_text("partial")
+            raise OSError("disk full")
+
+        job = ExportJob.objects.create(report="sales", params={"start": "2024-01-01T00:00"})
+        with mock.patch.dict(WRITERS, {"csv": (write, "csv.gz")}):
+            run_export_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ("failed", "disk full"))
+        self.assertFalse(job.file)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, "exports")), [])
+
+    def test_create_status_and_download(self):
+        """Тест постановки выгрузки, опроса состояния и скачивания файла"""
+        self._order(quantity=2)
+
+        with mock.patch.object(run_export_job, "delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse("admin-export-job-create"), {"type": "top_books"}, HTTP_ACCEPT="application/json"
+                )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["id"]
+        delay.assert_called_once_with(job_id)
+
+        status = self.client.get(response["Location"]).json()
+        self.assertEqual(status["status"], "pending")
+        self.assertNotIn("download_url", status)
+
+        run_export_job(job_id)
+        status = self.client.get(reverse("admin-export-job-status", args=[job_id])).json()
+        self.assertEqual((status["status"], status["rows_written"]), ("done", 0))
+
+        response = self.client.get(status["download_url"])
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = gzip.decompress(b"".join(response.streaming_content)).decode("utf-8")
+        self.assertTrue(content.startswith("Позиция,Название книги"))
+
+        with override_settings(EXPORT_ACCEL_REDIRECT="/protected-exports/"):
+            response = self.client.get(status["download_url"])
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-exports/top_books_report_{job_id}.csv.gz")
+        self.assertEqual(response.content, b"")
+
+    def test_create_rejects_unknown_report(self):
+        """Тест отказа в выгрузке неизвестного отчета и combined в Parquet"""
+        response = self.client.post(
+            reverse("admin-export-job-create"), {"type": "unknown"}, HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse("admin-export-job-create"), {"type": "combined", "format": "parquet"}, HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "Выгрузка в Parquet требует pyarrow")
+    def test_job_writes_parquet(self):
+        """Тест выгрузки каталога книг в Parquet"""
+        import pyarrow.parquet as pq
+
+        job = ExportJob.objects.create(report="books", format="parquet")
+        run_export_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        table = pq.read_table(job.file.path)
+        self.assertEqual(table.column("Title").to_pylist(), ["Тестовая книга"])
+    
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "Выгрузка в Parquet требует pyarrow")
+    def test_parquet_job_column_null_in_first_batch(self):
+        """Тест, что Parquet-выгрузка не падает, если колонка пуста во всей первой группе строк"""
+        import pyarrow.parquet as pq
+
+        Book.objects.create(
+            title="Вторая книга", isbn="978-0-00-000002-2", category=self.book.category, price=Decimal("10"), pages=320
+        )
+        job = ExportJob.objects.create(report="books", format="parquet")
+        with mock.patch("backend.apps.core.file_export.PROGRESS_EVERY", 1):
+            run_export_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.rows_written), ("done", "", 2))
+        self.assertEqual(pq.read_table(job.file.path).column("Pages").to_pylist(), [None, 320])
+
+    def test_purge_removes_old_jobs_and_files(self):
+        """Тест удаления старых выгрузок вместе с файлами"""
+        job = ExportJob.objects.create(report="top_books")
+        run_export_job(job.pk)
+        job.refresh_from_db()
+        path = job.file.path
+        ExportJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(days=30))
+        fresh = ExportJob.objects.create(report="top_books")
+
+        self.assertEqual(purge_export_jobs(), 1)
+        self.assertFalse(ExportJob.objects.filter(pk=job.pk).exists())
+        self.assertTrue(ExportJob.objects.filter(pk=fresh.pk).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_purge_fails_stale_running_jobs(self):
+        """Тест, что зависшая после падения воркера выгрузка отмечается ошибкой без временного файла"""
+        from django.conf import settings
+
+        stale = ExportJob.objects.create(report="sales", status="running")
+        ExportJob.objects.filter(pk=stale.pk).update(
+            started_at=timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT + 60)
+        )
+        running = ExportJob.objects.create(report="sales", status="running", started_at=timezone.now())
+        exports = os.path.join(settings.MEDIA_ROOT, "exports")
+        os.makedirs(exports)
+        for job in (stale, running):
+            with open(os.path.join(exports, f"sales_{job.pk}.csv.gz.part"), "w") as file:
+                file.write("partial")
+
+        purge_export_jobs()
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, "failed")
+        self.assertTrue(stale.error.startswith("Выгрузка прервана"))
+        self.assertIsNotNone(stale.finished_at)
+        self.assertEqual(ExportJob.objects.get(pk=running.pk).status, "running")
+        self.assertEqual(os.listdir(exports), [f"sales_{running.pk}.csv.gz.part"])
@@ -1,14 +1,14 @@
 from datetime import datetime, timedelta
 from django.db.models import Sum, F, Count, Avg
-from django.http import HttpResponse
 from django.utils.dateparse import parse_datetime
 from rest_framework import permissions, views, viewsets
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-import csv
 
+from backend.apps.core.csv_export import streaming_csv_response
 from backend.apps.orders.models import OrderItem
+from .reports import sales_queryset, sales_rows
 # from .models import PageView, BookView, SearchQuery, PurchaseEvent  # Временно отключено
 # from .serializers import PageViewSerializer, BookViewSerializer, SearchQuerySerializer, PurchaseEventSerializer  # Временно отключено
 
@@ -20,22 +20,10 @@ class SalesStatsView(views.APIView):
         start = request.query_params.get('start')
         end = request.query_params.get('end')
         export = request.query_params.get('export')
-        start_dt = parse_datetime(start) if start else None
-        end_dt = parse_datetime(end) if end else None
-        qs = OrderItem.objects.select_related('order').all()
-        if start_dt:
-            qs = qs.filter(order__created_at__gte=start_dt)
-        if end_dt:
-            qs = qs.filter(order__created_at__lte=end_dt)
+        qs = sales_queryset(start, end)
 
         if export == 'csv':
-            response = HttpResponse(content_type='text/csv')
-            response['Content-Disposition'] = 'attachment; filename="sales.csv"'
-            writer = csv.writer(response)
-            writer.writerow(["order_id", "book_id", "book_title", "price", "quantity", "created_at"])
-            for item in qs.select_related('book', 'order').all():
-                writer.writerow([item.order_id, item.book_id, item.book.title, item.price, item.quantity, item.order.created_at.isoformat()])
-            return response
+            return streaming_csv_response(sales_rows(start, end), 'sales.csv', content_type='text/csv')
 
         total_revenue = qs.aggregate(total=Sum(F('price') * F('quantity')))['total'] or 0
         total_items = qs.aggregate(total=Sum('quantity'))['total'] or 0
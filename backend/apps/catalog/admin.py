@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
-from .models import Category, Author, Book, BookAuthors, Inventory
+from .models import Category, Author, Book, BookAuthors, ImportCheckpoint, Inventory
 
 
 @admin.register(Category)
@@ -27,7 +27,7 @@ class BookAdmin(admin.ModelAdmin):
     search_fields = ("title", "isbn", "description")
     list_filter = ("category", "is_active", "created_at", "publication_date")
     inlines = [BookAuthorsInline]
-    readonly_fields = ("created_at", "updated_at", "average_rating", "cover_image_preview")
+    readonly_fields = ("created_at", "updated_at", "review_avg", "review_count", "cover_image_preview")
     
     def cover_image_preview(self, obj):
         if obj.cover_image:
@@ -40,7 +40,7 @@ class BookAdmin(admin.ModelAdmin):
             "fields": ("title", "isbn", "description", "category")
         }),
         ("Цена и рейтинг", {
-            "fields": ("price", "rating", "average_rating")
+            "fields": ("price", "rating", "review_avg", "review_count")
         }),
         ("Обложка книги", {
             "fields": ("cover_image_preview", "cover_image"),
@@ -64,6 +64,7 @@ class InventoryAdmin(admin.ModelAdmin):
     list_display = ("book", "stock", "reserved")
 
 
-
-
-
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("source", "start", "end", "rows", "created", "updated", "errors", "finished_at")
+    search_fields = ("source",)
@@ -0,0 +1,70 @@
+"""Кэш гостевых страниц каталога с инвалидацией по версии.
+
+Любое изменение Book/Inventory/Category/Author/Review увеличивает версию
+каталога (bump_catalog_version), а версия входит в ключ кэша. Старые записи
+не удаляются, а просто перестают читаться и истекают по таймауту.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import urlencode
+
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Начинаем с текущего времени, чтобы после вытеснения ключа не совпасть со старыми версиями
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def _bump():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        catalog_version()
+
+
+def bump_catalog_version():
+    """Сбросить кэш гостевых страниц после фиксации текущей транзакции"""
+    transaction.on_commit(_bump)
+
+
+def _page_key(request, version):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.md5(f"{request.path}?{query}".encode("utf-8")).hexdigest()
+    return f"catalog:page:{version}:{digest}"
+
+
+def cache_for_guests(view_func):
+    """Отдавать гостям закэшированный HTML страницы (ключ — путь, параметры и версия каталога).
+
+    Авторизованные пользователи и запросы с непоказанными flash-сообщениями
+    обрабатываются как обычно.
+    """
+    @wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        if request.method != "GET" or request.user.is_authenticated or len(get_messages(request)):
+            return view_func(request, *args, **kwargs)
+
+        key = _page_key(request, catalog_version())
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            cache.set(key, (response.content, response["Content-Type"]), settings.CATALOG_PAGE_CACHE_TIMEOUT)
+        return response
+
+    return wrapped_view
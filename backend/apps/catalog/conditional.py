@@ -0,0 +1,90 @@
+"""Условные GET-запросы (ETag / Last-Modified) для каталога.
+
+Валидаторы считаются отдельным лёгким запросом по полю updated_at
+(для списков — MAX(updated_at) и COUNT(*) по отфильтрованной выборке),
+поэтому при 304 ни основная выборка, ни сериализатор не выполняются.
+Book.updated_at обновляется и при изменении остатков, авторов и отзывов
+книги (см. сигналы в catalog/models.py и Book.refresh_review_stats).
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _timestamp(last_modified):
+    return int(last_modified.timestamp()) if last_modified is not None else None
+
+
+def conditional_response(request, etag, last_modified, get_response):
+    """Вернуть 304, если у клиента актуальная копия, иначе ответ get_response() с валидаторами"""
+    timestamp = _timestamp(last_modified)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = get_response()
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+class ConditionalGetMixin:
+    """ETag/Last-Modified для list и retrieve у ModelViewSet"""
+    last_modified_field = "updated_at"
+
+    def _representation_key(self, request):
+        return f"{request.get_full_path()}:{request.accepted_media_type}"
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        stats = queryset.aggregate(last_modified=Max(self.last_modified_field), count=Count("pk"))
+        etag = make_etag(self._representation_key(request), stats["count"], stats["last_modified"])
+        return conditional_response(
+            request, etag, stats["last_modified"], lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        last_modified = (
+            self.filter_queryset(self.get_queryset())
+            .filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+            .values_list(self.last_modified_field, flat=True)
+            .first()
+        )
+        if last_modified is None:
+            # Нет такого объекта — пусть get_object() вернёт 404
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag(self._representation_key(request), last_modified)
+        return conditional_response(
+            request, etag, last_modified, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+
+def book_conditional(view_func):
+    """ETag/Last-Modified для HTML-страницы книги.
+
+    Страница зависит от пользователя (корзина, ссылки, CSRF), поэтому он входит в ETag.
+    Страницы с непоказанными flash-сообщениями не валидируются.
+    """
+    @wraps(view_func)
+    def wrapped_view(request, pk, *args, **kwargs):
+        from .models import Book
+
+        if request.method != "GET" or len(get_messages(request)):
+            return view_func(request, pk, *args, **kwargs)
+        last_modified = Book.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+        if last_modified is None:
+            return view_func(request, pk, *args, **kwargs)
+        etag = make_etag(request.get_full_path(), request.user.pk or "guest", last_modified)
+        return conditional_response(request, etag, last_modified, lambda: view_func(request, pk, *args, **kwargs))
+
+    return wrapped_view
@@ -0,0 +1,67 @@
+"""Выгрузка каталога книг (export_books, отчёт «Каталог книг» в админке).
+
+Книги читаются iterator() пачками по CHUNK_SIZE: категория и остатки
+приходят в том же запросе (select_related), авторы — одним запросом на пачку
+(prefetch_related), поэтому память не зависит от размера каталога.
+Формат строк совпадает с тем, что читает import_books.
+"""
+from django.db.models import Prefetch
+
+from .models import Book, BookAuthors
+
+# Сколько книг читать из БД за один раз
+CHUNK_SIZE = 2000
+
+BOOKS_HEADER = ['ID', 'Title', 'ISBN', 'Category', 'Authors', 'Price', 'Rating', 'Pages', 'Publication Date', 'Active', 'Stock', 'Reserved']
+# Имена колонок для JSON Lines и Parquet
+BOOKS_FIELDS = ['id', 'title', 'isbn', 'category', 'authors', 'price', 'rating', 'pages', 'publication_date', 'is_active', 'stock', 'reserved']
+# Типы колонок для Parquet (см. core.file_export.write_parquet)
+BOOKS_TYPES = ['int', 'str', 'str', 'str', 'str', 'decimal', 'decimal', 'int', 'date', 'bool', 'int', 'int']
+
+
+def books_queryset(since=None):
+    """Книги для выгрузки; since — только изменённые с этого момента (по updated_at)"""
+    qs = Book.objects.all()
+    if since:
+        qs = qs.filter(updated_at__gte=since)
+    return qs
+
+
+def books_rows(since=None, header=BOOKS_HEADER):
+    """Строки выгрузки каталога (первая — заголовок header)"""
+    yield header
+    books = (
+        books_queryset(since)
+        .select_related('category', 'inventory')
+        .only(
+            'title', 'isbn', 'price', 'rating', 'pages', 'publication_date', 'is_active',
+            'category__name', 'inventory__stock', 'inventory__reserved'
+        )
+        .prefetch_related(Prefetch(
+            'book_authors',
+            queryset=BookAuthors.objects.select_related('author').only(
+                'book_id', 'author__first_name', 'author__last_name'
+            ).order_by('pk'),
+            # Список в атрибуте, а не менеджер: не строится QuerySet на каждую книгу
+            to_attr='author_links'
+        ))
+        .order_by('pk')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for book in books:
+        authors = ', '.join(str(link.author) for link in book.author_links)
+        inventory = getattr(book, 'inventory', None)
+        yield [
+            book.id,
+            book.title,
+            book.isbn,
+            book.category.name,
+            authors,
+            book.price,
+            book.rating,
+            book.pages,
+            book.publication_date,
+            book.is_active,
+            inventory.stock if inventory else 0,
+            inventory.reserved if inventory else 0
+        ]
@@ -0,0 +1,101 @@
+"""Фасеты каталога: количество книг по категориям, диапазонам цены и рейтингу.
+
+Все фасеты считаются одним запросом с группировкой по категории и условными
+COUNT(...) FILTER (WHERE ...). Каждый фасет учитывает все активные фильтры,
+кроме своего собственного, поэтому при выбранной категории видно, сколько
+книг есть в соседних категориях.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q
+
+# Границы диапазонов цены, ₽; последний диапазон открыт сверху
+PRICE_FACET_EDGES = (Decimal("0"), Decimal("300"), Decimal("500"), Decimal("1000"), Decimal("2000"))
+# Пороги рейтинга для фасета «N и выше»
+RATING_FACET_THRESHOLDS = (Decimal("4"), Decimal("3"), Decimal("2"), Decimal("1"))
+
+
+def _range_q(field, low=None, high=None):
+    q = Q()
+    if low is not None:
+        q &= Q(**{f"{field}__gte": low})
+    if high is not None:
+        q &= Q(**{f"{field}__lte": high})
+    return q or None
+
+
+def _combine(*conditions):
+    """Объединить условия через AND, пропуская None; None, если условий нет"""
+    result = None
+    for condition in conditions:
+        if condition is not None:
+            result = condition if result is None else result & condition
+    return result
+
+
+def facet_filters(category=None, price_min=None, price_max=None, rating_min=None, rating_max=None,
+                  category_field="category"):
+    """Активные фасетные фильтры в виде {"category": Q, "price": Q, "rating": Q} (None — фильтра нет)"""
+    return {
+        "category": Q(**{category_field: category}) if category not in (None, "") else None,
+        "price": _range_q("price", price_min, price_max),
+        "rating": _range_q("rating", rating_min, rating_max),
+    }
+
+
+def apply_facet_filters(queryset, filters):
+    condition = _combine(*filters.values())
+    return queryset if condition is None else queryset.filter(condition)
+
+
+def price_buckets(edges=PRICE_FACET_EDGES):
+    """Пары (min, max) диапазонов цены, границы включительно; max последнего диапазона — None"""
+    return list(zip(edges, list(edges[1:]) + [None]))
+
+
+def catalog_facets(queryset, filters):
+    """Посчитать фасеты для queryset книг.
+
+    queryset — книги после поиска и нефасетных фильтров (is_active и т.п.),
+    filters — результат facet_filters() с активными фасетными фильтрами.
+    """
+    queryset = queryset.order_by()
+    if queryset.query.distinct or queryset.query.annotations:
+        # JOIN с авторами (поиск на SQLite) и аннотации релевантности мешают группировке
+        queryset = queryset.model.objects.filter(pk__in=queryset.values("pk"))
+
+    category, price, rating = filters["category"], filters["price"], filters["rating"]
+    buckets = price_buckets()
+    aggregates = {"category_count": Count("pk", filter=_combine(price, rating))}
+    for i, (low, high) in enumerate(buckets):
+        # Те же границы, что у фильтра price_min/price_max (обе включительно): счётчик
+        # диапазона равен числу книг по его ссылке, цена на границе входит в оба соседних
+        bucket = _range_q("price", low, high)
+        aggregates[f"price_{i}"] = Count("pk", filter=_combine(category, rating, bucket))
+    for i, threshold in enumerate(RATING_FACET_THRESHOLDS):
+        aggregates[f"rating_{i}"] = Count("pk", filter=_combine(category, price, Q(rating__gte=threshold)))
+
+    rows = list(
+        queryset.values("category_id", "category__name", "category__slug")
+        .annotate(**aggregates)
+        .order_by("category__name")
+    )
+    return {
+        "categories": [
+            {
+                "id": row["category_id"],
+                "name": row["category__name"],
+                "slug": row["category__slug"],
+                "count": row["category_count"],
+            }
+            for row in rows
+        ],
+        "price": [
+            {"min": low, "max": high, "count": sum(row[f"price_{i}"] for row in rows)}
+            for i, (low, high) in enumerate(buckets)
+        ],
+        "rating": [
+            {"min": threshold, "count": sum(row[f"rating_{i}"] for row in rows)}
+            for i, threshold in enumerate(RATING_FACET_THRESHOLDS)
+        ],
+    }
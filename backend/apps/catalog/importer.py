@@ -0,0 +1,489 @@
+"""Пакетный импорт книг из CSV-фида поставщика.
+
+Строки обрабатываются пачками: категории и авторы ищутся в словарях, которые
+загружаются одним запросом при создании BookImporter и дополняются новыми
+записями (bulk_create), книги пишутся одним bulk_create(update_conflicts=True)
+по ISBN, а связи с авторами сравниваются с текущими и меняются двумя запросами.
+Каждая пачка — одна транзакция.
+
+bulk_create и массовые UPDATE не отправляют сигналов, поэтому после пачки
+search_vector пересобирается для её книг, а кэш каталога сбрасывается явно.
+Индекс подсказок догонит изменения при плановой пересборке (CATALOG_SUGGEST_MAX_AGE).
+
+Файл целиком импортирует import_file: он делит файл на куски по границам
+строк, и куски обрабатываются по очереди или параллельно в нескольких
+процессах. Импортированные куски отмечаются в ImportCheckpoint, поэтому
+прерванный импорт при повторном запуске продолжается с недоделанных кусков.
+
+Формат строки: ID, Title, ISBN, Category, Authors, Price, Rating, Pages,
+Publication Date, Active, Stock[, Reserved] — как у export_books; ID, дата
+публикации и остатки не импортируются.
+"""
+import csv
+import glob
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import django
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections, transaction
+
+from .cache import bump_catalog_version
+from .models import Author, Book, BookAuthors, Category, ImportCheckpoint
+
+MIN_COLUMNS = 11
+# Сколько сообщений об ошибках хранить в памяти, если они не пишутся в файл
+MAX_ERRORS = 100
+# Размер куска файла по умолчанию (байт) — единица параллельной работы и возобновления
+CHUNK_BYTES = 16 * 1024 * 1024
+# Сколько байт читать за раз при разбиении файла на куски
+READ_BLOCK = 1024 * 1024
+
+BOOK_UPDATE_FIELDS = ['title', 'category', 'price', 'rating', 'pages', 'is_active', 'description', 'updated_at']
+
+
+class RowError(Exception):
+    """Строка фида не может быть импортирована"""
+
+
+class ChunkError(Exception):
+    """Кусок файла импортирован не полностью: часть пачек откатилась"""
+
+
+class ImportStats:
+    """Итоги импорта.
+
+    С error_path все ошибки пишутся в этот файл (прежнее содержимое
+    заменяется), иначе первые MAX_ERRORS хранятся в errors.
+    """
+
+    def __init__(self, error_path=None):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.failed_batches = 0
+        self.errors = []
+        self.error_path = error_path
+        self._error_file = None
+
+    def add_error(self, row_num, message, count=1):
+        self.error_count += count
+        message = f'Row {row_num}: {message}'
+        if self.error_path:
+            if self._error_file is None:
+                self._error_file = open(self.error_path, 'w', encoding='utf-8')
+            self._error_file.write(message + '\n')
+        elif len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    def add(self, totals):
+        """Прибавить итоги куска (результат totals())"""
+        self.rows += totals['rows']
+        self.created += totals['created']
+        self.updated += totals['updated']
+        self.error_count += totals['errors']
+
+    def totals(self):
+        return {'rows': self.rows, 'created': self.created, 'updated': self.updated, 'errors': self.error_count}
+
+    def close(self):
+        if self._error_file is not None:
+            self._error_file.close()
+            self._error_file = None
+
+
+def split_author(name):
+    """Имя автора из фида -> (first_name, last_name): фамилия — всё после первого пробела"""
+    names = name.split(' ', 1)
+    if len(names) == 2:
+        return names[0], names[1]
+    return name, ''
+
+
+def _clean(model, field_name, value):
+    field = model._meta.get_field(field_name)
+    try:
+        return field.clean(value, None)
+    except ValidationError as e:
+        raise RowError(f'{field_name}: {"; ".join(e.messages)}')
+
+
+def parse_row(row):
+    """Разобрать и проверить строку фида; возвращает dict полей книги или бросает RowError"""
+    if len(row) < MIN_COLUMNS:
+        raise RowError('Not enough columns')
+    isbn = row[2].strip()
+    if not isbn:
+        raise RowError('ISBN is required')
+    category = row[3].strip()
+    if not category:
+        raise RowError('Category is required')
+    try:
+        price = Decimal(row[5]) if row[5] else Decimal(0)
+        rating = Decimal(row[6]) if row[6] else Decimal(0)
+        pages = int(row[7]) if row[7] else None
+    except (InvalidOperation, ValueError) as e:
+        raise RowError(f'Invalid number: {e}')
+
+    authors = []
+    for author_name in row[4].split(','):
+        author_name = author_name.strip()
+        if author_name:
+            first_name, last_name = split_author(author_name)
+            authors.append((_clean(Author, 'first_name', first_name), _clean(Author, 'last_name', last_name)))
+
+    return {
+        'isbn': _clean(Book, 'isbn', isbn),
+        'title': _clean(Book, 'title', row[1].strip()),
+        'category': _clean(Category, 'name', category),
+        'price': _clean(Book, 'price', price),
+        'rating': _clean(Book, 'rating', rating),
+        'pages': _clean(Book, 'pages', pages),
+        'is_active': row[9].strip().lower() in ['true', '1', 'yes'],
+        # Пустая строка авторов оставляет связи книги как есть
+        'authors': list(dict.fromkeys(authors)) if row[4].strip() else None,
+    }
+
+
+class BookImporter:
+    """Импорт пачек строк фида с кэшем категорий и авторов на всё время импорта"""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.stats = ImportStats()
+        self._load_lookups()
+
+    def _load_lookups(self):
+        """Загрузить словари категорий и авторов (по одному запросу)"""
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.authors = {
+            (first_name, last_name): pk
+            for pk, first_name, last_name in Author.objects.values_list('pk', 'first_name', 'last_name')
+        }
+
+    def import_rows(self, numbered_rows):
+        """Импортировать пачку [(номер строки, строка CSV)] одной транзакцией"""
+        books = {}
+        for row_num, row in numbered_rows:
+            self.stats.rows += 1
+            try:
+                book = parse_row(row)
+            except RowError as e:
+                self.stats.add_error(row_num, e)
+                continue
+            # Повтор ISBN в пачке: как и при построчном импорте, побеждает последняя строка
+            books.pop(book['isbn'], None)
+            books[book['isbn']] = (row_num, book)
+        if not books:
+            return
+
+        if self.dry_run:
+            existing = Book.objects.filter(isbn__in=books).count()
+            self.stats.updated += existing
+            self.stats.created += len(books) - existing
+            return
+        try:
+            with transaction.atomic():
+                books = self._resolve_categories(books)
+                existing = Book.objects.filter(isbn__in=books).count()
+                self._resolve_authors(book for _, book in books.values())
+                book_ids = self._save_books(books)
+                self._save_authors(books, book_ids)
+                Book.refresh_search_vector(list(book_ids.values()))
+                bump_catalog_version()
+        except DatabaseError as e:
+            # Пачка откатывается целиком, импорт продолжается со следующей. Созданные
+            # в ней категории и авторы тоже откатились, поэтому словари перечитываются
+            row_nums = [row_num for row_num, _ in books.values()]
+            self.stats.failed_batches += 1
+            self.stats.add_error(f'{min(row_nums)}-{max(row_nums)}', f'Batch failed: {e}', count=len(row_nums))
+            self._load_lookups()
+            return
+        self.stats.updated += existing
+        self.stats.created += len(books) - existing
+
+    def _resolve_categories(self, books):
+        """Создать недостающие категории; строки с категориями, которые не удалось создать, — ошибки"""
+        missing = {book['category'] for _, book in books.values()} - self.categories.keys()
+        if missing:
+            Category.objects.bulk_create(
+                [Category(name=name, slug=name.lower().replace(' ', '-')) for name in sorted(missing)],
+                ignore_conflicts=True
+            )
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'pk'))
+        resolved = {}
+        for isbn, (row_num, book) in books.items():
+            if book['category'] in self.categories:
+                resolved[isbn] = (row_num, book)
+            else:
+                # Например, slug совпал со slug другой категории
+                self.stats.add_error(row_num, f'Cannot create category "{book["category"]}"')
+        return resolved
+
+    def _resolve_authors(self, books):
+        missing = {author for book in books for author in book['authors'] or () if author not in self.authors}
+        if not missing:
+            return
+        Author.objects.bulk_create(
+            [Author(first_name=first_name, last_name=last_name) for first_name, last_name in sorted(missing)],
+            ignore_conflicts=True
+        )
+        # Авторы могли появиться и в параллельном импорте, поэтому id перечитываются
+        candidates = Author.objects.filter(
+            first_name__in={first_name for first_name, _ in missing},
+            last_name__in={last_name for _, last_name in missing},
+        ).values_list('pk', 'first_name', 'last_name')
+        for pk, first_name, last_name in candidates:
+            if (first_name, last_name) in missing:
+                self.authors[first_name, last_name] = pk
+
+    def _save_books(self, books):
+        """Записать книги одним INSERT ... ON CONFLICT (isbn) DO UPDATE; возвращает {isbn: id}"""
+        Book.objects.bulk_create(
+            [
+                Book(
+                    isbn=isbn,
+                    title=book['title'],
+                    category_id=self.categories[book['category']],
+                    price=book['price'],
+                    rating=book['rating'],
+                    pages=book['pages'],
+                    is_active=book['is_active'],
+                    description='',
+                )
+                # Порядок по ISBN: параллельные пачки блокируют строки в одном порядке
+                for isbn, (_, book) in sorted(books.items())
+            ],
+            update_conflicts=True,
+            unique_fields=['isbn'],
+            update_fields=BOOK_UPDATE_FIELDS,
+        )
+        return dict(Book.objects.filter(isbn__in=books).values_list('isbn', 'pk'))
+
+    def _save_authors(self, books, book_ids):
+        """Привести связи книг с авторами к списку из фида: лишние удалить, недостающие добавить"""
+        wanted = {
+            book_ids[isbn]: {self.authors[author] for author in book['authors']}
+            for isbn, (_, book) in books.items()
+            if book['authors'] is not None
+        }
+        if not wanted:
+            return
+        stale = []
+        for pk, book_id, author_id in BookAuthors.objects.filter(book_id__in=wanted).values_list('pk', 'book_id', 'author_id'):
+            if author_id in wanted[book_id]:
+                wanted[book_id].discard(author_id)
+            else:
+                stale.append(pk)
+        if stale:
+            BookAuthors.objects.filter(pk__in=stale).delete()
+        BookAuthors.objects.bulk_create(
+            [BookAuthors(book_id=book_id, author_id=author_id) for book_id, author_ids in wanted.items() for author_id in author_ids],
+            ignore_conflicts=True
+        )
+
+
+Chunk = namedtuple('Chunk', ['start', 'end', 'first_row'])
+
+# chunks — все куски файла, skipped — отметки кусков, импортированных прошлыми
+# запусками, failed — [(кусок, исключение)], error_files — файлы с ошибками строк
+FileImport = namedtuple('FileImport', ['stats', 'chunks', 'skipped', 'failed', 'error_files'])
+
+
+def file_fingerprint(path):
+    """Отпечаток файла для отметок импорта: размер и время изменения"""
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def split_file(path, chunk_size=CHUNK_BYTES, skip_header=False):
+    """Разбить CSV-файл на куски примерно по chunk_size байт.
+
+    Кусок заканчивается переводом строки вне кавычек, поэтому многострочные
+    значения не разрезаются. first_row — номер первой строки куска без учёта
+    заголовка, по нему считаются номера строк в ошибках.
+    """
+    chunks = []
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        start = pos = len(file.readline()) if skip_header else 0
+        target = start + chunk_size
+        first_row = 1
+        quoted = 0  # нечётное число кавычек до pos — внутри значения
+        newlines = 0
+        while True:
+            block = file.read(READ_BLOCK)
+            if not block:
+                break
+            offset = 0
+            while target < pos + len(block):
+                # Пропускаем всё до target и ищем первый перевод строки вне кавычек
+                skip_to = max(target - pos, offset)
+                quoted = (quoted + block.count(b'"', offset, skip_to)) & 1
+                newlines += block.count(b'\n', offset, skip_to)
+                offset = skip_to
+                while True:
+                    nl = block.find(b'\n', offset)
+                    if nl == -1:
+                        break
+                    quoted = (quoted + block.count(b'"', offset, nl)) & 1
+                    newlines += 1
+                    offset = nl + 1
+                    if not quoted:
+                        chunks.append(Chunk(start, pos + offset, first_row))
+                        start, first_row = pos + offset, newlines + 1
+                        target = start + chunk_size
+                        break
+                if nl == -1:
+                    break
+            quoted = (quoted + block.count(b'"', offset)) & 1
+            newlines += block.count(b'\n', offset)
+            pos += len(block)
+    if start < size:
+        chunks.append(Chunk(start, size, first_row))
+    return chunks
+
+
+def read_chunk(path, chunk):
+    """Строки куска: [(номер строки, строка CSV)]"""
+    with open(path, 'rb') as file:
+        file.seek(chunk.start)
+        data = file.read(chunk.end - chunk.start)
+    reader = csv.reader(io.StringIO(data.decode('utf-8'), newline=''))
+    line = 0
+    for row in reader:
+        yield chunk.first_row + line, row
+        line = reader.line_num
+
+
+def import_chunk(importer, path, chunk, batch_size, error_path, source, fingerprint):
+    """Импортировать кусок файла пачками по batch_size строк и отметить его в ImportCheckpoint"""
+    # Ошибки прошлой попытки этого куска больше не актуальны
+    if os.path.exists(error_path):
+        os.remove(error_path)
+    importer.stats = ImportStats(error_path=error_path)
+    rows = read_chunk(path, chunk)
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            importer.import_rows(batch)
+    finally:
+        importer.stats.close()
+    if importer.stats.failed_batches:
+        # Такой кусок не отмечается, и повторный запуск импортирует его снова
+        raise ChunkError(f'{importer.stats.failed_batches} batches failed, see {error_path}')
+    totals = importer.stats.totals()
+    if not importer.dry_run:
+        ImportCheckpoint.objects.create(
+            source=source, fingerprint=fingerprint, start=chunk.start, end=chunk.end, **totals
+        )
+    return totals
+
+
+# Импортёр процесса-воркера: словари категорий и авторов загружаются один раз на процесс
+_worker_importer = None
+
+
+def _init_worker(dry_run):
+    global _worker_importer
+    django.setup()
+    _worker_importer = BookImporter(dry_run=dry_run)
+
+
+def _chunk_error_path(errors_dir, chunk):
+    return os.path.join(errors_dir, f'chunk-{chunk.start}.log')
+
+
+def _import_chunk_in_worker(path, chunk, batch_size, errors_dir, source, fingerprint):
+    error_path = _chunk_error_path(errors_dir, chunk)
+    return import_chunk(_worker_importer, path, chunk, batch_size, error_path, source, fingerprint)
+
+
+def _run_chunks(path, pending, workers, batch_size, dry_run, errors_dir, source, fingerprint):
+    """Импортировать куски; выдаёт (кусок, итоги, исключение) по мере завершения"""
+    if workers <= 1:
+        importer = BookImporter(dry_run=dry_run)
+        for chunk in pending:
+            error_path = _chunk_error_path(errors_dir, chunk)
+            try:
+                yield chunk, import_chunk(importer, path, chunk, batch_size, error_path, source, fingerprint), None
+            except Exception as e:
+                yield chunk, None, e
+        return
+
+    # Соединения с БД не должны наследоваться процессами-воркерами
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dry_run,)) as pool:
+        futures = {
+            pool.submit(_import_chunk_in_worker, path, chunk, batch_size, errors_dir, source, fingerprint): chunk
+            for chunk in pending
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+def import_file(path, workers=1, batch_size=1000, chunk_size=CHUNK_BYTES, skip_header=False,
+                dry_run=False, errors_dir=None, restart=False, progress=None):
+    """Импортировать CSV-файл кусками в workers процессах; возвращает FileImport.
+
+    Куски, отмеченные в ImportCheckpoint прошлым запуском для того же файла,
+    пропускаются (restart=True начинает импорт заново). Если все куски
+    импортированы, отметки удаляются. Кусок, прерванный посередине,
+    импортируется заново целиком — уже записанные строки просто обновятся.
+
+    Ошибки строк пишутся в errors_dir (по умолчанию <файл>.errors), по файлу на
+    кусок (chunk-<смещение>.log); повторный импорт куска перезаписывает его файл. progress(stats, done, total) вызывается после каждого куска.
+    """
+    source = os.path.abspath(path)
+    fingerprint = file_fingerprint(path)
+    errors_dir = errors_dir or f'{source}.errors'
+    chunks = split_file(path, chunk_size, skip_header)
+
+    checkpoints = ImportCheckpoint.objects.filter(source=source)
+    if not dry_run:
+        if restart:
+            checkpoints.delete()
+        # Отметки для прежней версии файла не годятся
+        checkpoints.exclude(fingerprint=fingerprint).delete()
+    ranges = {(chunk.start, chunk.end) for chunk in chunks}
+    skipped = [] if dry_run else [
+        checkpoint for checkpoint in checkpoints if (checkpoint.start, checkpoint.end) in ranges
+    ]
+    done_ranges = {(checkpoint.start, checkpoint.end) for checkpoint in skipped}
+    pending = [chunk for chunk in chunks if (chunk.start, chunk.end) not in done_ranges]
+
+    os.makedirs(errors_dir, exist_ok=True)
+    if not checkpoints.exists():
+        # Файлы ошибок нужны только незавершённому импорту, остальные устарели
+        for old in glob.glob(os.path.join(errors_dir, 'chunk-*.log')):
+            os.remove(old)
+
+    stats = ImportStats()
+    failed = []
+    completed = len(skipped)
+    for chunk, totals, error in _run_chunks(path, pending, workers, batch_size, dry_run, errors_dir, source, fingerprint):
+        completed += 1
+        if error is not None:
+            failed.append((chunk, error))
+            continue
+        stats.add(totals)
+        if progress:
+            progress(stats, completed, len(chunks))
+
+    if not failed and not dry_run:
+        checkpoints.delete()
+    error_files = [
+        _chunk_error_path(errors_dir, chunk) for chunk in chunks
+        if os.path.exists(_chunk_error_path(errors_dir, chunk))
+    ]
+    return FileImport(stats, chunks, skipped, failed, error_files)
@@ -0,0 +1,116 @@
+"""Команда для замера нечёткого поиска (pg_trgm) на синтетическом каталоге"""
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from backend.apps.catalog.models import Author, Book, BookAuthors, Category
+from backend.apps.catalog.search import fuzzy_search_authors, fuzzy_search_books
+
+SYLLABLES = ['до', 'сто', 'ев', 'ски', 'тол', 'че', 'хов', 'бул', 'га', 'ков', 'пуш', 'кин', 'мир', 'вой', 'на', 'ра', 'ло', 'ми']
+
+
+def _word(rng, parts=3):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+
+def _misspell(rng, text):
+    """Одна случайная опечатка: замена, пропуск или перестановка символов"""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 2)
+    kind = rng.choice(('replace', 'drop', 'swap'))
+    if kind == 'replace':
+        return text[:i] + rng.choice('аеиоуя') + text[i + 1:]
+    if kind == 'drop':
+        return text[:i] + text[i + 1:]
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+class Command(BaseCommand):
+    help = 'Замер нечёткого поиска книг и авторов на сгенерированном каталоге (только PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=1_000_000, help='Количество синтетических книг')
+        parser.add_argument('--authors', type=int, default=50_000, help='Количество синтетических авторов')
+        parser.add_argument('--queries', type=int, default=50, help='Количество замеряемых запросов')
+        parser.add_argument('--threshold', type=float, default=None, help='Порог similarity')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Не откатывать сгенерированные данные после замера'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Нечёткий поиск (pg_trgm) доступен только на PostgreSQL')
+
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            authors, titles = self._generate(rng, options)
+            self._run('books', titles, options, rng, lambda q, t: fuzzy_search_books(
+                Book.objects.all(), q, t).order_by('-search_rank', 'id')[:20])
+            self._run('authors', authors, options, rng, lambda q, t: fuzzy_search_authors(
+                Author.objects.all(), q, t)[:20])
+            if not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write(self.style.WARNING('Сгенерированные данные откатываются (используйте --keep)'))
+
+    def _generate(self, rng, options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        category = Category.objects.create(name=f'Benchmark {rng.random()}', slug=f'benchmark-{rng.getrandbits(32)}')
+
+        author_names = set()
+        while len(author_names) < options['authors']:
+            author_names.add((_word(rng, 2), _word(rng, 3)))
+        author_objs = Author.objects.bulk_create(
+            [Author(first_name=f, last_name=l) for f, l in author_names], batch_size=batch_size
+        )
+
+        titles = []
+        isbn_prefix = rng.getrandbits(24)
+        for start in range(0, options['titles'], batch_size):
+            chunk = []
+            for i in range(start, min(start + batch_size, options['titles'])):
+                title = ' '.join(_word(rng, rng.randint(2, 4)) for _ in range(rng.randint(1, 4)))
+                if len(titles) < 1000:
+                    titles.append(title)
+                chunk.append(Book(
+                    title=title, isbn=f'B{isbn_prefix:08x}{i:010d}', category=category, price=Decimal('100')
+                ))
+            books = Book.objects.bulk_create(chunk, batch_size=batch_size)
+            BookAuthors.objects.bulk_create(
+                [BookAuthors(book=b, author=rng.choice(author_objs)) for b in books], batch_size=batch_size
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE catalog_book; ANALYZE catalog_author; ANALYZE catalog_bookauthors;')
+
+        self.stdout.write(
+            f'Generated {options["titles"]} books / {len(author_objs)} authors '
+            f'in {time.perf_counter() - started:.1f}s'
+        )
+        return [a.last_name for a in author_objs[:1000]], titles
+
+    def _run(self, label, samples, options, rng, search):
+        timings = []
+        hits = 0
+        for _ in range(options['queries']):
+            query = _misspell(rng, rng.choice(samples))
+            started = time.perf_counter()
+            results = list(search(query, options['threshold']))
+            timings.append((time.perf_counter() - started) * 1000)
+            hits += bool(results)
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {len(timings)} misspelled queries, found {hits}, '
+            f'median {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms, max {timings[-1]:.1f} ms'
+        ))
@@ -1,71 +1,94 @@
-from django.core.management.base import BaseCommand
-from backend.apps.catalog.models import Book, Category, Author
-import csv
+import importlib.util
 import os
+from functools import partial
+from datetime import datetime, time
 from pathlib import Path
 
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from backend.apps.catalog.exporter import BOOKS_FIELDS, BOOKS_HEADER, BOOKS_TYPES, books_rows
+from backend.apps.core.file_export import write_csv, write_jsonl, write_parquet
+
+# Формат -> (писатель, расширение, заголовок, сжатие gzip-ом всего файла)
+FORMATS = {
+    'csv': (write_csv, 'csv', BOOKS_HEADER, True),
+    'jsonl': (write_jsonl, 'jsonl', BOOKS_FIELDS, True),
+    'parquet': (partial(write_parquet, types=BOOKS_TYPES), 'parquet', BOOKS_FIELDS, False),
+}
+
+
+def parse_since(value):
+    """Дата или дата и время в ISO-формате -> aware datetime"""
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(value)
+        since = datetime.combine(date, time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
 
 class Command(BaseCommand):
-    help = 'Экспорт книг в CSV файл'
+    help = 'Экспорт книг в CSV, JSON Lines или Parquet (потоково, пачками из БД)'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--output',
             type=str,
-            default='books_export.csv',
-            help='Имя выходного CSV файла'
+            help='Имя выходного файла в каталоге exports (по умолчанию books_export.<формат>)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(FORMATS),
+            default='csv',
+            help='Формат выгрузки'
+        )
+        parser.add_argument(
+            '--compress',
+            action='store_true',
+            help='Сжать выгрузку: CSV и JSON Lines — gzip, Parquet — zstd'
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Выгрузить только книги, изменённые начиная с этой даты или времени (ISO, по updated_at)'
         )
 
     def handle(self, *args, **options):
-        output_file = options['output']
-        
+        write, extension, header, gzip_file = FORMATS[options['format']]
+        if options['format'] == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+            raise CommandError('Parquet export requires pyarrow')
+        if options['compress'] and gzip_file:
+            extension += '.gz'
+
+        since = None
+        if options['since']:
+            try:
+                since = parse_since(options['since'])
+            except ValueError:
+                raise CommandError(f'Invalid --since value: {options["since"]}')
+
         # Создаем директорию exports если её нет
         output_dir = Path('exports')
         output_dir.mkdir(exist_ok=True)
-        
-        file_path = output_dir / output_file
-        
-        with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            
-            # Заголовки
-            writer.writerow([
-                'ID', 'Title', 'ISBN', 'Category', 'Authors', 'Price', 
-                'Rating', 'Pages', 'Publication Date', 'Active', 
-                'Stock', 'Reserved'
-            ])
-            
-            # Данные
-            books = Book.objects.select_related('category').prefetch_related('book_authors__author').all()
-            for book in books:
-                authors = ', '.join([str(a.author) for a in book.book_authors.all()])
-                
-                # Получаем данные об инвентаре
-                try:
-                    inventory = book.inventory
-                    stock = inventory.stock
-                    reserved = inventory.reserved
-                except:
-                    stock = 0
-                    reserved = 0
-                
-                writer.writerow([
-                    book.id,
-                    book.title,
-                    book.isbn,
-                    book.category.name if book.category else '',
-                    authors,
-                    book.price,
-                    book.rating,
-                    book.pages or '',
-                    book.publication_date or '',
-                    book.is_active,
-                    stock,
-                    reserved
-                ])
-        
-        self.stdout.write(
-            self.style.SUCCESS(f'Successfully exported {books.count()} books to {file_path}')
-        )
 
+        file_path = output_dir / (options['output'] or f'books_export.{extension}')
+        partial = file_path.with_name(file_path.name + '.part')
+
+        # Время начала — значение --since для следующей инкрементальной выгрузки
+        started_at = timezone.now()
+        try:
+            count = write(books_rows(since, header=header), partial, compress=options['compress'])
+            os.replace(partial, file_path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
 
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully exported {count} books to {file_path}')
+        )
+        self.stdout.write(f'Next incremental export: --since {started_at.isoformat()}')
@@ -1,11 +1,14 @@
-from django.core.management.base import BaseCommand
-from backend.apps.catalog.models import Book, Category, Author, BookAuthors
+import time
 from pathlib import Path
-import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.apps.catalog.importer import CHUNK_BYTES, import_file
 
 
 class Command(BaseCommand):
-    help = 'Импорт книг из CSV файла'
+    help = 'Импорт книг из CSV файла пачками, в несколько процессов и с продолжением прерванного импорта (см. backend.apps.catalog.importer)'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -18,94 +21,94 @@ class Command(BaseCommand):
             action='store_true',
             help='Пропустить первую строку (заголовок)'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в пачке (одна транзакция на пачку)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Количество процессов импорта'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_BYTES,
+            help='Размер куска файла в байтах (единица параллельной работы и возобновления)'
+        )
+        parser.add_argument(
+            '--errors-dir',
+            type=str,
+            help='Каталог для файлов с ошибками строк (по умолчанию <файл>.errors)'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать импорт заново, не пропуская куски, импортированные прерванным запуском'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только проверить файл и посчитать новые и обновляемые книги, ничего не записывая'
+        )
 
     def handle(self, *args, **options):
         input_file = options['input_file']
-        skip_header = options['skip_header']
-        
+
         if not Path(input_file).exists():
             self.stdout.write(self.style.ERROR(f'File not found: {input_file}'))
             return
-        
-        created_count = 0
-        updated_count = 0
-        errors = []
-        
-        with open(input_file, 'r', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            
-            if skip_header:
-                next(reader, None)  # Пропускаем заголовок
-            
-            for row_num, row in enumerate(reader, start=1):
-                try:
-                    if len(row) < 11:
-                        errors.append(f'Row {row_num}: Not enough columns')
-                        continue
-                    
-                    isbn = row[2].strip()
-                    if not isbn:
-                        errors.append(f'Row {row_num}: ISBN is required')
-                        continue
-                    
-                    # Получаем или создаем категорию
-                    category_name = row[3].strip()
-                    if category_name:
-                        category, _ = Category.objects.get_or_create(
-                            name=category_name,
-                            defaults={'slug': category_name.lower().replace(' ', '-')}
-                        )
-                    else:
-                        category = None
-                    
-                    # Создаем или обновляем книгу
-                    book, created = Book.objects.update_or_create(
-                        isbn=isbn,
-                        defaults={
-                            'title': row[1].strip(),
-                            'category': category,
-                            'price': float(row[5]) if row[5] else 0,
-                            'rating': float(row[6]) if row[6] else 0,
-                            'pages': int(row[7]) if row[7] else None,
-                            'is_active': row[9].strip().lower() in ['true', '1', 'yes'],
-                            'description': '',
-                        }
-                    )
-                    
-                    if created:
-                        created_count += 1
-                    else:
-                        updated_count += 1
-                    
-                    # Обрабатываем авторов
-                    authors_str = row[4].strip()
-                    if authors_str:
-                        BookAuthors.objects.filter(book=book).delete()
-                        for author_name in authors_str.split(','):
-                            author_name = author_name.strip()
-                            if author_name:
-                                names = author_name.split(' ', 1)
-                                if len(names) == 2:
-                                    first_name, last_name = names[0], names[1]
-                                else:
-                                    first_name, last_name = author_name, ''
-                                
-                                author, _ = Author.objects.get_or_create(
-                                    first_name=first_name,
-                                    last_name=last_name
-                                )
-                                BookAuthors.objects.create(book=book, author=author)
-                    
-                except Exception as e:
-                    errors.append(f'Row {row_num}: {str(e)}')
-        
+
+        workers = max(1, options['workers'])
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite допускает одного писателя: параллельные пачки только блокировали бы друг друга
+            self.stdout.write(self.style.WARNING('SQLite does not support parallel writes, using 1 worker'))
+            workers = 1
+
+        started = time.perf_counter()
+
+        def progress(stats, done, total):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  {done}/{total} chunks, {stats.rows} rows, {stats.rows / elapsed if elapsed else stats.rows:.0f} rows/s')
+
+        result = import_file(
+            input_file,
+            workers=workers,
+            batch_size=max(1, options['batch_size']),
+            chunk_size=max(1, options['chunk_size']),
+            skip_header=options['skip_header'],
+            dry_run=options['dry_run'],
+            errors_dir=options['errors_dir'],
+            restart=options['restart'],
+            progress=progress,
+        )
+        stats = result.stats
+
+        elapsed = time.perf_counter() - started
+        prefix = 'Dry run' if options['dry_run'] else 'Import'
         self.stdout.write(self.style.SUCCESS(
-            f'Import completed: {created_count} created, {updated_count} updated'
+            f'{prefix} completed: {stats.created} created, {stats.updated} updated '
+            f'in {elapsed:.1f}s ({stats.rows / elapsed if elapsed else stats.rows:.0f} rows/s)'
         ))
-        
-        if errors:
-            self.stdout.write(self.style.ERROR(f'Errors ({len(errors)}):'))
-            for error in errors[:10]:  # Показываем первые 10 ошибок
-                self.stdout.write(self.style.ERROR(f'  {error}'))
+        if result.skipped:
+            self.stdout.write(
+                f'Resumed: {len(result.skipped)} of {len(result.chunks)} chunks '
+                f'({sum(checkpoint.rows for checkpoint in result.skipped)} rows) were imported by an earlier run'
+            )
 
+        # Файлы ошибок содержат и ошибки кусков из прерванного запуска
+        error_count = stats.error_count + sum(checkpoint.errors for checkpoint in result.skipped)
+        if error_count:
+            self.stdout.write(self.style.ERROR(f'Errors ({error_count}) are written to:'))
+            for error_file in result.error_files:
+                self.stdout.write(self.style.ERROR(f'  {error_file}'))
 
+        if result.failed:
+            for chunk, error in result.failed:
+                self.stdout.write(self.style.ERROR(f'  bytes {chunk.start}-{chunk.end}: {error}'))
+            raise CommandError(
+                f'{len(result.failed)} of {len(result.chunks)} chunks failed; run the command again to resume'
+            )
@@ -0,0 +1,47 @@
+"""Команда для пересчёта денормализованных агрегатов отзывов (review_count/review_avg)"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from backend.apps.catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать количество и средний рейтинг отзывов для книг'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--book',
+            type=int,
+            action='append',
+            dest='book_ids',
+            help='ID книги (можно указать несколько раз); по умолчанию — все книги'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество книг, пересчитываемых в одном UPDATE'
+        )
+
+    def handle(self, *args, **options):
+        book_ids = options['book_ids']
+        batch_size = max(1, options['batch_size'])
+
+        if book_ids:
+            updated = Book.refresh_review_stats(book_ids)
+            self.stdout.write(self.style.SUCCESS(f'Updated review stats for {updated} books'))
+            return
+
+        # Пересчитываем диапазонами по id, чтобы не держать блокировку на всей таблице
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Book.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += Book.refresh_review_stats(ids)
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Updated review stats for {updated} books'))
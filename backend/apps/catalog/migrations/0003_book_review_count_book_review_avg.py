@@ -0,0 +1,37 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:11
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def backfill_review_stats(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    Review = apps.get_model('reviews', 'Review')
+    stats = Review.objects.values('book_id').annotate(count=Count('id'), avg=Avg('rating'))
+    for row in stats.iterator():
+        Book.objects.filter(pk=row['book_id']).update(
+            review_count=row['count'],
+            review_avg=round(row['avg'] or 0, 2),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_book_cover_image_book_is_active_book_pages_and_more'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='review_avg',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
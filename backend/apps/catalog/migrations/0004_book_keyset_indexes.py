@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_book_review_count_book_review_avg'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'id'], name='catalog_boo_title_41c535_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='catalog_boo_price_984359_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:20
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+BACKFILL_SQL = """
+UPDATE catalog_book b SET search_vector =
+    setweight(to_tsvector(%(config)s, coalesce(b.title, '')), 'A')
+    || setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(a.first_name || ' ' || a.last_name, ' ')
+        FROM catalog_bookauthors ba JOIN catalog_author a ON a.id = ba.author_id
+        WHERE ba.book_id = b.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s, coalesce((
+        SELECT c.name FROM catalog_category c WHERE c.id = b.category_id
+    ), '')), 'C')
+    || setweight(to_tsvector(%(config)s, coalesce(b.description, '')), 'D')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    # GIN-индекс и tsvector есть только в PostgreSQL; SQLite (dev/test) пропускаем
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS catalog_book_search_vector_gin '
+        'ON catalog_book USING gin (search_vector)'
+    )
+    schema_editor.execute(BACKFILL_SQL, {'config': settings.CATALOG_SEARCH_CONFIG})
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS catalog_book_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:40
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+TRIGRAM_INDEXES = (
+    ('catalog_book_title_trgm', 'catalog_book', 'title'),
+    ('catalog_author_last_name_trgm', 'catalog_author', 'last_name'),
+    ('catalog_author_first_name_trgm', 'catalog_author', 'first_name'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm есть только в PostgreSQL; SQLite (dev/test) пропускаем
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _table, _column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_book_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,9 +1,15 @@
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection, connections, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
 
 class Category(models.Model):
     name = models.CharField(max_length=120, unique=True)
     slug = models.SlugField(max_length=140, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["name"]
@@ -15,6 +21,7 @@ class Category(models.Model):
 class Author(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("first_name", "last_name")
@@ -31,12 +38,17 @@ class Book(models.Model):
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name="books")
     price = models.DecimalField(max_digits=10, decimal_places=2)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    # Денормализованные агрегаты отзывов, поддерживаются сигналами Review
+    review_count = models.PositiveIntegerField(default=0)
+    review_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0)
     pages = models.PositiveIntegerField(null=True, blank=True)
     publication_date = models.DateField(null=True, blank=True)
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # tsvector для полнотекстового поиска (только PostgreSQL), см. refresh_search_vector
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ["title"]
@@ -44,6 +56,9 @@ class Book(models.Model):
             models.Index(fields=['category', 'is_active']),
             models.Index(fields=['price']),
             models.Index(fields=['rating']),
+            # Ключи keyset-пагинации каталога (см. catalog/pagination.py)
+            models.Index(fields=['title', 'id']),
+            models.Index(fields=['price', 'id']),
         ]
 
     def __str__(self) -> str:
@@ -51,9 +66,88 @@ class Book(models.Model):
 
     @property
     def average_rating(self):
-        """Вычисляет средний рейтинг на основе отзывов"""
-        from django.db.models import Avg
-        return self.reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
+        """Средний рейтинг по отзывам (из денормализованного поля review_avg)"""
+        return self.review_avg
+
+    @classmethod
+    def refresh_review_stats(cls, book_ids=None):
+        """Пересчитать review_count/review_avg одним UPDATE.
+
+        Если book_ids не передан, пересчитываются все книги. Обновляются только
+        книги, у которых агрегаты действительно изменились, и только у них
+        обновляется updated_at (агрегаты входят в ETag книги), поэтому сверка
+        без расхождений не сбрасывает валидаторы каталога.
+        Возвращает количество обновлённых строк.
+        """
+        from django.db.models import Avg, Count, OuterRef, Q, Subquery, Value
+        from django.db.models.functions import Coalesce, Now, Round
+        from backend.apps.reviews.models import Review
+
+        reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+        count_sq = reviews.annotate(c=Count('id')).values('c')
+        avg_sq = reviews.annotate(a=Avg('rating')).values('a')
+        avg_field = models.DecimalField(max_digits=3, decimal_places=2)
+
+        def review_count():
+            return Coalesce(Subquery(count_sq, output_field=models.IntegerField()), Value(0))
+
+        def review_avg():
+            # Округление как при записи в поле, иначе 4.3333 никогда не совпадёт с 4.33
+            return Round(
+                Coalesce(Subquery(avg_sq, output_field=avg_field), Value(0), output_field=avg_field), 2,
+                output_field=avg_field,
+            )
+
+        books = cls.objects.all()
+        if book_ids is not None:
+            books = books.filter(pk__in=book_ids)
+        books = books.annotate(new_review_count=review_count(), new_review_avg=review_avg()).filter(
+            ~Q(review_count=models.F('new_review_count')) | ~Q(review_avg=models.F('new_review_avg'))
+        )
+        return books.update(review_count=review_count(), review_avg=review_avg(), updated_at=Now())
+
+    @classmethod
+    def mark_changed(cls, book_ids):
+        """Отметить книги изменёнными после массового UPDATE в обход сигналов.
+
+        Обновляет updated_at (ETag/Last-Modified) и сбрасывает кэш гостевых страниц.
+        """
+        from .cache import bump_catalog_version
+
+        cls.objects.filter(pk__in=book_ids).update(updated_at=timezone.now())
+        bump_catalog_version()
+
+    @classmethod
+    def refresh_search_vector(cls, book_ids=None):
+        """Пересобрать search_vector одним UPDATE (название, авторы, категория, описание).
+
+        Веса: A — название, B — авторы, C — категория, D — описание.
+        На других СУБД (SQLite в dev/test) ничего не делает и возвращает 0.
+        """
+        if connection.vendor != 'postgresql':
+            return 0
+        from django.contrib.postgres.aggregates import StringAgg
+        from django.contrib.postgres.search import SearchVector
+        from django.db.models import OuterRef, Subquery, Value
+        from django.db.models.functions import Concat
+
+        config = settings.CATALOG_SEARCH_CONFIG
+        authors_sq = (
+            BookAuthors.objects.filter(book=OuterRef('pk')).order_by().values('book')
+            .annotate(names=StringAgg(Concat('author__first_name', Value(' '), 'author__last_name'), ' '))
+            .values('names')
+        )
+        category_sq = Category.objects.filter(pk=OuterRef('category_id')).values('name')
+
+        books = cls.objects.all()
+        if book_ids is not None:
+            books = books.filter(pk__in=book_ids)
+        return books.update(search_vector=(
+            SearchVector('title', weight='A', config=config)
+            + SearchVector(Subquery(authors_sq), weight='B', config=config)
+            + SearchVector(Subquery(category_sq), weight='C', config=config)
+            + SearchVector('description', weight='D', config=config)
+        ))
 
 
 class BookAuthors(models.Model):
@@ -64,16 +158,223 @@ class BookAuthors(models.Model):
         unique_together = ("book", "author")
 
 
+class InventoryManager(models.Manager):
+    """Атомарные изменения остатков одним UPDATE, без чтения строки и select_for_update.
+
+    Условие на остаток стоит в WHERE, поэтому параллельные списания не теряются
+    и не уводят stock ниже reserved. Успешно изменённые книги отмечаются через
+    Book.mark_changed (UPDATE не отправляет сигналов).
+    """
+
+    def try_decrement(self, book_id, quantity):
+        """Списать quantity, если свободного товара (stock - reserved) хватает. Возвращает True при успехе"""
+        updated = self.filter(book_id=book_id, stock__gte=models.F('reserved') + quantity).update(
+            stock=models.F('stock') - quantity
+        )
+        if updated:
+            Book.mark_changed([book_id])
+        return bool(updated)
+
+    def increment(self, book_id, quantity):
+        """Добавить quantity на склад; строка остатков создаётся, если её ещё нет"""
+        updated = self.filter(book_id=book_id).update(stock=models.F('stock') + quantity)
+        if not updated:
+            _, created = self.get_or_create(book_id=book_id, defaults={'stock': quantity})
+            if not created:
+                self.filter(book_id=book_id).update(stock=models.F('stock') + quantity)
+        Book.mark_changed([book_id])
+
+    def set_stock(self, book_id, stock):
+        """Установить остаток (инвентаризация), не затрагивая reserved"""
+        if not self.filter(book_id=book_id).update(stock=stock):
+            self.get_or_create(book_id=book_id, defaults={'stock': stock})
+        Book.mark_changed([book_id])
+
+    def bulk_adjust(self, deltas):
+        """Изменить остатки нескольких книг одним UPDATE ... RETURNING.
+
+        deltas — {book_id: delta}. Уменьшение применяется, только если свободного
+        товара хватает; книги без строки остатков не изменяются.
+        Возвращает {book_id: True/False} — применено ли изменение.
+        """
+        deltas = {int(book_id): int(delta) for book_id, delta in deltas.items()}
+        results = {book_id: not delta for book_id, delta in deltas.items()}
+        changes = {book_id: delta for book_id, delta in deltas.items() if delta}
+        if not changes:
+            return results
+
+        conn = connections[self.db]
+        cases, conditions, case_params, condition_params = [], [], [], []
+        for book_id, delta in changes.items():
+            cases.append('WHEN %s THEN %s')
+            case_params += [book_id, delta]
+            if delta > 0:
+                conditions.append('book_id = %s')
+                condition_params.append(book_id)
+            else:
+                conditions.append('(book_id = %s AND stock - reserved >= %s)')
+                condition_params += [book_id, -delta]
+        sql = (
+            f'UPDATE {conn.ops.quote_name(self.model._meta.db_table)} '
+            f'SET stock = stock + CASE book_id {" ".join(cases)} ELSE 0 END '
+            f'WHERE {" OR ".join(conditions)} RETURNING book_id'
+        )
+        with conn.cursor() as cursor:
+            cursor.execute(sql, case_params + condition_params)
+            applied = [row[0] for row in cursor.fetchall()]
+        for book_id in applied:
+            results[book_id] = True
+        if applied:
+            Book.mark_changed(applied)
+        return results
+
+
 class Inventory(models.Model):
     book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name="inventory")
     stock = models.PositiveIntegerField(default=0)
     reserved = models.PositiveIntegerField(default=0)
 
+    objects = InventoryManager()
+
     @property
     def available(self) -> int:
         return max(0, self.stock - self.reserved)
 
 
+class ImportCheckpoint(models.Model):
+    """Импортированный кусок файла import_books: по ним повторный запуск пропускает готовые куски"""
+    source = models.CharField(max_length=500)
+    # Размер и время изменения файла: чужие отметки для изменившегося файла не используются
+    fingerprint = models.CharField(max_length=64)
+    start = models.BigIntegerField()
+    end = models.BigIntegerField()
+    rows = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("source", "fingerprint", "start", "end")
+        ordering = ["source", "start"]
+
+    def __str__(self) -> str:
+        return f"{self.source} [{self.start}, {self.end})"
+
+
+@receiver(post_save, sender=Book)
+def update_search_vector_on_book_save(sender, instance, **kwargs):
+    """Обновить search_vector после изменения книги"""
+    Book.refresh_search_vector([instance.pk])
+
+
+@receiver(post_save, sender=BookAuthors)
+@receiver(post_delete, sender=BookAuthors)
+def update_search_vector_on_authors_change(sender, instance, **kwargs):
+    """Обновить search_vector при изменении списка авторов книги"""
+    Book.refresh_search_vector([instance.book_id])
+
+
+@receiver(post_save, sender=Author)
+def update_search_vector_on_author_rename(sender, instance, created, **kwargs):
+    """Обновить search_vector книг автора при изменении его имени"""
+    if not created:
+        Book.refresh_search_vector(
+            BookAuthors.objects.filter(author=instance).values('book_id')
+        )
+
+
+@receiver(post_save, sender=Category)
+def update_search_vector_on_category_rename(sender, instance, created, **kwargs):
+    """Обновить search_vector книг категории при её переименовании"""
+    if not created:
+        Book.refresh_search_vector(Book.objects.filter(category=instance).values('pk'))
+
+
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+@receiver(post_save, sender=BookAuthors)
+@receiver(post_delete, sender=BookAuthors)
+def touch_book_on_related_change(sender, instance, **kwargs):
+    """Обновить Book.updated_at при изменении остатков или авторов книги (входят в ETag)"""
+    Book.objects.filter(pk=instance.book_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Author)
+def touch_books_on_author_rename(sender, instance, created, **kwargs):
+    """Обновить Book.updated_at книг автора при изменении его имени"""
+    if not created:
+        Book.objects.filter(pk__in=BookAuthors.objects.filter(author=instance).values('book_id')).update(
+            updated_at=timezone.now()
+        )
+
+
+@receiver(post_save, sender=Category)
+def touch_books_on_category_rename(sender, instance, created, **kwargs):
+    """Обновить Book.updated_at книг категории при её переименовании"""
+    if not created:
+        Book.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+def update_suggest_index_on_save(sender, instance, **kwargs):
+    """Обновить in-memory индекс подсказок, если он уже построен в этом процессе.
+
+    Индекс меняется только после коммита транзакции: откаченные изменения в него не попадают.
+    """
+    from .suggest import KIND_AUTHOR, KIND_BOOK, KIND_CATEGORY
+    if sender is Book:
+        kind, label, active = KIND_BOOK, instance.title, instance.is_active
+    elif sender is Author:
+        kind, label, active = KIND_AUTHOR, str(instance).strip(), True
+    else:
+        kind, label, active = KIND_CATEGORY, instance.name, True
+    pk = instance.pk
+
+    def apply():
+        from .suggest import peek_index
+        index = peek_index()
+        if index is None:
+            return
+        if active:
+            index.upsert(kind, pk, label)
+        else:
+            index.remove(kind, pk)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Category)
+def update_suggest_index_on_delete(sender, instance, **kwargs):
+    """Удалить запись из in-memory индекса подсказок после коммита транзакции"""
+    from .suggest import KIND_AUTHOR, KIND_BOOK, KIND_CATEGORY
+    kind = {Book: KIND_BOOK, Author: KIND_AUTHOR, Category: KIND_CATEGORY}[sender]
+    pk = instance.pk
+
+    def apply():
+        from .suggest import peek_index
+        index = peek_index()
+        if index is not None:
+            index.remove(kind, pk)
 
+    transaction.on_commit(apply)
 
 
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=BookAuthors)
+@receiver(post_delete, sender=BookAuthors)
+def invalidate_catalog_pages(sender, **kwargs):
+    """Сбросить кэш гостевых страниц каталога"""
+    from .cache import bump_catalog_version
+    bump_catalog_version()
@@ -0,0 +1,194 @@
+"""Keyset (cursor) пагинация каталога книг.
+
+Страница выбирается условием по паре (поле сортировки, id), а не OFFSET,
+поэтому стоимость любой, даже очень далёкой, страницы — O(page_size).
+Одна и та же логика используется в /api/books/ и в HTML-каталоге.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .search import SEARCH_RANK_FIELD
+
+DEFAULT_ORDERING = "title"
+KEYSET_ORDERING_FIELDS = ("title", "price", "rating", "created_at")
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или не соответствует текущей сортировке"""
+
+
+def encode_cursor(ordering, value, pk, reverse=False):
+    payload = {"o": ordering, "v": value, "id": pk}
+    if reverse:
+        payload["r"] = 1
+    raw = json.dumps(payload, default=_json_default, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return payload["o"], payload["v"], int(payload["id"]), bool(payload.get("r"))
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def resolve_ordering(value, allowed_fields=KEYSET_ORDERING_FIELDS, default=DEFAULT_ORDERING):
+    """Вернуть первое допустимое поле сортировки из параметра ordering ("-price,title")"""
+    for term in (value or "").split(","):
+        term = term.strip()
+        if term.lstrip("-") in allowed_fields:
+            return term
+    return default
+
+
+def ordering_options(queryset, allowed_fields=KEYSET_ORDERING_FIELDS):
+    """Допустимые поля и сортировка по умолчанию для queryset.
+
+    Если queryset прошёл через полнотекстовый поиск (аннотация search_rank),
+    по умолчанию результаты сортируются по релевантности.
+    """
+    if SEARCH_RANK_FIELD in queryset.query.annotations:
+        return tuple(allowed_fields) + (SEARCH_RANK_FIELD,), f"-{SEARCH_RANK_FIELD}"
+    return tuple(allowed_fields), DEFAULT_ORDERING
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=20):
+    """Выбрать страницу queryset по ключу (ordering, id).
+
+    ordering — имя поля, возможно с "-" для убывания. cursor — строка из
+    encode_cursor(); курсор с другой сортировкой считается недействительным.
+    """
+    field = ordering.lstrip("-")
+    descending = ordering.startswith("-")
+    value = pk = None
+    reverse = False
+    if cursor:
+        cursor_ordering, value, pk, reverse = decode_cursor(cursor)
+        if cursor_ordering != ordering:
+            raise InvalidCursor("Cursor does not match ordering")
+
+    # При движении назад выбираем в обратном порядке и потом разворачиваем
+    scan_descending = descending != reverse
+    if scan_descending:
+        queryset = queryset.order_by(f"-{field}", "-id")
+    else:
+        queryset = queryset.order_by(field, "id")
+
+    if cursor:
+        if scan_descending:
+            boundary = Q(**{f"{field}__lte": value}) & (Q(**{f"{field}__lt": value}) | Q(id__lt=pk))
+        else:
+            # field >= value позволяет использовать индекс (field, id) как диапазон
+            boundary = Q(**{f"{field}__gte": value}) & (Q(**{f"{field}__gt": value}) | Q(id__gt=pk))
+        queryset = queryset.filter(boundary)
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, bool(cursor)
+
+    next_cursor = previous_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if has_next:
+            next_cursor = encode_cursor(ordering, getattr(last, field), last.pk)
+        if has_previous:
+            previous_cursor = encode_cursor(ordering, getattr(first, field), first.pk, reverse=True)
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+class KeysetPagination(BasePagination):
+    """DRF-пагинация по ключу (ordering, id) для BookViewSet"""
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        allowed, default = ordering_options(
+            queryset, getattr(view, "ordering_fields", None) or KEYSET_ORDERING_FIELDS
+        )
+        ordering = resolve_ordering(request.query_params.get(self.ordering_query_param), allowed, default)
+        try:
+            self.page = paginate_keyset(
+                queryset,
+                ordering,
+                cursor=request.query_params.get(self.cursor_query_param),
+                page_size=self.get_page_size(request),
+            )
+        except InvalidCursor as exc:
+            raise NotFound(str(exc))
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self._link(self.page.next_cursor)),
+            ("previous", self._link(self.page.previous_cursor)),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
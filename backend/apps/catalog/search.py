@@ -0,0 +1,179 @@
+"""Полнотекстовый и нечёткий поиск по каталогу.
+
+На PostgreSQL поиск идёт по Book.search_vector (GIN-индекс) с ранжированием
+ts_rank и префиксным совпадением последних букв для подсказок при вводе.
+Нечёткий режим (?fuzzy=1) использует pg_trgm и GIN-индексы gin_trgm_ops
+по названиям книг и именам авторов, поэтому находит опечатки.
+На остальных СУБД (SQLite в dev/test) используется прежняя цепочка icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, FloatField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat, Greatest
+from rest_framework import filters
+
+SEARCH_RANK_FIELD = "search_rank"
+# Сколько книг похожих авторов подмешивать в нечёткую выдачу
+FUZZY_AUTHOR_BOOKS_LIMIT = 1000
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def to_prefix_tsquery(text):
+    """Преобразовать пользовательский ввод в raw tsquery: "война ми" -> "война:* & ми:*".
+
+    Возвращает None, если во вводе нет ни одного слова.
+    """
+    tokens = _TOKEN_RE.findall(text or "")
+    if not tokens:
+        return None
+    return " & ".join(f"{token.lower()}:*" for token in tokens)
+
+
+def search_books(queryset, text):
+    """Отфильтровать queryset книг по строке поиска.
+
+    На PostgreSQL добавляет аннотацию search_rank для сортировки по релевантности.
+    """
+    text = (text or "").strip()
+    if not text:
+        return queryset
+
+    if connections[queryset.db].vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        raw_query = to_prefix_tsquery(text)
+        if raw_query is None:
+            return queryset.filter(isbn=text)
+        query = SearchQuery(raw_query, search_type="raw", config=settings.CATALOG_SEARCH_CONFIG)
+        # ts_rank возвращает real, а ранг из курсора пагинации приходит литералом double
+        # precision: без приведения книги с равным рангом на границе страницы терялись
+        # бы или повторялись
+        return queryset.filter(Q(search_vector=query) | Q(isbn=text)).annotate(
+            **{SEARCH_RANK_FIELD: Cast(SearchRank(F("search_vector"), query), FloatField())}
+        )
+
+    return queryset.filter(
+        Q(title__icontains=text) | Q(isbn__icontains=text)
+        | Q(book_authors__author__first_name__icontains=text)
+        | Q(book_authors__author__last_name__icontains=text)
+    ).distinct()
+
+
+def parse_fuzzy_params(params):
+    """Прочитать ?fuzzy= и ?similarity= из GET-параметров.
+
+    Возвращает порог similarity или None, если нечёткий режим не запрошен.
+    Порог не опускается ниже CATALOG_TRGM_INDEX_THRESHOLD: кандидатов отбирает
+    оператор %, и более низкий порог ничего бы не добавил к выдаче.
+    """
+    if params.get("fuzzy", "").lower() not in ("1", "true", "yes", "on"):
+        return None
+    try:
+        threshold = float(params.get("similarity", settings.CATALOG_FUZZY_THRESHOLD))
+    except (TypeError, ValueError):
+        threshold = settings.CATALOG_FUZZY_THRESHOLD
+    return min(max(threshold, settings.CATALOG_TRGM_INDEX_THRESHOLD), 1.0)
+
+
+def fuzzy_search_authors(queryset, text, threshold=None):
+    """Нечёткий поиск авторов по имени/фамилии с сортировкой по похожести.
+
+    Оператор % (pg_trgm.similarity_threshold) отбирает кандидатов по индексу,
+    threshold дополнительно ужесточает отбор по вычисленной similarity.
+    """
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    text = (text or "").strip()
+    if not text:
+        return queryset
+    if threshold is None:
+        threshold = settings.CATALOG_FUZZY_THRESHOLD
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset.filter(Q(first_name__icontains=text) | Q(last_name__icontains=text))
+
+    return queryset.filter(
+        Q(last_name__trigram_similar=text) | Q(first_name__trigram_similar=text)
+    ).annotate(
+        similarity=Greatest(
+            TrigramSimilarity("last_name", text),
+            TrigramSimilarity("first_name", text),
+            TrigramSimilarity(Concat("first_name", Value(" "), "last_name"), text),
+        )
+    ).filter(similarity__gte=threshold).order_by("-similarity", "id")
+
+
+def fuzzy_search_books(queryset, text, threshold=None):
+    """Нечёткий поиск книг по названию и авторам.
+
+    На PostgreSQL похожесть записывается в search_rank, чтобы выдача
+    сортировалась по релевантности тем же keyset-пагинатором.
+    """
+    from django.contrib.postgres.search import TrigramSimilarity
+    from .models import Author, BookAuthors
+
+    text = (text or "").strip()
+    if not text:
+        return queryset
+    if threshold is None:
+        threshold = settings.CATALOG_FUZZY_THRESHOLD
+    if connections[queryset.db].vendor != "postgresql":
+        return search_books(queryset, text)
+
+    def author_similarity():
+        return Greatest(
+            TrigramSimilarity("author__last_name", text),
+            TrigramSimilarity("author__first_name", text),
+        )
+
+    # Авторов и их книг немного по сравнению с каталогом: id книг выбираем заранее,
+    # чтобы условие стало BitmapOr двух индексов, а не EXISTS на каждую строку.
+    # При обрезке до лимита остаются книги самых похожих авторов
+    similar_authors = fuzzy_search_authors(Author.objects.all(), text, threshold)
+    author_book_ids = list(
+        BookAuthors.objects.filter(author__in=similar_authors.values("pk"))
+        .values("book_id")
+        .annotate(similarity=Max(author_similarity()))
+        .order_by("-similarity", "book_id")
+        .values_list("book_id", flat=True)[:FUZZY_AUTHOR_BOOKS_LIMIT]
+    )
+    best_author_similarity = (
+        BookAuthors.objects.filter(book=OuterRef("pk"))
+        .annotate(similarity=author_similarity())
+        .order_by("-similarity")
+        .values("similarity")[:1]
+    )
+    return queryset.annotate(
+        title_similarity=TrigramSimilarity("title", text),
+    ).filter(
+        Q(title__trigram_similar=text, title_similarity__gte=threshold) | Q(pk__in=author_book_ids)
+    ).annotate(
+        # similarity тоже real — приводится к double precision, как в search_books
+        **{SEARCH_RANK_FIELD: Cast(Greatest(
+            F("title_similarity"),
+            Coalesce(Subquery(best_author_similarity, output_field=FloatField()), Value(0.0)),
+        ), FloatField())}
+    )
+
+
+class BookSearchFilter(filters.SearchFilter):
+    """SearchFilter для BookViewSet, работающий через search_books()/fuzzy_search_books()"""
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, "")
+        threshold = parse_fuzzy_params(request.query_params)
+        if threshold is not None:
+            return fuzzy_search_books(queryset, text, threshold)
+        return search_books(queryset, text)
+
+
+class AuthorSearchFilter(filters.SearchFilter):
+    """SearchFilter для AuthorViewSet с нечётким режимом ?fuzzy=1"""
+
+    def filter_queryset(self, request, queryset, view):
+        threshold = parse_fuzzy_params(request.query_params)
+        if threshold is None:
+            return super().filter_queryset(request, queryset, view)
+        return fuzzy_search_authors(queryset, request.query_params.get(self.search_param, ""), threshold)
@@ -34,7 +34,7 @@ class BookSerializer(serializers.ModelSerializer):
     category = CategorySerializer()
     authors = serializers.SerializerMethodField()
     inventory = InventorySerializer(read_only=True)
-    average_rating = serializers.ReadOnlyField()
+    average_rating = serializers.DecimalField(source="review_avg", max_digits=3, decimal_places=2, read_only=True)
 
     class Meta:
         model = Book
@@ -47,6 +47,7 @@ class BookSerializer(serializers.ModelSerializer):
             "price",
             "rating",
             "average_rating",
+            "review_count",
             "pages",
             "publication_date",
             "cover_image",
@@ -58,8 +59,12 @@ class BookSerializer(serializers.ModelSerializer):
         )
 
     def get_authors(self, obj):
-        qs = obj.book_authors.select_related("author")
-        return AuthorSerializer([ba.author for ba in qs], many=True).data
+        if "book_authors" in getattr(obj, "_prefetched_objects_cache", {}):
+            # Кэш, подготовленный BookViewSet.get_queryset через Prefetch
+            book_authors = obj.book_authors.all()
+        else:
+            book_authors = obj.book_authors.select_related("author")
+        return AuthorSerializer([ba.author for ba in book_authors], many=True).data
 
 
 class BookWriteSerializer(serializers.ModelSerializer):
@@ -76,6 +81,8 @@ class BookWriteSerializer(serializers.ModelSerializer):
             BookAuthors.objects.bulk_create([
                 BookAuthors(book=book, author_id=aid) for aid in author_ids
             ])
+            # bulk_create не отправляет сигналы, поэтому обновляем поисковый индекс явно
+            Book.refresh_search_vector([book.pk])
         Inventory.objects.get_or_create(book=book, defaults={"stock": 0, "reserved": 0})
         return book
 
@@ -89,6 +96,7 @@ class BookWriteSerializer(serializers.ModelSerializer):
             BookAuthors.objects.bulk_create([
                 BookAuthors(book=instance, author_id=aid) for aid in author_ids
             ])
+            Book.refresh_search_vector([instance.pk])
         return instance
 
 
@@ -0,0 +1,206 @@
+"""Подсказки для строки поиска из in-memory префиксного индекса.
+
+Индекс — отсортированный список ключей (нормализованные названия книг, имена
+авторов и названия категорий, а также их хвосты с начала каждого слова), по
+которому префикс ищется двоичным поиском за O(log n). Индекс строится лениво
+при первом запросе, обновляется сигналами после коммита изменений Book/Author/Category
+и пересобирается целиком не реже раза в CATALOG_SUGGEST_MAX_AGE секунд
+(сигналы приходят только в тот процесс, где произошло изменение).
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+KIND_BOOK = "book"
+KIND_AUTHOR = "author"
+KIND_CATEGORY = "category"
+
+
+def normalize(text):
+    return " ".join((text or "").casefold().replace("ё", "е").split())
+
+
+def _keys_for(label):
+    """Ключи записи: вся строка и хвосты, начинающиеся с каждого следующего слова"""
+    words = normalize(label).split(" ")
+    return {" ".join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class PrefixIndex:
+    """Отсортированный массив ключей с двоичным поиском по префиксу"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._keys = []  # отсортированные пары (ключ, (kind, id))
+        self._labels = {}  # (kind, id) -> отображаемая строка
+        self._lock = threading.RLock()
+        self.truncated = False
+        self.built_at = None
+        self.build_seconds = 0.0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def build(self, records):
+        """Построить индекс заново из итерируемого (kind, id, label).
+
+        Записи добавляются в порядке итерации, пока не достигнут max_entries.
+        """
+        started = time.perf_counter()
+        keys = []
+        labels = {}
+        truncated = False
+        for kind, pk, label in records:
+            entry_keys = _keys_for(label)
+            if len(keys) + len(entry_keys) > self.max_entries:
+                truncated = True
+                break
+            ref = (kind, pk)
+            labels[ref] = label
+            keys.extend((key, ref) for key in entry_keys)
+        keys.sort()
+        with self._lock:
+            self._keys = keys
+            self._labels = labels
+            self.truncated = truncated
+            self.built_at = time.monotonic()
+            self.build_seconds = time.perf_counter() - started
+        logger.info(
+            "Suggest index built: %s keys, %s records in %.3fs%s",
+            len(keys), len(labels), self.build_seconds, " (truncated)" if truncated else "",
+        )
+
+    def upsert(self, kind, pk, label):
+        with self._lock:
+            self._remove(kind, pk)
+            if not label:
+                return
+            entry_keys = _keys_for(label)
+            if len(self._keys) + len(entry_keys) > self.max_entries:
+                self.truncated = True
+                return
+            ref = (kind, pk)
+            self._labels[ref] = label
+            for key in entry_keys:
+                bisect.insort(self._keys, (key, ref))
+
+    def remove(self, kind, pk):
+        with self._lock:
+            self._remove(kind, pk)
+
+    def _remove(self, kind, pk):
+        ref = (kind, pk)
+        label = self._labels.pop(ref, None)
+        if label is None:
+            return
+        for key in _keys_for(label):
+            i = bisect.bisect_left(self._keys, (key, ref))
+            if i < len(self._keys) and self._keys[i] == (key, ref):
+                del self._keys[i]
+
+    def search(self, prefix, limit=10):
+        """Вернуть до limit записей (kind, id, label), у которых ключ начинается с prefix"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (prefix,))
+            while i < len(self._keys) and len(results) < limit:
+                key, ref = self._keys[i]
+                if not key.startswith(prefix):
+                    break
+                if ref not in seen:
+                    seen.add(ref)
+                    results.append((ref[0], ref[1], self._labels[ref]))
+                i += 1
+        return results
+
+    def stats(self):
+        return {
+            "keys": len(self._keys),
+            "records": len(self._labels),
+            "max_entries": self.max_entries,
+            "truncated": self.truncated,
+            "build_seconds": round(self.build_seconds, 4),
+            "age_seconds": None if self.built_at is None else round(time.monotonic() - self.built_at, 1),
+        }
+
+
+def catalog_records():
+    """Записи для индекса: категории и авторы целиком, затем популярные активные книги"""
+    from .models import Author, Book, Category
+
+    for pk, name in Category.objects.values_list("pk", "name").iterator():
+        yield KIND_CATEGORY, pk, name
+    for pk, first_name, last_name in Author.objects.values_list("pk", "first_name", "last_name").iterator():
+        yield KIND_AUTHOR, pk, f"{first_name} {last_name}".strip()
+    books = Book.objects.filter(is_active=True).order_by("-review_count", "pk").values_list("pk", "title")
+    for pk, title in books.iterator(chunk_size=5000):
+        yield KIND_BOOK, pk, title
+
+
+_index = None
+_index_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def _build_index():
+    index = PrefixIndex(settings.CATALOG_SUGGEST_MAX_ENTRIES)
+    index.build(catalog_records())
+    return index
+
+
+def _rebuild_in_background():
+    global _index
+    from django.db import connection
+    try:
+        fresh = _build_index()
+        with _index_lock:
+            _index = fresh
+    except Exception:
+        logger.exception("Suggest index rebuild failed")
+    finally:
+        # У потока своё соединение с БД — закрываем его сами
+        connection.close()
+        _rebuilding.clear()
+
+
+def get_index():
+    """Вернуть индекс процесса.
+
+    Первый вызов строит индекс синхронно; устаревший индекс продолжает отвечать,
+    пока в фоновом потоке строится новый.
+    """
+    global _index
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _build_index()
+            return _index
+    max_age = settings.CATALOG_SUGGEST_MAX_AGE
+    if max_age and time.monotonic() - index.built_at > max_age:
+        with _index_lock:
+            if _rebuilding.is_set():
+                return index
+            _rebuilding.set()
+        threading.Thread(target=_rebuild_in_background, name="suggest-index-rebuild", daemon=True).start()
+    return index
+
+
+def peek_index():
+    """Индекс процесса, если он уже построен (без построения)"""
+    return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
@@ -1,7 +1,20 @@
+import importlib.util
+import unittest
 from decimal import Decimal
-from django.test import TestCase
-from django.db import IntegrityError
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from django.db import IntegrityError, connection
 from backend.apps.catalog.models import Category, Author, Book, BookAuthors, Inventory
+from backend.apps.catalog.search import fuzzy_search_books, parse_fuzzy_params, to_prefix_tsquery
+from backend.apps.catalog.suggest import PrefixIndex, reset_index
+from backend.apps.reviews.models import Review
+
+User = get_user_model()
 
 
 class TestCategoryModel(TestCase):
@@ -180,3 +193,877 @@ class TestInventoryModel(TestCase):
         with self.assertRaises(IntegrityError):
             Inventory.objects.create(book=self.book, stock=200)
 
+
+class TestBookReviewStats(TestCase):
+    """Тесты для денормализованных агрегатов отзывов"""
+    
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.category = Category.objects.create(name="Художественная литература", slug="fiction")
+        self.book = Book.objects.create(
+            title="Тестовая книга",
+            isbn="978-5-17-555555-5",
+            category=self.category,
+            price=Decimal("100")
+        )
+        self.user1 = User.objects.create_user(username="reader1", password="testpass")
+        self.user2 = User.objects.create_user(username="reader2", password="testpass")
+    
+    def test_review_stats_follow_review_writes(self):
+        """Тест обновления агрегатов при создании, изменении и удалении отзывов"""
+        review = Review.objects.create(user=self.user1, book=self.book, rating=5)
+        Review.objects.create(user=self.user2, book=self.book, rating=2)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.review_count, 2)
+        self.assertEqual(self.book.review_avg, Decimal("3.50"))
+        
+        review.rating = 3
+        review.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.review_avg, Decimal("2.50"))
+        
+        review.delete()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.review_count, 1)
+        self.assertEqual(self.book.average_rating, Decimal("2.00"))
+    
+    def test_average_rating_does_not_query_reviews(self):
+        """Тест, что average_rating читается из поля без запросов к отзывам"""
+        Review.objects.create(user=self.user1, book=self.book, rating=4)
+        book = Book.objects.get(pk=self.book.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(book.average_rating, Decimal("4.00"))
+    
+    def test_refresh_review_stats_command_reconciles_drift(self):
+        """Тест команды пересчёта агрегатов после рассинхронизации"""
+        Review.objects.create(user=self.user1, book=self.book, rating=4)
+        Book.objects.filter(pk=self.book.pk).update(review_count=10, review_avg=Decimal("1.00"))
+        call_command("refresh_review_stats", stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.review_count, 1)
+        self.assertEqual(self.book.review_avg, Decimal("4.00"))
+    
+    def test_refresh_review_stats_skips_unchanged_books(self):
+        """Тест, что сверка без расхождений не трогает книги и их updated_at"""
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        user3 = User.objects.create_user(username="reader3", password="testpass")
+        for user, rating in ((self.user1, 4), (self.user2, 4), (user3, 5)):
+            Review.objects.create(user=user, book=self.book, rating=rating)
+        other = Book.objects.create(title="Без отзывов", isbn="978-5-17-555556-2", category=self.category, price=Decimal("100"))
+        old = timezone.now() - timedelta(days=1)
+        Book.objects.update(updated_at=old)
+        
+        self.assertEqual(Book.refresh_review_stats(), 0)
+        self.assertEqual(set(Book.objects.values_list("updated_at", flat=True)), {old})
+        
+        Book.objects.filter(pk=other.pk).update(review_count=3)
+        self.assertEqual(Book.refresh_review_stats(), 1)
+        self.book.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.book.review_avg, self.book.updated_at), (Decimal("4.33"), old))
+        self.assertEqual(other.review_count, 0)
+        self.assertGreater(other.updated_at, old)
+    
+    def test_review_text_edit_changes_book_etag(self):
+        """Тест, что правка текста отзыва без изменения оценки обновляет updated_at книги"""
+        review = Review.objects.create(user=self.user1, book=self.book, rating=4)
+        self.book.refresh_from_db()
+        before = self.book.updated_at
+        review.text = "Перечитал — всё так же хорошо"
+        review.save()
+        self.book.refresh_from_db()
+        self.assertGreater(self.book.updated_at, before)
+
+
+class TestBookListQueries(TestCase):
+    """Тесты количества запросов при выдаче списка книг через API"""
+    
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Художественная литература", slug="fiction")
+        self.author1 = Author.objects.create(first_name="Лев", last_name="Толстой")
+        self.author2 = Author.objects.create(first_name="Антон", last_name="Чехов")
+    
+    def _create_books(self, count, offset=0):
+        for i in range(offset, offset + count):
+            book = Book.objects.create(
+                title=f"Книга {i:03d}",
+                isbn=f"978-5-17-{i:06d}-0",
+                category=self.category,
+                price=Decimal("100")
+            )
+            BookAuthors.objects.create(book=book, author=self.author1)
+            BookAuthors.objects.create(book=book, author=self.author2)
+            if i % 2 == 0:
+                Inventory.objects.create(book=book, stock=5)
+    
+    def test_book_list_query_count_is_constant(self):
+        """Тест, что число запросов не зависит от количества книг на странице"""
+        # Валидатор ETag (MAX/COUNT), страница книг с остатками, авторы одним prefetch
+        self._create_books(3)
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/books/")
+        self.assertEqual(response.status_code, 200)
+        
+        self._create_books(20, offset=3)
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/books/")
+        self.assertEqual(response.status_code, 200)
+    
+    def test_book_list_uses_prefetched_relations(self):
+        """Тест содержимого авторов и остатков из предзагруженных данных"""
+        self._create_books(2)
+        data = self.client.get("/api/books/").json()
+        books = data["results"] if isinstance(data, dict) else data
+        self.assertEqual(len(books[0]["authors"]), 2)
+        self.assertEqual(books[0]["inventory"]["stock"], 5)
+        self.assertIsNone(books[1]["inventory"])
+
+
+class TestBookKeysetPagination(TestCase):
+    """Тесты keyset-пагинации каталога"""
+    
+    def setUp(self):
+        """Настройка тестовых данных: 25 книг с повторяющимися ценами"""
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Художественная литература", slug="fiction")
+        for i in range(25):
+            Book.objects.create(
+                title=f"Книга {i % 7}",
+                isbn=f"978-5-17-{i:06d}-1",
+                category=self.category,
+                price=Decimal(100 + (i % 5) * 10)
+            )
+    
+    def _walk(self, url):
+        ids = []
+        pages = 0
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(book["id"] for book in data["results"])
+            url = data["next"]
+            pages += 1
+        return ids, pages
+    
+    def test_pages_cover_all_books_without_duplicates(self):
+        """Тест обхода всех страниц при повторяющихся значениях сортировки"""
+        for ordering in ("title", "-title", "price", "-price"):
+            ids, pages = self._walk(f"/api/books/?ordering={ordering}&page_size=4")
+            self.assertEqual(len(ids), 25)
+            self.assertEqual(len(set(ids)), 25)
+            self.assertEqual(pages, 7)
+            expected = list(
+                Book.objects.order_by(ordering, "id" if not ordering.startswith("-") else "-id")
+                .values_list("id", flat=True)
+            )
+            self.assertEqual(ids, expected)
+    
+    def test_previous_link_returns_previous_page(self):
+        """Тест перехода на предыдущую страницу по курсору"""
+        first = self.client.get("/api/books/?ordering=price&page_size=5").json()
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        back = self.client.get(second["previous"]).json()
+        self.assertEqual(
+            [b["id"] for b in back["results"]],
+            [b["id"] for b in first["results"]],
+        )
+        self.assertIsNone(back["previous"])
+    
+    def test_cursor_for_other_ordering_is_rejected(self):
+        """Тест, что курсор другой сортировки не принимается"""
+        first = self.client.get("/api/books/?ordering=price&page_size=5").json()
+        cursor = first["next"].split("cursor=")[1].split("&")[0]
+        response = self.client.get(f"/api/books/?ordering=title&cursor={cursor}")
+        self.assertEqual(response.status_code, 404)
+    
+    def test_web_catalog_is_paginated(self):
+        """Тест ссылок пагинации в HTML-каталоге"""
+        response = self.client.get("/catalog/?ordering=price")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["books"]), 24)
+        self.assertIsNone(response.context["previous_url"])
+        response = self.client.get("/catalog/" + response.context["next_url"])
+        self.assertEqual(len(response.context["books"]), 1)
+        self.assertIsNotNone(response.context["previous_url"])
+
+
+class TestBookSearch(TestCase):
+    """Тесты поиска по каталогу"""
+    
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Роман", slug="roman")
+        self.tolstoy = Author.objects.create(first_name="Лев", last_name="Толстой")
+        self.book = Book.objects.create(
+            title="Война и мир",
+            isbn="978-5-17-100056-9",
+            category=self.category,
+            price=Decimal("899")
+        )
+        BookAuthors.objects.create(book=self.book, author=self.tolstoy)
+        BookAuthors.objects.create(
+            book=self.book, author=Author.objects.create(first_name="Лев", last_name="Толстой-мл")
+        )
+        Book.objects.create(
+            title="Преступление и наказание",
+            isbn="978-5-17-100141-2",
+            category=self.category,
+            price=Decimal("349")
+        )
+    
+    def test_to_prefix_tsquery(self):
+        """Тест построения префиксного tsquery из пользовательского ввода"""
+        self.assertEqual(to_prefix_tsquery("Война  ми"), "война:* & ми:*")
+        self.assertEqual(to_prefix_tsquery("a'b | c"), "a:* & b:* & c:*")
+        self.assertIsNone(to_prefix_tsquery(" & !"))
+    
+    def test_parse_fuzzy_params(self):
+        """Тест разбора параметров нечёткого поиска"""
+        self.assertIsNone(parse_fuzzy_params({}))
+        self.assertEqual(parse_fuzzy_params({"fuzzy": "1"}), 0.3)
+        self.assertEqual(parse_fuzzy_params({"fuzzy": "true", "similarity": "0.5"}), 0.5)
+        self.assertEqual(parse_fuzzy_params({"fuzzy": "1", "similarity": "7"}), 1.0)
+        self.assertEqual(parse_fuzzy_params({"fuzzy": "1", "similarity": "abc"}), 0.3)
+        # Ниже порога оператора % фильтр ничего не добавит — порог поднимается до него
+        self.assertEqual(parse_fuzzy_params({"fuzzy": "1", "similarity": "0.1"}), 0.3)
+        with override_settings(CATALOG_TRGM_INDEX_THRESHOLD=0.1):
+            self.assertEqual(parse_fuzzy_params({"fuzzy": "1", "similarity": "0.1"}), 0.1)
+    
+    @unittest.skipUnless(connection.vendor == "postgresql", "Нечёткий поиск требует pg_trgm")
+    def test_fuzzy_author_books_limit_keeps_most_similar(self):
+        """Тест, что при обрезке книг похожих авторов остаются книги самого похожего"""
+        BookAuthors.objects.filter(book=self.book, author=self.tolstoy).delete()
+        exact = Book.objects.create(title="Детство", isbn="978-5-17-100142-9", category=self.category, price=Decimal("299"))
+        BookAuthors.objects.create(book=exact, author=self.tolstoy)
+        
+        with mock.patch("backend.apps.catalog.search.FUZZY_AUTHOR_BOOKS_LIMIT", 1):
+            found = list(fuzzy_search_books(Book.objects.all(), "Толстой").values_list("pk", flat=True))
+        self.assertEqual(found, [exact.pk])
+    
+    def _page_through(self, params):
+        ids = []
+        response = self.client.get("/api/books/", {**params, "page_size": 2}).json()
+        while True:
+            ids.extend(b["id"] for b in response["results"])
+            if not response["next"]:
+                return ids
+            response = self.client.get(response["next"]).json()
+    
+    def _tied_books(self):
+        return [
+            Book.objects.create(
+                title="Сага о Форсайтах", isbn=f"978-5-17-20000{i}-0", category=self.category, price=Decimal("500")
+            ).pk
+            for i in range(5)
+        ]
+    
+    @unittest.skipUnless(connection.vendor == "postgresql", "Ранжирование требует PostgreSQL")
+    def test_rank_ties_across_page_boundary(self):
+        """Тест, что книги с равным рангом не теряются и не повторяются на границе страниц"""
+        tied = self._tied_books()
+        ids = self._page_through({"search": "сага"})
+        self.assertEqual(sorted(ids), sorted(tied))
+    
+    @unittest.skipUnless(connection.vendor == "postgresql", "Нечёткий поиск требует pg_trgm")
+    def test_fuzzy_similarity_ties_across_page_boundary(self):
+        """Тест, что книги с равной похожестью не теряются и не повторяются на границе страниц"""
+        tied = self._tied_books()
+        ids = self._page_through({"search": "Сага о Форсайтах", "fuzzy": "1"})
+        self.assertEqual(sorted(ids), sorted(tied))
+    
+    def test_author_fuzzy_search_falls_back_on_sqlite(self):
+        """Тест, что ?fuzzy=1 для авторов работает и без pg_trgm"""
+        data = self.client.get("/api/authors/", {"search": "Толст", "fuzzy": "1"}).json()
+        self.assertEqual({a["last_name"] for a in data}, {"Толстой", "Толстой-мл"})
+    
+    def test_api_search_by_author_returns_distinct_books(self):
+        """Тест поиска по автору без дублей от join с авторами"""
+        data = self.client.get("/api/books/", {"search": "Толстой"}).json()
+        self.assertEqual([b["id"] for b in data["results"]], [self.book.id])
+    
+    def test_web_catalog_search(self):
+        """Тест поиска в HTML-каталоге"""
+        response = self.client.get("/catalog/", {"q": "наказание"})
+        self.assertEqual([b.title for b in response.context["books"]], ["Преступление и наказание"])
+
+
+class TestBookSuggest(TestCase):
+    """Тесты подсказок /api/books/suggest/"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        reset_index()
+        self.addCleanup(reset_index)
+        self.category = Category.objects.create(name="Классика", slug="classic")
+        self.author = Author.objects.create(first_name="Лев", last_name="Толстой")
+        self.book = Book.objects.create(
+            title="Война и мир",
+            isbn="978-5-17-090335-2",
+            category=self.category,
+            price=Decimal("599")
+        )
+    
+    def test_prefix_index_search(self):
+        """Тест поиска по префиксу строки и по началу любого слова"""
+        index = PrefixIndex(max_entries=100)
+        index.build([("book", 1, "Война и мир"), ("book", 2, "Мир приключений"), ("author", 1, "Лев Толстой")])
+        # Более короткий совпавший ключ идёт первым
+        self.assertEqual([r[1] for r in index.search("мир")], [1, 2])
+        self.assertEqual(index.search("ТОЛ"), [("author", 1, "Лев Толстой")])
+        self.assertEqual(index.search("мир", limit=1), [("book", 1, "Война и мир")])
+        self.assertEqual(index.search("  "), [])
+    
+    def test_prefix_index_upsert_remove_and_cap(self):
+        """Тест инкрементального обновления и ограничения размера индекса"""
+        index = PrefixIndex(max_entries=3)
+        index.build([("book", 1, "Война и мир"), ("book", 2, "Анна Каренина")])
+        self.assertTrue(index.truncated)
+        self.assertEqual(len(index), 3)
+        index.upsert("book", 1, "Анна")
+        self.assertEqual(index.search("вой"), [])
+        self.assertEqual(index.search("ан"), [("book", 1, "Анна")])
+        index.remove("book", 1)
+        self.assertEqual(len(index), 0)
+    
+    def test_suggest_endpoint(self):
+        """Тест эндпоинта подсказок и обновления индекса сигналами"""
+        data = self.client.get("/api/books/suggest/", {"q": "вой"}).json()
+        self.assertEqual(data["results"], [{"type": "book", "id": self.book.id, "label": "Война и мир"}])
+        
+        self.book.title = "Анна Каренина"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(self.client.get("/api/books/suggest/", {"q": "вой"}).json()["results"], [])
+        labels = [r["label"] for r in self.client.get("/api/books/suggest/", {"q": "к"}).json()["results"]]
+        self.assertEqual(labels, ["Анна Каренина", "Классика"])
+    
+    def test_suggest_index_ignores_rolled_back_changes(self):
+        """Тест, что индекс подсказок не видит изменений откаченной транзакции"""
+        from django.db import transaction
+        
+        self.assertEqual(len(self.client.get("/api/books/suggest/", {"q": "вой"}).json()["results"]), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.book.title = "Анна Каренина"
+                    self.book.save()
+                    Author.objects.create(first_name="Антон", last_name="Чехов")
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+        self.assertEqual(len(self.client.get("/api/books/suggest/", {"q": "вой"}).json()["results"]), 1)
+        self.assertEqual(self.client.get("/api/books/suggest/", {"q": "ан"}).json()["results"], [])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+        self.assertEqual(self.client.get("/api/books/suggest/", {"q": "вой"}).json()["results"], [])
+    
+    def test_suggest_stats_requires_staff(self):
+        """Тест, что метрики индекса доступны только персоналу"""
+        self.assertIn(self.client.get("/api/books/suggest/stats/").status_code, (401, 403))
+        admin = User.objects.create_user(username="admin", password="pass", is_staff=True)
+        self.client.force_authenticate(admin)
+        stats = self.client.get("/api/books/suggest/stats/").json()
+        self.assertEqual(stats["records"], 3)
+
+
+class TestBookFacets(TestCase):
+    """Тесты фасетов каталога"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.classic = Category.objects.create(name="Классика", slug="classic")
+        self.detective = Category.objects.create(name="Детективы", slug="detective")
+        for i, (category, price, rating) in enumerate([
+            (self.classic, "250", "4.5"),
+            (self.classic, "450", "3.2"),
+            (self.classic, "2500", "4.8"),
+            (self.detective, "350", "4.1"),
+        ]):
+            Book.objects.create(
+                title=f"Книга {i}",
+                isbn=f"978-5-00-00000{i}",
+                category=category,
+                price=Decimal(price),
+                rating=Decimal(rating)
+            )
+    
+    def test_facets_in_one_query_ignore_own_filter(self):
+        """Тест, что фасеты считаются одним запросом и не учитывают собственный фильтр"""
+        # Один запрос — проверка категории в django-filter, второй — все фасеты сразу
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/books/facets/", {"category": self.classic.id, "rating__gte": "4"})
+        data = response.json()
+        # Категории: фильтр по рейтингу учитывается, по категории — нет
+        self.assertEqual(
+            {c["slug"]: c["count"] for c in data["categories"]}, {"classic": 2, "detective": 1}
+        )
+        # Цена: учитываются и категория, и рейтинг
+        self.assertEqual([b["count"] for b in data["price"]], [1, 0, 0, 0, 1])
+        # Рейтинг: учитывается только категория
+        self.assertEqual([b["count"] for b in data["rating"]], [2, 3, 3, 3])
+    
+    def test_facets_invalid_filter(self):
+        """Тест, что некорректный фильтр даёт 400, как и в списке книг"""
+        self.assertEqual(self.client.get("/api/books/facets/", {"price__gte": "abc"}).status_code, 400)
+    
+    def test_web_catalog_facets(self):
+        """Тест фасетов в HTML-каталоге"""
+        response = self.client.get("/catalog/", {"category": "detective", "price_min": "300"})
+        self.assertEqual([b.title for b in response.context["books"]], ["Книга 3"])
+        self.assertEqual(
+            {c["slug"]: c["count"] for c in response.context["facets"]["categories"]},
+            {"classic": 2, "detective": 1}
+        )
+        self.assertEqual(response.context["facets"]["price"][1]["url"], "?category=detective&price_min=300&price_max=500")
+    
+    def test_price_facet_counts_match_filter_at_boundary(self):
+        """Тест, что книга с ценой на границе диапазона учтена так же, как её отбирает фильтр по ссылке"""
+        Book.objects.create(
+            title="Книга на границе", isbn="978-5-00-000009", category=self.detective, price=Decimal("500")
+        )
+        response = self.client.get("/catalog/")
+        for bucket in response.context["facets"]["price"]:
+            books = self.client.get("/catalog/" + bucket["url"]).context["books"]
+            self.assertEqual(len(books), bucket["count"], bucket["url"])
+        self.assertEqual([b["count"] for b in response.context["facets"]["price"]], [1, 3, 1, 0, 1])
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestGuestPageCache(TestCase):
+    """Тесты кэша гостевых страниц каталога"""
+    
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Классика", slug="classic")
+        self.book = Book.objects.create(
+            title="Война и мир",
+            isbn="978-5-17-090335-2",
+            category=self.category,
+            price=Decimal("599")
+        )
+    
+    def test_guest_pages_cached_until_catalog_changes(self):
+        """Тест, что повторный запрос гостя не рендерит страницу заново, а изменение книги сбрасывает кэш"""
+        url = f"/books/{self.book.id}/"
+        self.assertContains(self.client.get(url), "599")
+        # Остаётся только проверка updated_at для ETag
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(url), "599")
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.price = Decimal("649")
+            self.book.save()
+        self.assertContains(self.client.get(url), "649")
+    
+    def test_querystring_order_does_not_matter(self):
+        """Тест, что ключ кэша не зависит от порядка параметров"""
+        self.client.get("/catalog/", {"q": "мир", "ordering": "price"})
+        with self.assertNumQueries(0):
+            self.client.get("/catalog/?ordering=price&q=%D0%BC%D0%B8%D1%80")
+    
+    def test_authenticated_user_not_cached(self):
+        """Тест, что авторизованный пользователь получает страницу без кэша"""
+        self.client.get("/catalog/")
+        self.client.force_login(User.objects.create_user(username="buyer", password="pass"))
+        self.assertIn("books", self.client.get("/catalog/").context)
+
+
+class TestConditionalGet(TestCase):
+    """Тесты ETag / Last-Modified для API каталога и страницы книги"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Классика", slug="classic")
+        self.author = Author.objects.create(first_name="Лев", last_name="Толстой")
+        self.book = Book.objects.create(
+            title="Война и мир",
+            isbn="978-5-17-090335-2",
+            category=self.category,
+            price=Decimal("599")
+        )
+        BookAuthors.objects.create(book=self.book, author=self.author)
+    
+    def test_book_detail_not_modified_skips_serializer(self):
+        """Тест, что при совпавшем ETag сериализатор книги не вызывается"""
+        url = f"/api/books/{self.book.id}/"
+        response = self.client.get(url)
+        self.assertTrue(response.has_header("Last-Modified"))
+        etag = response["ETag"]
+        
+        with mock.patch("backend.apps.catalog.serializers.BookSerializer.to_representation") as to_representation:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        to_representation.assert_not_called()
+    
+    def test_book_list_not_modified_until_related_change(self):
+        """Тест 304 для списка и нового ETag после изменения остатков книги"""
+        etag = self.client.get("/api/books/")["ETag"]
+        with mock.patch("backend.apps.catalog.serializers.BookSerializer.to_representation") as to_representation:
+            response = self.client.get("/api/books/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        to_representation.assert_not_called()
+        
+        Inventory.objects.create(book=self.book, stock=3)
+        response = self.client.get("/api/books/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["inventory"]["stock"], 3)
+    
+    def test_author_and_category_lists(self):
+        """Тест 304 по If-Modified-Since для авторов и сброса ETag при переименовании категории"""
+        response = self.client.get("/api/authors/")
+        response = self.client.get("/api/authors/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+        
+        etag = self.client.get("/api/categories/")["ETag"]
+        self.category.name = "Русская классика"
+        self.category.save()
+        self.assertEqual(self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_web_book_detail_etag_depends_on_user(self):
+        """Тест, что ETag HTML-страницы книги различается для гостя и покупателя"""
+        url = f"/books/{self.book.id}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        self.client.force_login(User.objects.create_user(username="buyer", password="pass"))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class TestInventoryManager(TestCase):
+    """Тесты атомарных изменений остатков"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name="Классика", slug="classic")
+        self.books = [
+            Book.objects.create(
+                title=f"Книга {i}",
+                isbn=f"978-5-17-10000{i}",
+                category=self.category,
+                price=Decimal("100")
+            )
+            for i in range(3)
+        ]
+        Inventory.objects.create(book=self.books[0], stock=5, reserved=2)
+        Inventory.objects.create(book=self.books[1], stock=1)
+    
+    def _stock(self, book):
+        return Inventory.objects.get(book=book).stock
+    
+    def test_try_decrement_respects_reserved(self):
+        """Тест, что списание не трогает зарезервированный товар"""
+        book = self.books[0]
+        with self.assertNumQueries(2):  # UPDATE остатка + updated_at книги
+            self.assertTrue(Inventory.objects.try_decrement(book.id, 3))
+        self.assertFalse(Inventory.objects.try_decrement(book.id, 1))
+        self.assertFalse(Inventory.objects.try_decrement(self.books[2].id, 1))
+        self.assertEqual(self._stock(book), 2)
+    
+    def test_increment_and_set_stock(self):
+        """Тест пополнения (в том числе без строки остатков) и инвентаризации"""
+        Inventory.objects.increment(self.books[2].id, 4)
+        Inventory.objects.increment(self.books[2].id, 1)
+        self.assertEqual(self._stock(self.books[2]), 5)
+        
+        Inventory.objects.set_stock(self.books[0].id, 10)
+        inventory = Inventory.objects.get(book=self.books[0])
+        self.assertEqual((inventory.stock, inventory.reserved), (10, 2))
+    
+    def test_bulk_adjust_reports_each_row(self):
+        """Тест, что bulk_adjust меняет остатки одним запросом и сообщает результат по каждой книге"""
+        with self.assertNumQueries(2):  # UPDATE ... RETURNING + updated_at книг
+            result = Inventory.objects.bulk_adjust({
+                self.books[0].id: -3, self.books[1].id: -2, self.books[2].id: 1
+            })
+        self.assertEqual(result, {self.books[0].id: True, self.books[1].id: False, self.books[2].id: False})
+        self.assertEqual(self._stock(self.books[0]), 2)
+        self.assertEqual(self._stock(self.books[1]), 1)
+        self.assertEqual(Inventory.objects.bulk_adjust({self.books[1].id: 0}), {self.books[1].id: True})
+
+
+class TestImportBooks(TestCase):
+    """Тесты пакетного импорта книг (import_books)"""
+    
+    HEADER = "ID,Title,ISBN,Category,Authors,Price,Rating,Pages,Publication Date,Active,Stock,Reserved\n"
+    
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.category = Category.objects.create(name="Фантастика", slug="sci-fi")
+        self.author = Author.objects.create(first_name="Айзек", last_name="Азимов")
+        self.book = Book.objects.create(title="Я, робот", isbn="978-1", category=self.category, price=Decimal("300"))
+        BookAuthors.objects.create(book=self.book, author=self.author)
+    
+    def _write_feed(self, content):
+        import os
+        import shutil
+        import tempfile
+        
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", encoding="utf-8", newline="", delete=False) as file:
+            file.write(self.HEADER + content)
+        self.addCleanup(os.remove, file.name)
+        self.addCleanup(shutil.rmtree, f"{file.name}.errors", ignore_errors=True)
+        return file.name
+    
+    def _import(self, content, *args):
+        path = content if content.endswith(".csv") else self._write_feed(content)
+        out = StringIO()
+        call_command("import_books", path, "--skip-header", *args, stdout=out)
+        return out.getvalue()
+    
+    def test_import_creates_and_updates_in_batches(self):
+        """Тест создания и обновления книг, категорий и связей с авторами"""
+        output = self._import(
+            ',"Я, робот",978-1,Фантастика,"Айзек Азимов, Роберт Хайнлайн",350.50,4.5,250,,true,5,0\n'
+            ',Дюна,978-2,Новая категория,Фрэнк Герберт,500,,,,1,0,0\n'
+            ',Без авторов,978-3,Фантастика,,100,,,,no,0,0\n',
+            "--batch-size", "2"
+        )
+        self.assertIn("Import completed: 2 created, 1 updated", output)
+        self.assertIn("rows/s", output)
+        
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.price, self.book.pages), (Decimal("350.50"), 250))
+        self.assertEqual(
+            sorted(str(link.author) for link in self.book.book_authors.all()),
+            ["Айзек Азимов", "Роберт Хайнлайн"]
+        )
+        dune = Book.objects.get(isbn="978-2")
+        self.assertEqual(dune.category.name, "Новая категория")
+        self.assertTrue(dune.is_active)
+        self.assertEqual(dune.book_authors.get().author.last_name, "Герберт")
+        self.assertFalse(Book.objects.get(isbn="978-3").is_active)
+        
+        # Повторный импорт заменяет авторов и не плодит категории и авторов
+        output = self._import(',"Я, робот",978-1,Фантастика,Роберт Хайнлайн,350.50,4.5,250,,true,5,0\n')
+        self.assertIn("0 created, 1 updated", output)
+        self.assertEqual(self.book.book_authors.get().author.first_name, "Роберт")
+        self.assertEqual(Author.objects.count(), 3)
+        self.assertEqual(Category.objects.count(), 2)
+    
+    def test_batch_query_count_does_not_depend_on_rows(self):
+        """Тест, что пачка пишется фиксированным числом запросов"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from backend.apps.catalog.importer import BookImporter
+        
+        def rows(start, count):
+            return [
+                (i, ["", f"Книга {i}", f"isbn-{i}", f"Категория {start + i % 3}", f"Автор {i}, Айзек Азимов", "100", "", "", "", "1", "0"])
+                for i in range(start, start + count)
+            ]
+        
+        importer = BookImporter()
+        with CaptureQueriesContext(connection) as small:
+            importer.import_rows(rows(0, 5))
+        with CaptureQueriesContext(connection) as large:
+            importer.import_rows(rows(100, 50))
+        self.assertEqual(len(small), len(large))
+        self.assertEqual((importer.stats.created, importer.stats.updated), (55, 0))
+        self.assertEqual(BookAuthors.objects.filter(author=self.author).count(), 56)
+    
+    def test_dry_run_and_row_errors(self):
+        """Тест пробного запуска и ошибок в отдельных строках"""
+        content = (
+            ',Новая,978-9,Фантастика,,100,,,,1,0,0\n'
+            ',Без ISBN,,Фантастика,,100,,,,1,0,0\n'
+            ',Плохая цена,978-8,Фантастика,,abc,,,,1,0,0\n'
+            ',Короткая строка,978-7\n'
+        )
+        output = self._import(content, "--dry-run")
+        self.assertIn("Dry run completed: 1 created, 0 updated", output)
+        self.assertIn("Errors (3) are written to:", output)
+        error_file = output.strip().splitlines()[-1].strip()
+        with open(error_file, encoding="utf-8") as file:
+            errors = file.read().splitlines()
+        self.assertEqual(len(errors), 3)
+        self.assertIn("Row 2: ISBN is required", errors)
+        self.assertFalse(Book.objects.filter(isbn="978-9").exists())
+        
+        output = self._import(content)
+        self.assertIn("Import completed: 1 created, 0 updated", output)
+        self.assertTrue(Book.objects.filter(isbn="978-9").exists())
+    
+    def test_split_file_keeps_quoted_newlines(self):
+        """Тест разбиения файла на куски по границам строк CSV"""
+        import csv
+        from backend.apps.catalog.importer import read_chunk, split_file
+        
+        path = self._write_feed(
+            ',"Многострочное\nназвание",978-1,Фантастика,,100,,,,1,0,0\n'
+            + "".join(f",Книга {i},isbn-{i},Фантастика,,100,,,,1,0,0\n" for i in range(20))
+        )
+        chunks = split_file(path, chunk_size=100, skip_header=True)
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(chunks[0].start, len(self.HEADER))
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(previous.end, chunk.start)
+        
+        rows = [numbered for chunk in chunks for numbered in read_chunk(path, chunk)]
+        with open(path, encoding="utf-8", newline="") as file:
+            expected = list(csv.reader(file))[1:]
+        self.assertEqual([row for _, row in rows], expected)
+        # Номера строк — как у построчного чтения файла (многострочная запись занимает две)
+        self.assertEqual([row_num for row_num, _ in rows[:3]], [1, 3, 4])
+    
+    def test_failed_chunk_is_resumed_on_rerun(self):
+        """Тест продолжения импорта с кусков, не завершённых прошлым запуском"""
+        from django.core.management.base import CommandError
+        from backend.apps.catalog.importer import BookImporter
+        from backend.apps.catalog.models import ImportCheckpoint
+        
+        path = self._write_feed("".join(
+            f",Книга {i},isbn-{i},Фантастика,Айзек Азимов,100,,,,1,0,0\n" for i in range(6)
+        ))
+        import_rows = BookImporter.import_rows
+        
+        def failing_import_rows(importer, rows):
+            if any(row[2] == "isbn-4" for _, row in rows):
+                raise UnicodeDecodeError("utf-8", b"", 0, 1, "bad byte")
+            return import_rows(importer, rows)
+        
+        with mock.patch.object(BookImporter, "import_rows", failing_import_rows):
+            with self.assertRaisesMessage(CommandError, "run the command again to resume"):
+                self._import(path, "--chunk-size", "100")
+        self.assertFalse(Book.objects.filter(isbn="isbn-4").exists())
+        done = ImportCheckpoint.objects.count()
+        self.assertGreater(done, 0)
+        
+        with mock.patch.object(BookImporter, "import_rows", autospec=True, side_effect=import_rows) as spy:
+            output = self._import(path, "--chunk-size", "100")
+        self.assertIn(f"Resumed: {done} of", output)
+        imported = {row[2] for call in spy.call_args_list for _, row in call.args[1]}
+        self.assertIn("isbn-4", imported)
+        self.assertNotIn("isbn-0", imported)
+        self.assertEqual(Book.objects.filter(isbn__startswith="isbn-").count(), 6)
+        # Импорт завершён — отметки больше не нужны
+        self.assertFalse(ImportCheckpoint.objects.exists())
+    
+    def test_retried_chunk_rewrites_its_error_file(self):
+        """Тест, что повторный импорт куска заменяет его файл ошибок, а не дописывает в него"""
+        from django.db import DatabaseError
+        from backend.apps.catalog.importer import BookImporter, import_file
+        
+        path = self._write_feed(
+            ',Без ISBN,,Фантастика,,100,,,,1,0,0\n'
+            ',Новая,978-9,Фантастика,,100,,,,1,0,0\n'
+        )
+        
+        def read_errors(result):
+            self.assertEqual(len(result.error_files), 1)
+            self.assertTrue(result.error_files[0].endswith(f"chunk-{result.chunks[0].start}.log"))
+            with open(result.error_files[0], encoding="utf-8") as file:
+                return file.read().splitlines()
+        
+        with mock.patch.object(BookImporter, "_save_books", side_effect=DatabaseError("deadlock")):
+            for _ in range(2):
+                result = import_file(path, skip_header=True)
+                self.assertEqual(len(result.failed), 1)
+                self.assertEqual(len(read_errors(result)), 2)
+        
+        result = import_file(path, skip_header=True)
+        self.assertEqual(result.failed, [])
+        self.assertEqual(read_errors(result), ["Row 1: ISBN is required"])
+
+
+class TestExportBooks(TestCase):
+    """Тесты выгрузки каталога (export_books)"""
+    
+    def setUp(self):
+        """Настройка тестовых данных"""
+        import shutil
+        import tempfile
+        
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.category = Category.objects.create(name="Фантастика", slug="sci-fi")
+        self.author = Author.objects.create(first_name="Айзек", last_name="Азимов")
+        self.book = Book.objects.create(title="Я, робот", isbn="978-1", category=self.category, price=Decimal("300"), pages=250)
+        BookAuthors.objects.create(book=self.book, author=self.author)
+        Inventory.objects.create(book=self.book, stock=5, reserved=1)
+        self.other = Book.objects.create(title="Дюна", isbn="978-2", category=self.category, price=Decimal("500"))
+    
+    def _export(self, name, *args):
+        import os
+        
+        path = os.path.join(self.dir, name)
+        out = StringIO()
+        call_command("export_books", "--output", path, *args, stdout=out)
+        return path, out.getvalue()
+    
+    def test_csv_export(self):
+        """Тест выгрузки в CSV в формате import_books"""
+        path, output = self._export("books.csv")
+        self.assertIn("Successfully exported 2 books", output)
+        with open(path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        self.assertEqual(lines[0], "ID,Title,ISBN,Category,Authors,Price,Rating,Pages,Publication Date,Active,Stock,Reserved")
+        self.assertEqual(lines[1], f'{self.book.pk},"Я, робот",978-1,Фантастика,Айзек Азимов,300.00,0.00,250,,True,5,1')
+        self.assertEqual(lines[2], f"{self.other.pk},Дюна,978-2,Фантастика,,500.00,0.00,,,True,0,0")
+    
+    def test_query_count_does_not_depend_on_books(self):
+        """Тест, что книги, авторы и остатки читаются фиксированным числом запросов"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as small:
+            self._export("small.csv")
+        for i in range(20):
+            book = Book.objects.create(title=f"Книга {i}", isbn=f"isbn-{i}", category=self.category, price=Decimal("100"))
+            BookAuthors.objects.create(book=book, author=self.author)
+            Inventory.objects.create(book=book, stock=i)
+        with CaptureQueriesContext(connection) as large:
+            path, output = self._export("large.csv")
+        self.assertIn("Successfully exported 22 books", output)
+        self.assertEqual(len(small), len(large))
+    
+    def test_incremental_compressed_jsonl(self):
+        """Тест инкрементальной выгрузки в сжатый JSON Lines"""
+        import gzip
+        import json
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        since = timezone.now() - timedelta(hours=1)
+        Book.objects.filter(pk=self.other.pk).update(updated_at=since - timedelta(days=1))
+        
+        path, output = self._export("books.jsonl.gz", "--format", "jsonl", "--compress", "--since", since.isoformat())
+        self.assertIn("Successfully exported 1 books", output)
+        self.assertIn("Next incremental export: --since ", output)
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual(records, [{
+            "id": self.book.pk, "title": "Я, робот", "isbn": "978-1", "category": "Фантастика",
+            "authors": "Айзек Азимов", "price": "300.00", "rating": "0.00", "pages": 250,
+            "publication_date": None, "is_active": True, "stock": 5, "reserved": 1,
+        }])
+        
+        # Дата без времени — с начала дня
+        path, output = self._export("all.jsonl", "--format", "jsonl", "--since", "2000-01-01")
+        self.assertIn("Successfully exported 2 books", output)
+    
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "Выгрузка в Parquet требует pyarrow")
+    def test_parquet_column_null_in_first_batch(self):
+        """Тест выгрузки в Parquet, когда колонка целиком пуста в первой группе строк"""
+        from datetime import date
+        import pyarrow.parquet as pq
+        
+        Book.objects.filter(pk=self.other.pk).update(publication_date=date(1965, 8, 1))
+        with mock.patch("backend.apps.core.file_export.PROGRESS_EVERY", 1):
+            path, output = self._export("books.parquet", "--format", "parquet")
+        self.assertIn("Successfully exported 2 books", output)
+        table = pq.read_table(path)
+        self.assertEqual(table.column("publication_date").to_pylist(), [None, date(1965, 8, 1)])
+        self.assertEqual(table.column("pages").to_pylist(), [250, None])
+        self.assertEqual(table.column("price").to_pylist(), [Decimal("300"), Decimal("500")])
+    
+    def test_invalid_since(self):
+        """Тест неверного значения --since"""
+        from django.core.management.base import CommandError
+        
+        with self.assertRaisesMessage(CommandError, "Invalid --since value"):
+            self._export("books.csv", "--since", "вчера")
@@ -1,7 +1,16 @@
+from django.db.models import Prefetch
+from django_filters import utils as filter_utils
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, permissions, viewsets
-
-from .models import Category, Author, Book
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .conditional import ConditionalGetMixin
+from .facets import catalog_facets, facet_filters
+from .models import Category, Author, Book, BookAuthors
+from .pagination import KeysetPagination
+from .search import AuthorSearchFilter, BookSearchFilter
+from .suggest import get_index
 from .serializers import (
     CategorySerializer,
     AuthorSerializer,
@@ -17,7 +26,7 @@ class ReadOnlyPermission(permissions.BasePermission):
         return request.user and request.user.is_staff
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [ReadOnlyPermission]
@@ -26,32 +35,77 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ["name"]
 
 
-class AuthorViewSet(viewsets.ModelViewSet):
+class AuthorViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
     permission_classes = [ReadOnlyPermission]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [AuthorSearchFilter, filters.OrderingFilter]
     search_fields = ["first_name", "last_name"]
     ordering_fields = ["last_name", "first_name"]
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Book.objects.select_related("category").all()
     permission_classes = [ReadOnlyPermission]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, filters.OrderingFilter]
     filterset_fields = {
         "category": ["exact"],
         "price": ["gte", "lte"],
         "rating": ["gte", "lte"],
     }
-    search_fields = ["title", "isbn", "book_authors__author__first_name", "book_authors__author__last_name"]
     ordering_fields = ["title", "price", "rating", "created_at"]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve"):
+            # Авторы и остатки загружаются пачкой, а не отдельным запросом на каждую книгу
+            queryset = queryset.select_related("inventory").prefetch_related(
+                Prefetch("book_authors", queryset=BookAuthors.objects.select_related("author"))
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ("create", "update", "partial_update"):
             return BookWriteSerializer
         return BookSerializer
 
+    @action(detail=False, methods=["get"], pagination_class=None, filter_backends=[BookSearchFilter])
+    def facets(self, request):
+        """Фасеты (категории, цена, рейтинг) для тех же параметров поиска и фильтров, что у списка"""
+        queryset = self.filter_queryset(self.get_queryset())
+        filterset = DjangoFilterBackend().get_filterset(request, queryset, self)
+        if not filterset.is_valid():
+            raise filter_utils.translate_validation(filterset.errors)
+        data = filterset.form.cleaned_data
+        filters = facet_filters(
+            category=data.get("category"),
+            price_min=data.get("price__gte"),
+            price_max=data.get("price__lte"),
+            rating_min=data.get("rating__gte"),
+            rating_max=data.get("rating__lte"),
+        )
+        return Response(catalog_facets(queryset, filters))
+
+    @action(detail=False, methods=["get"], pagination_class=None, filter_backends=[])
+    def suggest(self, request):
+        """Подсказки для строки поиска: книги, авторы и категории по префиксу"""
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 10)), 20))
+        except ValueError:
+            limit = 10
+        query = request.query_params.get("q", "")
+        results = [
+            {"type": kind, "id": pk, "label": label}
+            for kind, pk, label in get_index().search(query, limit)
+        ]
+        return Response({"query": query, "results": results})
+
+    @action(detail=False, methods=["get"], url_path="suggest/stats", permission_classes=[permissions.IsAdminUser])
+    def suggest_stats(self, request):
+        """Размер и время построения индекса подсказок этого процесса"""
+        return Response(get_index().stats())
+
 
 
 
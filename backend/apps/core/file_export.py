@@ -0,0 +1,103 @@
+"""Запись выгрузок в файлы: CSV, JSON Lines и Parquet.
+
+Писатели принимают итератор строк (первая строка — заголовок) и пишут его
+построчно или группами по PROGRESS_EVERY строк, поэтому память процесса не
+зависит от размера выгрузки. Каждый возвращает число записанных строк без
+заголовка и вызывает progress(n) каждые PROGRESS_EVERY строк.
+"""
+import csv
+import gzip
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Как часто (в строках) сообщать о прогрессе записи файла
+PROGRESS_EVERY = 10_000
+
+
+def _open_text(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_csv(rows, path, progress=None, compress=False):
+    """Записать строки в CSV (compress=True — сжатый gzip)"""
+    written = -1
+    with _open_text(path, compress) as file:
+        writer = csv.writer(file)
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+            if progress and written and written % PROGRESS_EVERY == 0:
+                progress(written)
+    return max(written, 0)
+
+
+def write_csv_gz(rows, path, progress=None):
+    """Записать строки в CSV, сжатый gzip"""
+    return write_csv(rows, path, progress, compress=True)
+
+
+def write_jsonl(rows, path, progress=None, compress=False):
+    """Записать строки в JSON Lines: объект на строку, ключи — из заголовка"""
+    rows = iter(rows)
+    header = next(rows)
+    written = 0
+    with _open_text(path, compress) as file:
+        for row in rows:
+            file.write(json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder, ensure_ascii=False))
+            file.write('\n')
+            written += 1
+            if progress and written % PROGRESS_EVERY == 0:
+                progress(written)
+    return written
+
+
+def _parquet_schema(pa, header, types):
+    """Схема Parquet по заголовку и типам колонок из PARQUET_TYPES.
+
+    Типы задаются явно, а не выводятся по данным: колонка, пустая в первой
+    группе строк, иначе получила бы не тот тип, и следующие группы не записались бы.
+    Decimal хранится с максимальной точностью, чтобы влезли и большие суммы.
+    """
+    if len(types) != len(header):
+        raise ValueError(f'Parquet: {len(types)} column types for {len(header)} columns')
+    factories = {
+        'int': pa.int64,
+        'str': pa.string,
+        'decimal': lambda: pa.decimal128(38, 9),
+        'bool': pa.bool_,
+        'date': pa.date32,
+    }
+    return pa.schema([pa.field(name, factories[type_name]()) for name, type_name in zip(header, types)])
+
+
+def write_parquet(rows, path, progress=None, compress=False, types=()):
+    """Записать строки табличного отчёта в Parquet.
+
+    Нужен pyarrow (необязательная зависимость). types — типы колонок в порядке
+    заголовка ('int', 'str', 'decimal', 'bool', 'date'); любое значение может
+    быть NULL. Файл пишется группами по PROGRESS_EVERY строк. Колонки Parquet
+    сжаты всегда (snappy), compress=True выбирает более плотный zstd.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = iter(rows)
+    header = next(rows)
+    schema = _parquet_schema(pa, header, types)
+    written = 0
+    with pq.ParquetWriter(path, schema, compression='zstd' if compress else 'snappy') as writer:
+        while True:
+            # Пустые строки — это заполнители CSV, в Parquet это NULL
+            batch = [[None if value == '' else value for value in row] for row in islice(rows, PROGRESS_EVERY)]
+            columns = {name: [row[i] for row in batch] for i, name in enumerate(header)}
+            writer.write_table(pa.table(columns, schema=schema))
+            written += len(batch)
+            if len(batch) < PROGRESS_EVERY:
+                break
+            if progress:
+                progress(written)
+    return written
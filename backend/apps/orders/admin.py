@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cart, CartItem, Order, OrderItem
+from .models import Cart, CartItem, Order, OrderItem, StockHold
 
 
 class CartItemInline(admin.TabularInline):
@@ -13,6 +13,13 @@ class CartAdmin(admin.ModelAdmin):
     inlines = [CartItemInline]
 
 
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ("id", "cart", "book", "quantity", "expires_at")
+    list_filter = ("expires_at",)
+    raw_id_fields = ("cart", "book")
+
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
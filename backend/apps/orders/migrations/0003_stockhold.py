@@ -0,0 +1,29 @@
+# Generated by Django 4.2.14 on 2026-10-18 06:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_category_author_updated_at'),
+        ('orders', '0002_alter_order_options_order_notes_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='catalog.book')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='orders.cart')),
+            ],
+            options={
+                'unique_together': {('cart', 'book')},
+            },
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 
 
 class Cart(models.Model):
@@ -21,6 +22,25 @@ class CartItem(models.Model):
         unique_together = ("cart", "book")
 
 
+class StockHold(models.Model):
+    """Временный резерв товара под позицию корзины, учтённый в Inventory.reserved.
+
+    Создаётся и меняется только через orders.reservations, истёкшие резервы
+    снимает периодическая задача release_expired_holds.
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='holds')
+    book = models.ForeignKey('catalog.Book', on_delete=models.CASCADE, related_name='stock_holds')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("cart", "book")
+
+    def __str__(self) -> str:
+        return f"Hold {self.quantity} x book #{self.book_id} for cart #{self.cart_id}"
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ("processing", "Обрабатывается"),
@@ -49,6 +69,28 @@ class Order(models.Model):
     def __str__(self) -> str:
         return f"Order #{self.pk} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус из БД, чтобы сигналы видели его изменение
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+
+class IdempotencyKey(models.Model):
+    """Ключ идемпотентности оформления заказа (Idempotency-Key / скрытый токен формы).
+
+    Хранится sha256 ключа; повтор запроса с тем же ключом возвращает уже созданный
+    заказ. Записи старше IDEMPOTENCY_KEY_TTL удаляет задача purge_idempotency_keys.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key_hash = models.CharField(max_length=64)
+    order = models.ForeignKey('Order', on_delete=models.CASCADE, null=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ("user", "key_hash")
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -57,21 +99,41 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField()
 
 
+def _delivered_order_changed(order, sign):
+    """Учесть изменение набора доставленных заказов в аналитике.
+
+    SalesStats и CustomerLifetime обновляются сразу дельтой в текущей транзакции,
+    остальная дневная статистика пересчитывается в фоне.
+    """
+    from django.db import transaction
+    from backend.apps.analytics.models import CustomerLifetime, SalesStats
+    from backend.apps.analytics.tasks import schedule_daily_rollup
+
+    SalesStats.apply_order_delta(order, sign)
+    CustomerLifetime.apply_order_delta(order, sign)
+    date = timezone.localdate(order.created_at)
+    transaction.on_commit(lambda: schedule_daily_rollup(date))
+
+
 @receiver(post_save, sender=Order)
 def update_sales_stats_on_order_change(sender, instance, created, **kwargs):
-    """Обновить статистику продаж при изменении статуса заказа"""
-    if instance.status == 'delivered':
-        try:
-            from backend.apps.analytics.models import SalesStats, TopSellingBook, CustomerStats
-            from django.utils import timezone
-            
-            # Обновляем статистику за день
-            SalesStats.update_daily_stats(instance.created_at.date())
-            TopSellingBook.update_daily_top_books(instance.created_at.date())
-            CustomerStats.update_daily_customer_stats(instance.created_at.date())
-        except Exception as e:
-            # Логируем ошибку, но не прерываем выполнение
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Ошибка при обновлении статистики продаж: {e}")
-
+    """Обновить статистику продаж, если заказ стал доставленным или перестал им быть"""
+    previous = getattr(instance, "_loaded_status", None)
+    instance._loaded_status = instance.status
+    if instance.status == previous or "delivered" not in (instance.status, previous):
+        return
+    _delivered_order_changed(instance, 1 if instance.status == "delivered" else -1)
+
+
+@receiver(pre_delete, sender=Order)
+def update_sales_stats_on_order_delete(sender, instance, **kwargs):
+    """Исключить удаляемый доставленный заказ из статистики (позиции ещё не удалены)"""
+    if getattr(instance, "_loaded_status", instance.status) == "delivered":
+        _delivered_order_changed(instance, -1)
+
+
+@receiver(pre_delete, sender=Cart)
+def release_holds_on_cart_delete(sender, instance, **kwargs):
+    """Вернуть резервы корзины в Inventory до каскадного удаления StockHold"""
+    from .reservations import release_cart_holds
+    release_cart_holds(instance)
@@ -0,0 +1,133 @@
+"""Резервирование товара под корзины.
+
+Каждая позиция корзины держит StockHold на срок CART_HOLD_TTL; количество
+всех активных резервов учтено в Inventory.reserved, поэтому
+Inventory.available = stock - reserved — это то, что ещё можно положить
+в корзину. Резерв ставится условным UPDATE
+(reserved = reserved + n WHERE stock - reserved >= n), без предварительного
+чтения остатка, и не может «перепродать» товар при параллельных запросах.
+При оформлении заказа резерв превращается в списание stock (orders.services),
+истёкшие резервы снимает задача release_expired_holds.
+
+Порядок блокировок везде один: StockHold, затем Inventory по возрастанию book_id.
+reserved входит в карточку книги (available) и в ответ API, которые кэшируются
+для гостей и проверяются по ETag/Last-Modified, поэтому каждая операция с
+резервами, изменившая reserved, один раз отмечает затронутые книги изменёнными
+(Book.mark_changed). Продление срока резерва без изменения количества их не трогает.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from backend.apps.catalog.models import Book, Inventory
+from .models import StockHold
+
+
+class InsufficientStock(Exception):
+    """Недостаточно свободного товара для резерва"""
+
+    def __init__(self, book_id, available):
+        self.book_id = book_id
+        self.available = available
+        super().__init__(f"Only {available} available for book #{book_id}")
+
+
+def hold_expiry():
+    return timezone.now() + timedelta(seconds=settings.CART_HOLD_TTL)
+
+
+def set_hold(cart, book_id, quantity):
+    """Установить резерв корзины на книгу равным quantity (0 — снять резерв).
+
+    Продлевает срок резерва. При нехватке товара бросает InsufficientStock,
+    где available — сколько всего может держать эта корзина.
+    """
+    with transaction.atomic():
+        hold = StockHold.objects.select_for_update().filter(cart=cart, book_id=book_id).first()
+        held = hold.quantity if hold else 0
+        delta = quantity - held
+        if delta > 0:
+            reserved = Inventory.objects.filter(
+                book_id=book_id, stock__gte=F("reserved") + delta
+            ).update(reserved=F("reserved") + delta)
+            if not reserved:
+                inventory = Inventory.objects.filter(book_id=book_id).first()
+                raise InsufficientStock(book_id, (inventory.available if inventory else 0) + held)
+        elif delta < 0:
+            Inventory.objects.filter(book_id=book_id).update(reserved=Greatest(F("reserved") + delta, Value(0)))
+        if delta:
+            Book.mark_changed([book_id])
+
+        if quantity <= 0:
+            if hold:
+                hold.delete()
+        elif hold:
+            hold.quantity = quantity
+            hold.expires_at = hold_expiry()
+            hold.save(update_fields=["quantity", "expires_at"])
+        else:
+            StockHold.objects.create(cart=cart, book_id=book_id, quantity=quantity, expires_at=hold_expiry())
+
+
+def shrink_hold(cart, book_id, quantity):
+    """Уменьшить резерв корзины на книгу до quantity, если он больше.
+
+    Новый резерв не ставится и не увеличивается, поэтому InsufficientStock не бросается:
+    уменьшение корзины проходит, даже если резерв истёк, а товар разобрали.
+    """
+    with transaction.atomic():
+        hold = StockHold.objects.select_for_update().filter(cart=cart, book_id=book_id).first()
+        if hold is not None and hold.quantity > quantity:
+            set_hold(cart, book_id, quantity)
+
+
+def _release(holds):
+    """Вернуть в Inventory количество из уже заблокированных резервов и удалить их"""
+    totals = defaultdict(int)
+    for _, book_id, quantity in holds:
+        totals[book_id] += quantity
+    if not totals:
+        return 0
+    list(Inventory.objects.select_for_update().filter(book_id__in=totals).order_by("book_id").values_list("pk"))
+    Inventory.objects.filter(book_id__in=totals).update(reserved=Greatest(
+        Case(
+            *[When(book_id=book_id, then=F("reserved") - quantity) for book_id, quantity in totals.items()],
+            default=F("reserved"),
+            output_field=PositiveIntegerField(),
+        ),
+        Value(0),
+    ))
+    StockHold.objects.filter(pk__in=[pk for pk, _, _ in holds]).delete()
+    Book.mark_changed(list(totals))
+    return len(holds)
+
+
+def release_cart_holds(cart, book_ids=None):
+    """Снять резервы корзины (все или по списку книг). Возвращает число снятых резервов"""
+    with transaction.atomic():
+        holds = StockHold.objects.select_for_update().filter(cart=cart)
+        if book_ids is not None:
+            holds = holds.filter(book_id__in=book_ids)
+        return _release(list(holds.order_by("book_id").values_list("pk", "book_id", "quantity")))
+
+
+def release_expired(now=None, batch_size=500):
+    """Снять одну пачку истёкших резервов.
+
+    Резервы, заблокированные оформлением заказа, пропускаются (SKIP LOCKED).
+    Возвращает число снятых резервов.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        holds = list(
+            StockHold.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=now)
+            .order_by("pk")
+            .values_list("pk", "book_id", "quantity")[:batch_size]
+        )
+        return _release(holds)
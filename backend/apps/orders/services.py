@@ -0,0 +1,147 @@
+"""Оформление заказа из корзины.
+
+Общий сервис для API (OrderViewSet.create) и веб-страниц оформления.
+Число запросов не зависит от размера корзины: строки Inventory блокируются
+одним SELECT ... FOR UPDATE в порядке book_id (одинаковый порядок блокировок
+во всех транзакциях исключает взаимные блокировки), позиции заказа создаются
+одним bulk_create, остатки списываются одним условным UPDATE.
+
+Резервы корзины (orders.reservations) при этом превращаются в списание:
+stock уменьшается на количество позиции, reserved — на удерживаемое
+корзиной количество. Позиции без резерва (например, истёкшего) проходят,
+если свободного товара хватает.
+
+С ключом идемпотентности повтор запроса (таймаут клиента, двойная отправка
+формы) возвращает уже созданный заказ одним запросом по индексу, не открывая
+транзакцию оформления. Одновременные запросы с одним ключом упираются в
+уникальный индекс IdempotencyKey в самом начале транзакции.
+"""
+import hashlib
+from datetime import timedelta
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from backend.apps.catalog.models import Book, Inventory
+from .models import CartItem, IdempotencyKey, Order, OrderItem, StockHold
+from .reservations import release_cart_holds
+
+
+class CheckoutError(Exception):
+    """Заказ не может быть оформлен"""
+    EMPTY_CART = "empty_cart"
+    OUT_OF_STOCK = "out_of_stock"
+
+    def __init__(self, code, book=None, available=0):
+        self.code = code
+        self.book = book
+        self.available = available
+        super().__init__(f"Not enough stock for {book.title}" if book is not None else "Cart is empty")
+
+
+def _hash_key(key):
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def find_idempotent_order(user_id, key):
+    """Заказ, уже созданный этим пользователем с ключом key (None, если нет или ключ истёк)"""
+    record = IdempotencyKey.objects.filter(user_id=user_id, key_hash=_hash_key(key)).select_related("order").first()
+    if record is None:
+        return None
+    if record.created_at < timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL):
+        record.delete()
+        return None
+    return record.order
+
+
+def checkout_cart(cart, idempotency_key=None, **order_fields):
+    """Создать заказ из корзины, списать остатки и очистить корзину.
+
+    order_fields — поля Order (shipping_address, shipping_city, ...).
+    Возвращает Order; при пустой корзине или нехватке товара бросает CheckoutError,
+    ничего не изменив. Если заказ с idempotency_key уже был создан, возвращает его
+    с атрибутом idempotent_replay = True.
+    """
+    if cart is None:
+        raise CheckoutError(CheckoutError.EMPTY_CART)
+
+    if idempotency_key:
+        order = find_idempotent_order(cart.user_id, idempotency_key)
+        if order is not None:
+            order.idempotent_replay = True
+            return order
+        try:
+            return _checkout(cart, idempotency_key, order_fields)
+        except IntegrityError:
+            # Параллельный запрос с тем же ключом успел оформить заказ
+            order = find_idempotent_order(cart.user_id, idempotency_key)
+            if order is None:
+                raise
+            order.idempotent_replay = True
+            return order
+    return _checkout(cart, None, order_fields)
+
+
+def _checkout(cart, idempotency_key, order_fields):
+    with transaction.atomic():
+        if idempotency_key:
+            record = IdempotencyKey.objects.create(user_id=cart.user_id, key_hash=_hash_key(idempotency_key))
+
+        items = list(CartItem.objects.filter(cart=cart).select_related("book").order_by("book_id"))
+        if not items:
+            raise CheckoutError(CheckoutError.EMPTY_CART)
+        book_ids = [item.book_id for item in items]
+
+        held = dict(
+            StockHold.objects.select_for_update().filter(cart=cart).order_by("book_id").values_list("book_id", "quantity")
+        )
+        inventories = {
+            inv.book_id: inv
+            for inv in Inventory.objects.select_for_update().filter(book_id__in=book_ids).order_by("book_id")
+        }
+        for item in items:
+            inventory = inventories.get(item.book_id)
+            own = held.get(item.book_id, 0)
+            available = inventory.available + own if inventory else 0
+            if available < item.quantity:
+                raise CheckoutError(CheckoutError.OUT_OF_STOCK, book=item.book, available=available)
+
+        total = sum((item.book.price * item.quantity for item in items), start=Decimal("0"))
+        order = Order.objects.create(user_id=cart.user_id, status="processing", total_amount=total, **order_fields)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, book=item.book, price=item.book.price, quantity=item.quantity)
+            for item in items
+        ])
+
+        # Условие в WHERE повторяет проверку выше: если строка не списалась, откатываем заказ
+        enough_stock = Q()
+        stock_cases, reserved_cases = [], []
+        for item in items:
+            own = held.get(item.book_id, 0)
+            enough_stock |= Q(
+                book_id=item.book_id, stock__gte=F("reserved") - own + item.quantity, reserved__gte=own
+            )
+            stock_cases.append(When(book_id=item.book_id, then=F("stock") - item.quantity))
+            reserved_cases.append(When(book_id=item.book_id, then=F("reserved") - own))
+        updated = Inventory.objects.filter(enough_stock).update(
+            stock=Case(*stock_cases, default=F("stock"), output_field=PositiveIntegerField()),
+            reserved=Case(*reserved_cases, default=F("reserved"), output_field=PositiveIntegerField()),
+        )
+        if updated != len(items):
+            raise CheckoutError(CheckoutError.OUT_OF_STOCK, book=items[0].book)
+        Book.mark_changed(book_ids)
+
+        StockHold.objects.filter(cart=cart, book_id__in=book_ids).delete()
+        if set(held) - set(book_ids):
+            # Резервы позиций, которых уже нет в корзине
+            release_cart_holds(cart)
+
+        if idempotency_key:
+            record.order = order
+            record.save(update_fields=["order"])
+        CartItem.objects.filter(cart=cart).delete()
+    return order
@@ -0,0 +1,33 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .models import IdempotencyKey
+from .reservations import release_expired
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def release_expired_holds(batch_size=500):
+    """Снять все истёкшие резервы корзин пачками по batch_size"""
+    total = 0
+    while True:
+        released = release_expired(batch_size=batch_size)
+        total += released
+        if released < batch_size:
+            break
+    if total:
+        logger.info("Released %s expired stock holds", total)
+    return total
+
+
+@shared_task(ignore_result=True)
+def purge_idempotency_keys():
+    """Удалить ключи идемпотентности старше IDEMPOTENCY_KEY_TTL"""
+    cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
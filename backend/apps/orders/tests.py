@@ -1,8 +1,17 @@
+import threading
+import unittest
+from datetime import timedelta
 from decimal import Decimal
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError
-from backend.apps.orders.models import Cart, CartItem, Order, OrderItem
+from rest_framework.test import APIClient
+from backend.apps.orders.models import Cart, CartItem, IdempotencyKey, Order, OrderItem, StockHold
+from backend.apps.orders.reservations import InsufficientStock, release_cart_holds, set_hold
+from backend.apps.orders.services import CheckoutError, checkout_cart, find_idempotent_order
+from backend.apps.orders.tasks import purge_idempotency_keys, release_expired_holds
 from backend.apps.catalog.models import Category, Book, Inventory
 
 User = get_user_model()
@@ -167,3 +176,311 @@ class TestOrderItemModel(TestCase):
         with self.assertRaises(ProtectedError):
             self.book.delete()
 
+
+
+
+class TestCheckoutService(TestCase):
+    """Тесты сервиса оформления заказа"""
+    
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", password="testpass")
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name="Художественная литература", slug="fiction")
+    
+    def _add_books(self, count, stock=5, quantity=2, offset=0):
+        books = []
+        for i in range(offset, offset + count):
+            book = Book.objects.create(
+                title=f"Книга {i}",
+                isbn=f"978-5-17-{i:06d}",
+                category=self.category,
+                price=Decimal("100") + i
+            )
+            Inventory.objects.create(book=book, stock=stock)
+            CartItem.objects.create(cart=self.cart, book=book, quantity=quantity)
+            books.append(book)
+        return books
+    
+    def test_checkout_creates_order_and_decrements_stock(self):
+        """Тест создания заказа, списания остатков и очистки корзины"""
+        books = self._add_books(2)
+        order = checkout_cart(self.cart, shipping_city="Москва")
+        
+        self.assertEqual(order.total_amount, Decimal("402"))
+        self.assertEqual(order.shipping_city, "Москва")
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(
+            list(Inventory.objects.filter(book__in=books).values_list("stock", flat=True)), [3, 3]
+        )
+        self.assertFalse(self.cart.items.exists())
+    
+    def test_checkout_out_of_stock_changes_nothing(self):
+        """Тест, что при нехватке одной позиции заказ не создаётся и остатки не меняются"""
+        self._add_books(1)
+        short = self._add_books(1, stock=3, quantity=2, offset=1)[0]
+        Inventory.objects.filter(book=short).update(reserved=2)
+        
+        with self.assertRaises(CheckoutError) as ctx:
+            checkout_cart(self.cart)
+        self.assertEqual(ctx.exception.code, CheckoutError.OUT_OF_STOCK)
+        self.assertEqual(ctx.exception.book, short)
+        self.assertEqual(ctx.exception.available, 1)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+    
+    def test_checkout_query_count_does_not_depend_on_cart_size(self):
+        """Тест, что число запросов не зависит от количества позиций в корзине"""
+        # Позиции корзины, резервы корзины, блокировка остатков, заказ, позиции заказа,
+        # списание, updated_at книг, удаление резервов, очистка корзины + SAVEPOINT/RELEASE
+        self._add_books(3)
+        with self.assertNumQueries(11):
+            checkout_cart(self.cart)
+        
+        self._add_books(20, offset=3)
+        with self.assertNumQueries(11):
+            checkout_cart(self.cart)
+    
+    def test_cancel_order_returns_stock(self):
+        """Тест, что отмена заказа покупателем возвращает товар на склад"""
+        books = self._add_books(2)
+        order = checkout_cart(self.cart)
+        self.client.force_login(self.user)
+        self.client.post(f"/orders/{order.id}/cancel/")
+        
+        order.refresh_from_db()
+        self.assertEqual(order.status, "cancelled")
+        self.assertEqual(
+            list(Inventory.objects.filter(book__in=books).values_list("stock", flat=True)), [5, 5]
+        )
+    
+    def test_api_checkout(self):
+        """Тест оформления заказа через API"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.post("/api/orders/", {}).json(), {"detail": "Cart is empty"})
+        
+        self._add_books(1)
+        response = client.post("/api/orders/", {"shipping_address": "ул. Ленина, 1"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["items"]), 1)
+    
+    def test_api_checkout_retry_with_idempotency_key(self):
+        """Тест, что повтор запроса с тем же ключом возвращает тот же заказ"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        book = self._add_books(1)[0]
+        
+        first = client.post("/api/orders/", {}, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        retry = client.post("/api/orders/", {}, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json()["id"], first.json()["id"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Inventory.objects.get(book=book).stock, 3)
+    
+    def test_web_checkout_resubmit_shows_existing_order(self):
+        """Тест, что повторная отправка формы оформления с тем же токеном показывает первый заказ"""
+        self._add_books(1)
+        self.client.force_login(self.user)
+        
+        first = self.client.post("/checkout-detailed/", {"idempotency_key": "form-1"})
+        order = Order.objects.get()
+        self.assertRedirects(first, f"/checkout-success/{order.id}/", fetch_redirect_response=False)
+        self.assertFalse(self.cart.items.exists())
+        
+        retry = self.client.post("/checkout-detailed/", {"idempotency_key": "form-1"})
+        self.assertRedirects(retry, f"/checkout-success/{order.id}/", fetch_redirect_response=False)
+        self.assertEqual(Order.objects.count(), 1)
+        
+        # Без токена пустая корзина по-прежнему возвращает в корзину
+        response = self.client.post("/checkout-detailed/", {})
+        self.assertRedirects(response, "/cart/", fetch_redirect_response=False)
+    
+    def test_expired_idempotency_key_is_not_replayed(self):
+        """Тест, что истёкший ключ не возвращает старый заказ и удаляется задачей"""
+        self._add_books(1)
+        order = checkout_cart(self.cart, idempotency_key="old")
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        
+        self.assertIsNone(find_idempotent_order(self.user.id, "old"))
+        self.assertFalse(IdempotencyKey.objects.exists())
+        
+        self._add_books(1, offset=1)
+        checkout_cart(self.cart, idempotency_key="new")
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(purge_idempotency_keys(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertTrue(Order.objects.filter(pk=order.pk).exists())
+
+
+
+class TestStockHolds(TestCase):
+    """Тесты резервирования товара под корзины"""
+    
+    def setUp(self):
+        """Настройка тестовых данных"""
+        self.category = Category.objects.create(name="Художественная литература", slug="fiction")
+        self.book = Book.objects.create(
+            title="Тестовая книга",
+            isbn="978-5-17-777777-7",
+            category=self.category,
+            price=Decimal("100")
+        )
+        self.inventory = Inventory.objects.create(book=self.book, stock=5)
+        self.cart1 = Cart.objects.create(user=User.objects.create_user(username="buyer1", password="pass"))
+        self.cart2 = Cart.objects.create(user=User.objects.create_user(username="buyer2", password="pass"))
+    
+    def _reserved(self):
+        self.inventory.refresh_from_db()
+        return self.inventory.reserved
+    
+    def test_hold_cannot_oversell(self):
+        """Тест, что резервы двух корзин не превышают остаток"""
+        set_hold(self.cart1, self.book.id, 3)
+        with self.assertRaises(InsufficientStock) as ctx:
+            set_hold(self.cart2, self.book.id, 3)
+        self.assertEqual(ctx.exception.available, 2)
+        self.assertEqual(self._reserved(), 3)
+        
+        # Уменьшение резерва возвращает товар
+        set_hold(self.cart1, self.book.id, 1)
+        set_hold(self.cart2, self.book.id, 4)
+        self.assertEqual(self._reserved(), 5)
+        self.assertEqual(release_cart_holds(self.cart2), 1)
+        self.assertEqual(self._reserved(), 1)
+    
+    def test_expired_holds_released_by_task(self):
+        """Тест снятия истёкших резервов периодической задачей"""
+        set_hold(self.cart1, self.book.id, 2)
+        set_hold(self.cart2, self.book.id, 1)
+        StockHold.objects.filter(cart=self.cart1).update(expires_at=timezone.now() - timedelta(seconds=1))
+        
+        self.assertEqual(release_expired_holds(batch_size=1), 1)
+        self.assertEqual(self._reserved(), 1)
+        self.assertEqual(list(StockHold.objects.values_list("cart_id", flat=True)), [self.cart2.id])
+    
+    def test_hold_changes_mark_book_changed(self):
+        """Тест, что изменение резерва меняет ETag книги и один раз сбрасывает кэш каталога"""
+        from unittest import mock
+        
+        client = APIClient()
+        url = f"/api/books/{self.book.id}/"
+        Book.objects.filter(pk=self.book.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        etag = client.get(url)["ETag"]
+        
+        with mock.patch("backend.apps.catalog.cache.bump_catalog_version") as bump:
+            set_hold(self.cart1, self.book.id, 2)
+            self.assertEqual(bump.call_count, 1)
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["inventory"]["reserved"], 2)
+            
+            # Продление резерва без изменения количества книгу не трогает
+            etag = response["ETag"]
+            set_hold(self.cart1, self.book.id, 2)
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            
+            set_hold(self.cart2, self.book.id, 1)
+            StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+            bump.reset_mock()
+            self.assertEqual(release_expired_holds(), 2)
+            self.assertEqual(bump.call_count, 1)
+        self.assertEqual(client.get(url).json()["inventory"]["reserved"], 0)
+    
+    def test_checkout_converts_hold(self):
+        """Тест, что оформление заказа превращает резерв в списание остатка"""
+        CartItem.objects.create(cart=self.cart1, book=self.book, quantity=2)
+        set_hold(self.cart1, self.book.id, 2)
+        set_hold(self.cart2, self.book.id, 3)
+        
+        checkout_cart(self.cart1)
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.reserved), (3, 3))
+        self.assertFalse(StockHold.objects.filter(cart=self.cart1).exists())
+    
+    def test_cart_decrement_after_expired_hold(self):
+        """Тест, что уменьшение корзины после истёкшего резерва не падает и не ставит новый резерв"""
+        CartItem.objects.create(cart=self.cart1, book=self.book, quantity=3)
+        set_hold(self.cart1, self.book.id, 3)
+        StockHold.objects.filter(cart=self.cart1).update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired_holds()
+        # Освободившийся товар разобрала другая корзина
+        set_hold(self.cart2, self.book.id, 5)
+        
+        self.client.force_login(self.cart1.user)
+        response = self.client.post("/cart/", {"action": "dec", "book": self.book.id})
+        self.assertRedirects(response, "/cart/", fetch_redirect_response=False)
+        self.assertEqual(CartItem.objects.get(cart=self.cart1).quantity, 2)
+        self.assertFalse(StockHold.objects.filter(cart=self.cart1).exists())
+        self.assertEqual(self._reserved(), 5)
+        
+        # Действующий резерв уменьшается вместе с корзиной
+        set_hold(self.cart2, self.book.id, 3)
+        set_hold(self.cart1, self.book.id, 2)
+        self.client.post("/cart/", {"action": "dec", "book": self.book.id})
+        self.assertEqual(StockHold.objects.get(cart=self.cart1).quantity, 1)
+        self.assertEqual(self._reserved(), 4)
+    
+    def test_cart_delete_releases_holds(self):
+        """Тест, что удаление корзины возвращает её резервы"""
+        set_hold(self.cart1, self.book.id, 2)
+        self.cart1.delete()
+        self.assertEqual(self._reserved(), 0)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Нагрузочный тест блокировок требует PostgreSQL")
+class TestConcurrentCheckout(TransactionTestCase):
+    """Нагрузочный тест: параллельные резервы и оформления не перепродают товар"""
+    BUYERS = 40
+    STOCK = 15
+    
+    def test_parallel_checkouts_do_not_oversell(self):
+        category = Category.objects.create(name="Нагрузка", slug="load")
+        books = [
+            Book.objects.create(title=f"Книга {i}", isbn=f"978-5-99-{i:06d}", category=category, price=Decimal("100"))
+            for i in range(3)
+        ]
+        for book in books:
+            Inventory.objects.create(book=book, stock=self.STOCK)
+        carts = [
+            Cart.objects.create(user=User.objects.create_user(username=f"load{i}", password="pass"))
+            for i in range(self.BUYERS)
+        ]
+        results = []
+        barrier = threading.Barrier(self.BUYERS)
+        
+        def buyer(index, cart):
+            try:
+                barrier.wait()
+                # Разный порядок книг в корзинах провоцирует взаимные блокировки, если порядок блокировок не общий
+                for book in (books if index % 2 else books[::-1]):
+                    try:
+                        set_hold(cart, book.id, 1)
+                    except InsufficientStock:
+                        continue
+                    CartItem.objects.create(cart=cart, book=book, quantity=1)
+                try:
+                    checkout_cart(cart)
+                    results.append("ok")
+                except CheckoutError:
+                    results.append("out_of_stock")
+            except Exception as exc:  # noqa: BLE001 - ошибка потока должна провалить тест
+                results.append(repr(exc))
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=buyer, args=(i, cart)) for i, cart in enumerate(carts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual([r for r in results if r not in ("ok", "out_of_stock")], [])
+        for book in books:
+            inventory = Inventory.objects.get(book=book)
+            sold = sum(OrderItem.objects.filter(book=book).values_list("quantity", flat=True))
+            self.assertEqual(inventory.reserved, 0)
+            self.assertEqual(inventory.stock + sold, self.STOCK)
+            self.assertGreaterEqual(inventory.stock, 0)
@@ -1,11 +1,10 @@
-from decimal import Decimal
-from django.db import transaction
 from rest_framework import permissions, status, views, viewsets, filters
 from rest_framework.response import Response
 
-from backend.apps.catalog.models import Inventory, Book
-from .models import Cart, CartItem, Order, OrderItem
+from .models import Cart, CartItem, Order
 from .serializers import CartSerializer, CartItemSerializer, OrderSerializer
+from .reservations import InsufficientStock, release_cart_holds, set_hold
+from .services import CheckoutError, checkout_cart
 
 
 class IsAuthenticatedOrReadOnly(permissions.BasePermission):
@@ -32,6 +31,13 @@ class CartView(views.APIView):
         serializer.is_valid(raise_exception=True)
         book_id = serializer.validated_data["book"].id
         quantity = serializer.validated_data["quantity"]
+        current = CartItem.objects.filter(cart=cart, book_id=book_id).values_list("quantity", flat=True).first() or 0
+        try:
+            set_hold(cart, book_id, current + quantity)
+        except InsufficientStock as exc:
+            return Response(
+                {"detail": f"Not enough stock. Available: {exc.available}"}, status=status.HTTP_400_BAD_REQUEST
+            )
         item, created = CartItem.objects.get_or_create(cart=cart, book_id=book_id, defaults={"quantity": quantity})
         if not created:
             item.quantity += quantity
@@ -45,6 +51,7 @@ class CartView(views.APIView):
         if not cart:
             return Response(status=status.HTTP_204_NO_CONTENT)
         CartItem.objects.filter(cart=cart, book_id=request.data.get("book")).delete()
+        release_cart_holds(cart, [request.data.get("book")])
         return Response(CartSerializer(cart).data)
 
 
@@ -70,39 +77,22 @@ class OrderViewSet(viewsets.ModelViewSet):
             return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
-    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        user = request.user
-        cart = Cart.objects.filter(user=user).prefetch_related("items__book").first()
-        if not cart or cart.items.count() == 0:
-            return Response({"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Stock check
-        for item in cart.items.all():
-            inv = Inventory.objects.select_for_update().get(book=item.book)
-            if inv.available < item.quantity:
-                return Response({"detail": f"Not enough stock for {item.book.title}"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Create order
-        order = Order.objects.create(
-            user=user, 
-            status="processing", 
-            total_amount=Decimal("0"),
-            shipping_address=request.data.get('shipping_address', ''),
-            shipping_city=request.data.get('shipping_city', ''),
-            notes=request.data.get('notes', '')
-        )
-        total = Decimal("0")
-        for item in cart.items.all():
-            price = item.book.price
-            OrderItem.objects.create(order=order, book=item.book, price=price, quantity=item.quantity)
-            total += price * item.quantity
-            inv = Inventory.objects.select_for_update().get(book=item.book)
-            inv.stock = max(0, inv.stock - item.quantity)
-            inv.save()
-        order.total_amount = total
-        order.save()
-
-        # Clear cart
-        cart.items.all().delete()
-        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+        idempotency_key = request.headers.get("Idempotency-Key", "").strip()
+        if len(idempotency_key) > 255:
+            return Response({"detail": "Idempotency-Key is too long"}, status=status.HTTP_400_BAD_REQUEST)
+        cart = Cart.objects.filter(user=request.user).first()
+        try:
+            order = checkout_cart(
+                cart,
+                idempotency_key=idempotency_key or None,
+                shipping_address=request.data.get('shipping_address', ''),
+                shipping_city=request.data.get('shipping_city', ''),
+                notes=request.data.get('notes', '')
+            )
+        except CheckoutError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        response = Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+        if getattr(order, "idempotent_replay", False):
+            response["Idempotent-Replayed"] = "true"
+        return response
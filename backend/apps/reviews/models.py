@@ -1,5 +1,7 @@
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 
 class Review(models.Model):
@@ -17,3 +19,12 @@ class Review(models.Model):
     def __str__(self) -> str:
         return f"{self.book} - {self.rating}/5 by {self.user}"
 
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_book_review_stats(sender, instance, **kwargs):
+    """Поддерживать review_count/review_avg книги в актуальном состоянии"""
+    from backend.apps.catalog.models import Book
+    Book.refresh_review_stats([instance.book_id])
+    # Отзыв мог измениться без изменения агрегатов (текст), а он тоже виден на странице книги
+    Book.mark_changed([instance.book_id])
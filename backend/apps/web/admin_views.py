@@ -2,12 +2,15 @@
 from django.contrib import messages
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum, Avg, Q
+from django.db.models import Count, Sum, Q
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from backend.apps.users.models import Profile
+from backend.apps.analytics import reports
+from backend.apps.analytics.models import CustomerLifetime, DashboardSnapshot
 from backend.apps.orders.models import Order, OrderItem
 from backend.apps.catalog.models import Book, Inventory
+from backend.apps.core.csv_export import streaming_csv_response
 from backend.apps.core.decorators import admin_required
 from backend.apps.core.models import AuditLog
 import datetime
@@ -17,48 +20,29 @@ User = get_user_model()
 
 @admin_required
 def admin_dashboard(request):
-    """Главная панель администратора"""
-    # Статистика пользователей
-    total_users = User.objects.count()
-    active_users = Profile.objects.filter(is_blocked=False).count()
-    blocked_users = Profile.objects.filter(is_blocked=True).count()
-    
-    users_by_role = Profile.objects.values('role').annotate(count=Count('id'))
-    
-    # Статистика заказов
-    total_orders = Order.objects.count()
-    orders_today = Order.objects.filter(created_at__date=datetime.date.today()).count()
-    orders_this_month = Order.objects.filter(
-        created_at__year=datetime.date.today().year,
-        created_at__month=datetime.date.today().month
-    ).count()
-    
-    # Общая выручка
-    total_revenue = Order.objects.aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    # Топ-5 продаваемых книг
-    top_books = OrderItem.objects.values(
-        'book__title', 'book__id'
-    ).annotate(
-        total_sold=Sum('quantity'),
-        revenue=Sum('price') * Sum('quantity')
-    ).order_by('-total_sold')[:5]
+    """Главная панель администратора (показатели из DashboardSnapshot)"""
+    if request.GET.get('refresh'):
+        DashboardSnapshot.refresh()
+        return redirect('admin-dashboard')
+    snapshot = DashboardSnapshot.current()
+    data = snapshot.data
     
     # Последние заказы
-    recent_orders = Order.objects.select_related('user').order_by('-created_at')[:10]
+    recent_orders = Order.objects.filter(
+        pk__in=data['recent_order_ids']
+    ).select_related('user').order_by('-created_at')
     
     context = {
-        'total_users': total_users,
-        'active_users': active_users,
-        'blocked_users': blocked_users,
-        'users_by_role': users_by_role,
-        'total_orders': total_orders,
-        'orders_today': orders_today,
-        'orders_this_month': orders_this_month,
-        'total_revenue': total_revenue,
-        'top_books': top_books,
+        'snapshot': snapshot,
+        'total_users': data['total_users'],
+        'active_users': data['active_users'],
+        'blocked_users': data['blocked_users'],
+        'users_by_role': data['users_by_role'],
+        'total_orders': data['total_orders'],
+        'orders_today': data['orders_today'],
+        'orders_this_month': data['orders_this_month'],
+        'total_revenue': data['total_revenue'],
+        'top_books': data['top_books'],
         'recent_orders': recent_orders,
     }
     
@@ -159,18 +143,16 @@ def admin_user_detail(request, user_id):
     # Заказы пользователя
     orders = Order.objects.filter(user=user).order_by('-created_at')
     
-    # Общая статистика
-    total_orders = orders.count()
-    total_spent = orders.aggregate(total=Sum('total_amount'))['total'] or 0
-    avg_order_value = orders.aggregate(avg=Avg('total_amount'))['avg'] or 0
+    # Общая статистика по доставленным заказам — из CustomerLifetime, без агрегации заказов
+    lifetime = CustomerLifetime.objects.filter(user=user).first()
     
     context = {
         'user': user,
         'profile': profile,
         'orders': orders[:20],
-        'total_orders': total_orders,
-        'total_spent': total_spent,
-        'avg_order_value': avg_order_value,
+        'total_orders': lifetime.order_count if lifetime else 0,
+        'total_spent': lifetime.total_spent if lifetime else 0,
+        'avg_order_value': lifetime.average_order_value if lifetime else 0,
     }
     
     return render(request, 'web/admin/user_detail.html', context)
@@ -380,147 +362,22 @@ def admin_reports_export(request):
 
 def export_top_books_csv(request):
     """Экспорт топ-10 книг в CSV"""
-    from django.http import HttpResponse
-    import csv
-    from io import StringIO
-    
-    # Получаем топ-10 книг
-    top_books = Book.objects.annotate(
-        total_orders=Count('orderitem__order'),
-        total_quantity=Sum('orderitem__quantity'),
-        total_revenue=Sum('orderitem__price')
-    ).filter(total_orders__gt=0).order_by('-total_orders')[:10]
-    
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename="top_books_report.csv"'
-    
-    # Добавляем BOM для корректного отображения в Excel
-    response.write('\ufeff')
-    
-    writer = csv.writer(response)
-    writer.writerow(['Позиция', 'Название книги', 'ISBN', 'Категория', 'Цена', 'Количество заказов', 'Общее количество проданных', 'Общая выручка'])
-    
-    for i, book in enumerate(top_books, 1):
-        writer.writerow([
-            i,
-            book.title,
-            book.isbn,
-            book.category.name,
-            book.price,
-            book.total_orders,
-            book.total_quantity or 0,
-            book.total_revenue or 0
-        ])
-    
-    return response
+    return streaming_csv_response(reports.top_books_rows(), 'top_books_report.csv', bom=True)
 
 
 def export_user_activity_csv(request):
     """Экспорт активности пользователей в CSV"""
-    from django.http import HttpResponse
-    import csv
-    from io import StringIO
-    
-    # Получаем активных пользователей
-    active_users = User.objects.annotate(
-        total_orders=Count('orders'),
-        total_spent=Sum('orders__total_amount')
-    ).filter(total_orders__gt=0).order_by('-total_orders')[:20]
-    
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = 'attachment; filename="user_activity_report.csv"'
-    
-    # Добавляем BOM для корректного отображения в Excel
-    response.write('\ufeff')
-    
-    writer = csv.writer(response)
-    writer.writerow(['Позиция', 'Имя пользователя', 'Email', 'Имя', 'Фамилия', 'Количество заказов', 'Общая сумма покупок', 'Средний чек', 'Дата регистрации'])
-    
-    for i, user in enumerate(active_users, 1):
-        avg_order = user.total_spent / user.total_orders if user.total_orders > 0 else 0
-        writer.writerow([
-            i,
-            user.username,
-            user.email or '',
-            user.first_name or '',
-            user.last_name or '',
-            user.total_orders,
-            user.total_spent or 0,
-            round(avg_order, 2),
-            user.date_joined.strftime('%d.%m.%Y %H:%M')
-        ])
-    
-    return response
+    return streaming_csv_response(reports.user_activity_rows(), 'user_activity_report.csv', bom=True)
 
 
 def export_combined_csv(request):
     """Экспорт комбинированного отчета в CSV"""
-    from django.http import HttpResponse
-    import csv
-    from io import StringIO
     from datetime import datetime
     
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = f'attachment; filename="combined_report_{datetime.now().strftime("%Y%m%d_%H%M")}.csv"'
-    
-    # Добавляем BOM для корректного отображения в Excel
-    response.write('\ufeff')
-    
-    writer = csv.writer(response)
-    
-    # Заголовок отчета
-    writer.writerow(['КОМБИНИРОВАННЫЙ ОТЧЕТ'])
-    writer.writerow([f'Дата создания: {datetime.now().strftime("%d.%m.%Y %H:%M")}'])
-    writer.writerow([])
-    
-    # Топ-10 книг
-    writer.writerow(['ТОП-10 КНИГ ПО ПРОДАЖАМ'])
-    writer.writerow(['Позиция', 'Название книги', 'ISBN', 'Категория', 'Цена', 'Количество заказов', 'Общее количество проданных', 'Общая выручка'])
-    
-    top_books = Book.objects.annotate(
-        total_orders=Count('orderitem__order'),
-        total_quantity=Sum('orderitem__quantity'),
-        total_revenue=Sum('orderitem__price')
-    ).filter(total_orders__gt=0).order_by('-total_orders')[:10]
-    
-    for i, book in enumerate(top_books, 1):
-        writer.writerow([
-            i,
-            book.title,
-            book.isbn,
-            book.category.name,
-            book.price,
-            book.total_orders,
-            book.total_quantity or 0,
-            book.total_revenue or 0
-        ])
-    
-    writer.writerow([])
-    
-    # Активность пользователей
-    writer.writerow(['АКТИВНОСТЬ ПОЛЬЗОВАТЕЛЕЙ'])
-    writer.writerow(['Позиция', 'Имя пользователя', 'Email', 'Имя', 'Фамилия', 'Количество заказов', 'Общая сумма покупок', 'Средний чек', 'Дата регистрации'])
-    
-    active_users = User.objects.annotate(
-        total_orders=Count('orders'),
-        total_spent=Sum('orders__total_amount')
-    ).filter(total_orders__gt=0).order_by('-total_orders')[:20]
-    
-    for i, user in enumerate(active_users, 1):
-        avg_order = user.total_spent / user.total_orders if user.total_orders > 0 else 0
-        writer.writerow([
-            i,
-            user.username,
-            user.email or '',
-            user.first_name or '',
-            user.last_name or '',
-            user.total_orders,
-            user.total_spent or 0,
-            round(avg_order, 2),
-            user.date_joined.strftime('%d.%m.%Y %H:%M')
-        ])
-    
-    return response
+    created_at = datetime.now()
+    return streaming_csv_response(
+        reports.combined_rows(created_at), f'combined_report_{created_at.strftime("%Y%m%d_%H%M")}.csv', bom=True
+    )
 
 
 @admin_required
@@ -549,10 +406,13 @@ def admin_inventory_update(request, book_id):
         messages.error(request, 'Некорректное значение количества')
         return redirect('admin-inventory')
     
-    inventory, _ = Inventory.objects.get_or_create(book=book)
-    old_stock = inventory.stock
-    inventory.stock = new_stock
-    inventory.save()
+    if new_stock < 0:
+        messages.error(request, 'Некорректное значение количества')
+        return redirect('admin-inventory')
+    
+    old_stock = Inventory.objects.filter(book=book).values_list('stock', flat=True).first() or 0
+    # UPDATE только stock, без save(): reserved меняется резервами корзин параллельно
+    Inventory.objects.set_stock(book.id, new_stock)
     
     # Логируем действие
     AuditLog.objects.create(
@@ -573,16 +433,7 @@ def admin_inventory_update(request, book_id):
 @admin_required
 def admin_reports_top_books(request):
     """Отчет: Топ-10 продаваемых книг"""
-    top_books = OrderItem.objects.values(
-        'book__id',
-        'book__title',
-        'book__category__name',
-        'book__price'
-    ).annotate(
-        total_sold=Sum('quantity'),
-        total_revenue=Sum('price') * Sum('quantity'),
-        order_count=Count('order', distinct=True)
-    ).order_by('-total_sold')[:10]
+    top_books = reports.top_books(order_by=('-total_quantity', '-total_orders'))
     
     context = {'top_books': top_books}
     return render(request, 'web/admin/reports/top_books.html', context)
@@ -592,10 +443,7 @@ def admin_reports_top_books(request):
 def admin_reports_user_activity(request):
     """Отчет: Активность пользователей"""
     # Пользователи с наибольшим количеством заказов
-    active_users = User.objects.annotate(
-        total_orders=Count('orders'),
-        total_spent=Sum('orders__total_amount')
-    ).filter(total_orders__gt=0).order_by('-total_orders')[:20]
+    active_users = reports.top_customers()
     
     context = {'active_users': active_users}
     return render(request, 'web/admin/reports/user_activity.html', context)
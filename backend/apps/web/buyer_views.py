@@ -1,5 +1,7 @@
 """Views для покупателей - отзывы, заказы"""
+import uuid
 from django.contrib import messages
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_http_methods
 from django.db.models import Q
@@ -97,10 +99,19 @@ def edit_profile(request):
 def checkout_detailed(request):
     """Детальная страница оформления заказа"""
     from backend.apps.orders.models import Cart
-    from backend.apps.catalog.models import Inventory
     from backend.apps.users.models import Profile
     from decimal import Decimal
     
+    idempotency_key = None
+    if request.method == 'POST':
+        from backend.apps.orders.services import find_idempotent_order
+        
+        idempotency_key = request.POST.get('idempotency_key', '')[:255] or None
+        # Повторная отправка формы: корзину уже очистил первый запрос, показываем его заказ
+        order = find_idempotent_order(request.user.id, idempotency_key) if idempotency_key else None
+        if order is not None:
+            return redirect('checkout-success', order_id=order.id)
+    
     cart = Cart.objects.filter(user=request.user).prefetch_related("items__book").first()
     
     if not cart or cart.items.count() == 0:
@@ -111,37 +122,28 @@ def checkout_detailed(request):
     profile, _ = Profile.objects.get_or_create(user=request.user)
     
     if request.method == 'POST':
-        # Проверка наличия
-        for item in cart.items.select_related('book').all():
-            inventory, _ = Inventory.objects.get_or_create(book=item.book)
-            if inventory.available < item.quantity:
-                messages.error(request, f"Недостаточно на складе: {item.book.title}")
-                return redirect('cart')
-        
-        # Создание заказа
-        from backend.apps.orders.models import Order, OrderItem
-        
-        order = Order.objects.create(
-            user=request.user,
-            status="processing",
-            total_amount=Decimal("0"),
-            shipping_address=request.POST.get('shipping_address', profile.address or ''),
-            shipping_city=request.POST.get('shipping_city', profile.city or ''),
-            shipping_postal_code=request.POST.get('shipping_postal_code', profile.postal_code or ''),
-            notes=request.POST.get('notes', '')
-        )
-        
-        total = Decimal("0")
-        for item in cart.items.select_related('book').all():
-            price = item.book.price
-            OrderItem.objects.create(order=order, book=item.book, price=price, quantity=item.quantity)
-            total += price * item.quantity
-            inventory, _ = Inventory.objects.get_or_create(book=item.book)
-            inventory.stock = max(0, inventory.stock - item.quantity)
-            inventory.save()
+        from backend.apps.orders.models import Order
+        from backend.apps.orders.services import CheckoutError, checkout_cart
         
-        order.total_amount = total
-        order.save()
+        items_count = cart.items.count()
+        try:
+            order = checkout_cart(
+                cart,
+                idempotency_key=idempotency_key,
+                shipping_address=request.POST.get('shipping_address', profile.address or ''),
+                shipping_city=request.POST.get('shipping_city', profile.city or ''),
+                shipping_postal_code=request.POST.get('shipping_postal_code', profile.postal_code or ''),
+                notes=request.POST.get('notes', '')
+            )
+        except CheckoutError as exc:
+            if exc.code == CheckoutError.EMPTY_CART:
+                messages.error(request, "Корзина пуста")
+            else:
+                messages.error(request, f"Недостаточно на складе: {exc.book.title}")
+            return redirect('cart')
+        if getattr(order, 'idempotent_replay', False):
+            # Повторная отправка формы — заказ уже оформлен
+            return redirect('checkout-success', order_id=order.id)
         
         # Логируем создание заказа
         from backend.apps.core.models import AuditLog
@@ -161,12 +163,10 @@ def checkout_detailed(request):
                 'order_id': order.id,
                 'total_amount': str(order.total_amount),
                 'status': order.status,
-                'items_count': cart.items.count()
+                'items_count': items_count
             }
         )
         
-        # Очистка корзины
-        cart.items.all().delete()
         return redirect('checkout-success', order_id=order.id)
     
     # GET - показываем форму
@@ -186,7 +186,9 @@ def checkout_detailed(request):
         'cart': cart,
         'items': items_with_totals,
         'total': total,
-        'profile': profile
+        'profile': profile,
+        # Токен формы: повторная отправка вернёт тот же заказ, а не создаст новый
+        'idempotency_key': uuid.uuid4().hex
     })
 
 
@@ -219,22 +221,25 @@ def cancel_order(request, order_id):
     from backend.apps.core.models import AuditLog
     from django.contrib.contenttypes.models import ContentType
     
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    
-    # Проверяем, что заказ можно отменить (только если статус processing)
-    if order.status != 'processing':
-        messages.error(request, 'Заказ можно отменить только пока он обрабатывается')
-        return redirect('order-detail', order_id=order.id)
-    
-    # Возвращаем товары на склад
-    for item in order.items.select_related('book').all():
-        inventory, _ = Inventory.objects.get_or_create(book=item.book)
-        inventory.stock += item.quantity
-        inventory.save()
-    
-    # Меняем статус заказа на cancelled
-    order.status = 'cancelled'
-    order.save()
+    with transaction.atomic():
+        order = get_object_or_404(Order.objects.select_for_update(), id=order_id, user=request.user)
+        
+        # Проверяем, что заказ можно отменить (только если статус processing)
+        if order.status != 'processing':
+            messages.error(request, 'Заказ можно отменить только пока он обрабатывается')
+            return redirect('order-detail', order_id=order.id)
+        
+        # Возвращаем товары на склад одним UPDATE
+        returned = {}
+        for book_id, quantity in order.items.values_list('book_id', 'quantity'):
+            returned[book_id] = returned.get(book_id, 0) + quantity
+        for book_id, applied in Inventory.objects.bulk_adjust(returned).items():
+            if not applied:
+                Inventory.objects.increment(book_id, returned[book_id])
+        
+        # Меняем статус заказа на cancelled
+        order.status = 'cancelled'
+        order.save()
     
     # Логируем отмену заказа
     from backend.apps.orders.models import Order as OrderModel
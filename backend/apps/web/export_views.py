@@ -0,0 +1,115 @@
+"""Views для фоновых выгрузок отчетов"""
+import importlib.util
+import os
+from django.conf import settings
+from django.contrib import messages
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+from backend.apps.analytics.models import ExportJob
+from backend.apps.analytics.reports import REPORTS
+from backend.apps.analytics.tasks import enqueue_export_job
+from backend.apps.core.decorators import admin_required
+from backend.apps.core.models import AuditLog
+
+
+def _wants_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+def _job_dict(job):
+    data = job.as_dict()
+    data['status_url'] = reverse('admin-export-job-status', args=[job.pk])
+    if job.status == 'done':
+        data['download_url'] = reverse('admin-export-job-download', args=[job.pk])
+    return data
+
+
+@admin_required
+def export_job_list(request):
+    """Список фоновых выгрузок"""
+    jobs = ExportJob.objects.select_related('created_by')[:50]
+    return render(request, 'web/admin/export_jobs.html', {
+        'jobs': jobs,
+        'reports': REPORTS,
+        'parquet_available': importlib.util.find_spec('pyarrow') is not None,
+    })
+
+
+@admin_required
+@require_http_methods(["POST"])
+def export_job_create(request):
+    """Поставить выгрузку отчета в очередь"""
+    report_type = request.POST.get('type')
+    export_format = request.POST.get('format', 'csv')
+    error = None
+    if report_type not in REPORTS:
+        error = 'Неверный тип отчета'
+    elif export_format not in dict(ExportJob.FORMAT_CHOICES):
+        error = 'Неверный формат выгрузки'
+    elif export_format == 'parquet' and REPORTS[report_type].types is None:
+        error = 'Этот отчет нельзя выгрузить в Parquet'
+    elif export_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        error = 'Выгрузка в Parquet недоступна: не установлен pyarrow'
+    if error:
+        if _wants_json(request):
+            return JsonResponse({'detail': error}, status=400)
+        messages.error(request, error)
+        return redirect('admin-export-jobs')
+
+    # Период поддерживает только выгрузка продаж
+    params = {}
+    if report_type == 'sales':
+        params = {key: request.POST[key] for key in ('start', 'end') if request.POST.get(key)}
+    job = ExportJob.objects.create(
+        report=report_type, format=export_format, params=params, created_by=request.user
+    )
+    transaction.on_commit(lambda: enqueue_export_job(job))
+
+    if _wants_json(request):
+        response = JsonResponse(_job_dict(job), status=202)
+        response['Location'] = reverse('admin-export-job-status', args=[job.pk])
+        return response
+    messages.success(request, f'Выгрузка #{job.pk} поставлена в очередь')
+    return redirect('admin-export-jobs')
+
+
+@admin_required
+def export_job_status(request, job_id):
+    """Состояние выгрузки: статус, прогресс и число строк"""
+    job = get_object_or_404(ExportJob, pk=job_id)
+    return JsonResponse(_job_dict(job))
+
+
+@admin_required
+def export_job_download(request, job_id):
+    """Скачивание готовой выгрузки"""
+    job = get_object_or_404(ExportJob, pk=job_id, status='done')
+    filename = os.path.basename(job.file.name)
+    content_type = 'application/gzip' if job.format == 'csv' else 'application/octet-stream'
+
+    if settings.EXPORT_ACCEL_REDIRECT:
+        # Файл отдаёт nginx из internal-location, Django только проверяет права
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f'{settings.EXPORT_ACCEL_REDIRECT}{filename}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    else:
+        try:
+            response = FileResponse(job.file.open('rb'), as_attachment=True, filename=filename, content_type=content_type)
+        except FileNotFoundError:
+            raise Http404('Файл выгрузки не найден')
+
+    # Логируем скачивание
+    AuditLog.objects.create(
+        action='viewed',
+        actor=request.user,
+        description=f'Администратор {request.user.username} скачал выгрузку: {filename}',
+        method='GET',
+        ip_address=request.META.get('REMOTE_ADDR'),
+        path=request.path,
+        user_agent=request.META.get('HTTP_USER_AGENT', '')
+    )
+
+    return response
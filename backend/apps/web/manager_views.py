@@ -5,6 +5,7 @@ from django.contrib.auth import get_user_model
 from django.db.models import Count, Sum, Avg, Q
 from django.views.decorators.http import require_http_methods
 from backend.apps.core.decorators import manager_required
+from backend.apps.analytics.models import DashboardSnapshot
 from backend.apps.orders.models import Order, OrderItem
 from backend.apps.catalog.models import Book
 from backend.apps.core.models import AuditLog
@@ -15,53 +16,33 @@ User = get_user_model()
 
 @manager_required
 def manager_dashboard(request):
-    """Главная панель менеджера"""
-    # Статистика заказов
-    total_orders = Order.objects.count()
-    new_orders = Order.objects.filter(status='new').count()
-    processing_orders = Order.objects.filter(status='processing').count()
-    shipped_orders = Order.objects.filter(status='shipped').count()
-    delivered_orders = Order.objects.filter(status='delivered').count()
-    cancelled_orders = Order.objects.filter(status='cancelled').count()
-    
-    # Статистика за сегодня
-    today = datetime.now().date()
-    today_orders = Order.objects.filter(created_at__date=today).count()
-    today_revenue = Order.objects.filter(
-        created_at__date=today, 
-        status__in=['delivered', 'shipped']
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-    
-    # Статистика за неделю
-    week_ago = today - timedelta(days=7)
-    week_orders = Order.objects.filter(created_at__date__gte=week_ago).count()
-    week_revenue = Order.objects.filter(
-        created_at__date__gte=week_ago,
-        status__in=['delivered', 'shipped']
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
+    """Главная панель менеджера (показатели из DashboardSnapshot)"""
+    if request.GET.get('refresh'):
+        DashboardSnapshot.refresh()
+        return redirect('manager-dashboard')
+    snapshot = DashboardSnapshot.current()
+    data = snapshot.data
+    by_status = data['orders_by_status']
     
     # Последние заказы
-    recent_orders = Order.objects.select_related('user').order_by('-created_at')[:10]
-    
-    # Топ-5 книг за неделю
-    top_books = Book.objects.annotate(
-        week_orders=Count('orderitem__order', filter=Q(orderitem__order__created_at__date__gte=week_ago)),
-        week_quantity=Sum('orderitem__quantity', filter=Q(orderitem__order__created_at__date__gte=week_ago))
-    ).filter(week_orders__gt=0).order_by('-week_orders')[:5]
+    recent_orders = Order.objects.filter(
+        pk__in=data['recent_order_ids']
+    ).select_related('user').order_by('-created_at')
     
     context = {
-        'total_orders': total_orders,
-        'new_orders': new_orders,
-        'processing_orders': processing_orders,
-        'shipped_orders': shipped_orders,
-        'delivered_orders': delivered_orders,
-        'cancelled_orders': cancelled_orders,
-        'today_orders': today_orders,
-        'today_revenue': today_revenue,
-        'week_orders': week_orders,
-        'week_revenue': week_revenue,
+        'snapshot': snapshot,
+        'total_orders': data['total_orders'],
+        'new_orders': by_status.get('new', 0),
+        'processing_orders': by_status.get('processing', 0),
+        'shipped_orders': by_status.get('shipped', 0),
+        'delivered_orders': by_status.get('delivered', 0),
+        'cancelled_orders': by_status.get('cancelled', 0),
+        'today_orders': data['orders_today'],
+        'today_revenue': data['today_revenue'],
+        'week_orders': data['week_orders'],
+        'week_revenue': data['week_revenue'],
         'recent_orders': recent_orders,
-        'top_books': top_books,
+        'top_books': data['week_top_books'],
     }
     
     return render(request, 'web/manager/dashboard.html', context)
@@ -44,7 +44,7 @@ def sales_dashboard(request):
     top_books = TopSellingBook.objects.filter(
         date__gte=start_date
     ).select_related('book').values(
-        'book__title', 'book__author__name', 'book__isbn'
+        'book_id', 'book__title', 'book__isbn'
     ).annotate(
         total_quantity=Sum('quantity_sold'),
         total_revenue=Sum('revenue')
@@ -115,7 +115,7 @@ def sales_reports(request):
         top_books = TopSellingBook.objects.filter(
             date__gte=start_date
         ).select_related('book').values(
-            'book__title', 'book__author__name', 'book__isbn', 'book__price'
+            'book_id', 'book__title', 'book__isbn', 'book__price'
         ).annotate(
             total_quantity=Sum('quantity_sold'),
             total_revenue=Sum('revenue'),
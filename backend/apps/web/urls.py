@@ -5,6 +5,7 @@ from . import buyer_views
 from . import manager_views
 from . import sales_views
 from . import backup_views
+from . import export_views
 
 urlpatterns = [
     path('', views.login_view, name='home'),
@@ -56,6 +57,10 @@ urlpatterns = [
     path('admin/reports/export/', admin_views.admin_reports_export, name='admin-reports-export'),
     path('admin/reports/top-books/', admin_views.admin_reports_top_books, name='admin-reports-top-books'),
     path('admin/reports/user-activity/', admin_views.admin_reports_user_activity, name='admin-reports-user-activity'),
+    path('admin/reports/jobs/', export_views.export_job_list, name='admin-export-jobs'),
+    path('admin/reports/jobs/create/', export_views.export_job_create, name='admin-export-job-create'),
+    path('admin/reports/jobs/<int:job_id>/', export_views.export_job_status, name='admin-export-job-status'),
+    path('admin/reports/jobs/<int:job_id>/download/', export_views.export_job_download, name='admin-export-job-download'),
     
     # Логи
     path('admin/logs/', admin_views.admin_audit_logs, name='admin-logs'),
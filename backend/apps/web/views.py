@@ -3,13 +3,19 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404, redirect, render
 from django.db import transaction
-from django.db.models import Q, Avg, Count
+from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_http_methods
 
 from backend.apps.catalog.models import Book, Category, Author, Inventory, BookAuthors
-from backend.apps.orders.models import Cart, CartItem, Order, OrderItem
+from backend.apps.catalog.cache import cache_for_guests
+from backend.apps.catalog.conditional import book_conditional
+from backend.apps.catalog.facets import apply_facet_filters, catalog_facets, facet_filters
+from backend.apps.catalog.pagination import InvalidCursor, ordering_options, paginate_keyset, resolve_ordering
+from backend.apps.catalog.search import SEARCH_RANK_FIELD, fuzzy_search_books, parse_fuzzy_params, search_books
+from backend.apps.orders.models import Cart, CartItem
+from backend.apps.orders.reservations import InsufficientStock, release_cart_holds, set_hold, shrink_hold
+from backend.apps.orders.services import CheckoutError, checkout_cart
 from backend.apps.users.models import Profile
 from backend.apps.core.decorators import guest_required, buyer_required, admin_required
 from django import forms
@@ -72,11 +78,31 @@ class BookForm(forms.ModelForm):
         fields = ["title", "isbn", "description", "category", "price"]
 
 
+@cache_for_guests
 def home(request):
     latest_books = Book.objects.order_by('-created_at')[:8]
     return render(request, 'web/home.html', {"latest_books": latest_books})
 
 
+CATALOG_PAGE_SIZE = 24
+CATALOG_ORDERING_CHOICES = [
+    ('title', 'По названию (А–Я)'),
+    ('-title', 'По названию (Я–А)'),
+    ('price', 'Сначала дешевле'),
+    ('-price', 'Сначала дороже'),
+    ('-rating', 'По рейтингу'),
+    ('-created_at', 'Сначала новые'),
+]
+
+
+def _parse_decimal(value):
+    try:
+        return Decimal(value) if value else None
+    except (ValueError, InvalidOperation):
+        return None
+
+
+@cache_for_guests
 def catalog_list(request):
     q = request.GET.get('q', '')
     category_filter = request.GET.get('category', '')
@@ -84,53 +110,74 @@ def catalog_list(request):
     price_max = request.GET.get('price_max', '')
     rating_min = request.GET.get('rating_min', '')
     
-    qs = Book.objects.filter(is_active=True).annotate(
-        avg_rating=Avg('reviews__rating'),
-        review_count=Count('reviews')
-    )
+    qs = Book.objects.filter(is_active=True).select_related('category')
     
-    # Поиск по названию, ISBN
-    if q:
-        qs = qs.filter(Q(title__icontains=q) | Q(isbn__icontains=q) | 
-                       Q(book_authors__author__first_name__icontains=q) |
-                       Q(book_authors__author__last_name__icontains=q))
+    # Полнотекстовый (или нечёткий, ?fuzzy=1) поиск по названию, авторам, категории, описанию и ISBN
+    fuzzy_threshold = parse_fuzzy_params(request.GET)
+    if q and fuzzy_threshold is not None:
+        qs = fuzzy_search_books(qs, q, fuzzy_threshold)
+    elif q:
+        qs = search_books(qs, q)
     
-    # Фильтрация по категории
-    if category_filter:
-        qs = qs.filter(category__slug=category_filter)
+    # Фасетные фильтры: категория, цена, рейтинг (некорректные значения игнорируются)
+    filters = facet_filters(
+        category=category_filter,
+        price_min=_parse_decimal(price_min),
+        price_max=_parse_decimal(price_max),
+        rating_min=_parse_decimal(rating_min),
+        category_field='category__slug',
+    )
+    # Счётчики фасетов считаются по выборке без фасетных фильтров — одним запросом
+    facets = catalog_facets(qs, filters)
+    qs = apply_facet_filters(qs, filters)
     
-    # Фильтрация по цене
-    if price_min:
-        try:
-            qs = qs.filter(price__gte=Decimal(price_min))
-        except (ValueError, InvalidOperation):
-            pass
-    if price_max:
-        try:
-            qs = qs.filter(price__lte=Decimal(price_max))
-        except (ValueError, InvalidOperation):
-            pass
+    # Keyset-пагинация: та же логика курсоров, что и в /api/books/
+    allowed_orderings, default_ordering = ordering_options(qs)
+    ordering = resolve_ordering(request.GET.get('ordering'), allowed_orderings, default_ordering)
+    ordering_choices = list(CATALOG_ORDERING_CHOICES)
+    if SEARCH_RANK_FIELD in allowed_orderings:
+        ordering_choices.insert(0, (f'-{SEARCH_RANK_FIELD}', 'По релевантности'))
+    try:
+        page = paginate_keyset(qs, ordering, cursor=request.GET.get('cursor'), page_size=CATALOG_PAGE_SIZE)
+    except InvalidCursor:
+        page = paginate_keyset(qs, ordering, page_size=CATALOG_PAGE_SIZE)
     
-    # Фильтрация по рейтингу
-    if rating_min:
-        try:
-            qs = qs.filter(rating__gte=Decimal(rating_min))
-        except (ValueError, InvalidOperation):
-            pass
+    def page_url(cursor):
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return f'?{params.urlencode()}'
     
-    # Исключаем дубликаты
-    qs = qs.distinct()
+    def facet_url(**changes):
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        for key, value in changes.items():
+            if value is None:
+                params.pop(key, None)
+            else:
+                params[key] = value
+        return f'?{params.urlencode()}'
     
-    # Список категорий для фильтра
-    categories = Category.objects.all()
+    for bucket in facets['price']:
+        bucket['url'] = facet_url(price_min=bucket['min'], price_max=bucket['max'])
+    for bucket in facets['rating']:
+        bucket['url'] = facet_url(rating_min=bucket['min'])
     
     return render(request, 'web/catalog.html', {
-        "books": qs,
-        "categories": categories,
+        "books": page.object_list,
+        "page": page,
+        "next_url": page_url(page.next_cursor) if page.has_next else None,
+        "previous_url": page_url(page.previous_cursor) if page.has_previous else None,
+        "ordering": ordering,
+        "ordering_choices": ordering_choices,
+        "categories": facets['categories'],
+        "facets": facets,
+        "fuzzy": fuzzy_threshold is not None,
         "q": q
     })
 
 
+@book_conditional
+@cache_for_guests
 def book_detail(request, pk: int):
     """Детальная информация о книге - доступна всем (включая гостей)"""
     book = get_object_or_404(Book, pk=pk)
@@ -164,25 +211,18 @@ def cart_view(request):
         book_id = request.POST.get("book")
         qty = int(request.POST.get("quantity", "1") or 1)
         if action == "add" and book_id:
-            # Проверка наличия товара на складе
-            from backend.apps.catalog.models import Inventory, Book
             book = get_object_or_404(Book, id=book_id)
-            inventory, _ = Inventory.objects.get_or_create(book=book)
-            
-            # Проверяем доступное количество
-            available = inventory.available
-            
-            if available <= 0:
-                messages.error(request, f"Товар '{book.title}' отсутствует на складе")
-                return redirect('catalog')
-            
-            # Проверяем, не превышает ли запрашиваемое количество доступное
             existing_item = CartItem.objects.filter(cart=cart, book_id=book_id).first()
             current_qty = existing_item.quantity if existing_item else 0
-            requested_qty = current_qty + qty
             
-            if requested_qty > available:
-                messages.error(request, f"Недостаточно товара на складе. Доступно: {available} шт.")
+            # Резервируем товар под корзину; при нехватке показываем, сколько можно взять
+            try:
+                set_hold(cart, book.id, current_qty + qty)
+            except InsufficientStock as exc:
+                if exc.available <= 0:
+                    messages.error(request, f"Товар '{book.title}' отсутствует на складе")
+                else:
+                    messages.error(request, f"Недостаточно товара на складе. Доступно: {exc.available} шт.")
                 return redirect('catalog')
             
             item, created = CartItem.objects.get_or_create(cart=cart, book_id=book_id, defaults={"quantity": qty})
@@ -193,84 +233,66 @@ def cart_view(request):
         elif action in ("inc", "dec") and book_id:
             try:
                 item = CartItem.objects.get(cart=cart, book_id=book_id)
-                from backend.apps.catalog.models import Inventory
-                inventory = Inventory.objects.get(book=item.book)
-                available = inventory.available
-                
                 if action == "inc":
-                    # Проверяем, не превышает ли увеличенное количество доступное
-                    if item.quantity + 1 > available:
-                        messages.error(request, f"Недостаточно товара на складе. Доступно: {available} шт.")
+                    try:
+                        set_hold(cart, item.book_id, item.quantity + 1)
+                    except InsufficientStock as exc:
+                        messages.error(request, f"Недостаточно товара на складе. Доступно: {exc.available} шт.")
                     else:
                         item.quantity += 1
                         item.save()
                         messages.success(request, "Корзина обновлена")
                 else:
                     if item.quantity > 1:
-                        item.quantity -= 1
-                        item.save()
+                        with transaction.atomic():
+                            item.quantity -= 1
+                            item.save()
+                            shrink_hold(cart, item.book_id, item.quantity)
                         messages.success(request, "Корзина обновлена")
                     else:
                         item.delete()
+                        release_cart_holds(cart, [item.book_id])
                         messages.success(request, "Товар удалён из корзины")
             except CartItem.DoesNotExist:
                 pass
-            except Inventory.DoesNotExist:
-                messages.error(request, "Информация о товаре не найдена")
         elif action == "remove" and book_id:
             CartItem.objects.filter(cart=cart, book_id=book_id).delete()
+            release_cart_holds(cart, [book_id])
             messages.success(request, "Товар удалён из корзины")
         return redirect('cart')
 
-    items = cart.items.select_related('book').all()
+    items = cart.items.select_related('book', 'book__inventory').all()
+    held = dict(cart.holds.values_list('book_id', 'quantity'))
     
-    # Проверяем наличие товаров и показываем предупреждения
+    # Проверяем наличие товаров и показываем предупреждения; резерв этой корзины считается доступным
     for item in items:
-        from backend.apps.catalog.models import Inventory
         try:
-            inventory = Inventory.objects.get(book=item.book)
-            if inventory.available < item.quantity:
-                if inventory.available > 0:
-                    messages.warning(request, f"Товар '{item.book.title}': доступно только {inventory.available} шт., в корзине {item.quantity} шт.")
-                else:
-                    messages.error(request, f"Товар '{item.book.title}' отсутствует на складе")
+            inventory = item.book.inventory
         except Inventory.DoesNotExist:
             messages.error(request, f"Информация о товаре '{item.book.title}' не найдена")
+            continue
+        available = inventory.available + held.get(item.book_id, 0)
+        if available < item.quantity:
+            if available > 0:
+                messages.warning(request, f"Товар '{item.book.title}': доступно только {available} шт., в корзине {item.quantity} шт.")
+            else:
+                messages.error(request, f"Товар '{item.book.title}' отсутствует на складе")
     
     total = sum((it.book.price * it.quantity for it in items), start=Decimal('0'))
     return render(request, 'web/cart.html', {"cart": cart, "items": items, "total": total})
 
 
 @buyer_required
-@transaction.atomic
 def checkout_view(request):
-    cart = Cart.objects.filter(user=request.user).prefetch_related("items__book").first()
-    if not cart or cart.items.count() == 0:
-        messages.error(request, "Корзина пуста")
+    cart = Cart.objects.filter(user=request.user).first()
+    try:
+        order = checkout_cart(cart)
+    except CheckoutError as exc:
+        if exc.code == CheckoutError.EMPTY_CART:
+            messages.error(request, "Корзина пуста")
+        else:
+            messages.error(request, f"Недостаточно на складе: {exc.book.title}")
         return redirect('cart')
-
-    # Проверка наличия
-    for item in cart.items.select_related('book').all():
-        inv = Inventory.objects.select_for_update().get(book=item.book)
-        if inv.stock - inv.reserved < item.quantity:
-            messages.error(request, f"Недостаточно на складе: {item.book.title}")
-            return redirect('cart')
-
-    # Создание заказа
-    order = Order.objects.create(user=request.user, status="processing", total_amount=Decimal('0'))
-    total = Decimal('0')
-    for item in cart.items.select_related('book').all():
-        price = item.book.price
-        OrderItem.objects.create(order=order, book=item.book, price=price, quantity=item.quantity)
-        total += price * item.quantity
-        inv = Inventory.objects.select_for_update().get(book=item.book)
-        inv.stock = max(0, inv.stock - item.quantity)
-        inv.save()
-
-    order.total_amount = total
-    order.save()
-    # Очистка корзины
-    cart.items.all().delete()
     return render(request, 'web/checkout_success.html', {"order": order})
 
 
@@ -14,6 +14,7 @@ DJANGO_APPS = [
 	'django.contrib.sessions',
 	'django.contrib.messages',
 	'django.contrib.staticfiles',
+	'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
@@ -106,14 +107,82 @@ REST_FRAMEWORK = {
 	),
 }
 
+# Конфигурация PostgreSQL full-text search для каталога ('simple', 'russian', ...)
+CATALOG_SEARCH_CONFIG = os.getenv('CATALOG_SEARCH_CONFIG', 'simple')
+# Порог pg_trgm similarity для нечёткого поиска (?fuzzy=1); можно переопределить параметром ?similarity=
+CATALOG_FUZZY_THRESHOLD = float(os.getenv('CATALOG_FUZZY_THRESHOLD', '0.3'))
+# Значение pg_trgm.similarity_threshold в БД: оператор % отбирает кандидатов по нему, поэтому
+# ?similarity= ниже него ничего не добавит и поднимается до этого значения
+CATALOG_TRGM_INDEX_THRESHOLD = float(os.getenv('CATALOG_TRGM_INDEX_THRESHOLD', '0.3'))
+# In-memory индекс подсказок /api/books/suggest/: лимит ключей и период полной пересборки (сек.)
+CATALOG_SUGGEST_MAX_ENTRIES = int(os.getenv('CATALOG_SUGGEST_MAX_ENTRIES', '500000'))
+CATALOG_SUGGEST_MAX_AGE = int(os.getenv('CATALOG_SUGGEST_MAX_AGE', '600'))
+
 CORS_ALLOWED_ORIGINS = os.getenv('DJANGO_CORS_ORIGINS', '').split(',') if os.getenv('DJANGO_CORS_ORIGINS') else []
 
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 
+# Кэш: Redis, если задан REDIS_URL, иначе память процесса
+if os.getenv('REDIS_URL'):
+	CACHES = {
+		'default': {
+			'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+			'LOCATION': REDIS_URL,
+		}
+	}
+else:
+	CACHES = {
+		'default': {
+			'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+			'LOCATION': 'bookshop',
+		}
+	}
+# Время жизни закэшированных гостевых страниц каталога (сек.); сбрасываются раньше при изменении данных
+CATALOG_PAGE_CACHE_TIMEOUT = int(os.getenv('CATALOG_PAGE_CACHE_TIMEOUT', '300'))
+
 # Celery
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+# Как часто пересчитывается снимок показателей панелей администратора и менеджера (сек.)
+DASHBOARD_SNAPSHOT_INTERVAL = int(os.getenv('DASHBOARD_SNAPSHOT_INTERVAL', '60'))
+CELERY_BEAT_SCHEDULE = {
+	'release-expired-stock-holds': {
+		'task': 'backend.apps.orders.tasks.release_expired_holds',
+		'schedule': 60.0,
+	},
+	'purge-idempotency-keys': {
+		'task': 'backend.apps.orders.tasks.purge_idempotency_keys',
+		'schedule': 3600.0,
+	},
+	'purge-export-jobs': {
+		'task': 'backend.apps.analytics.tasks.purge_export_jobs',
+		'schedule': 3600.0,
+	},
+	'refresh-dashboard-snapshot': {
+		'task': 'backend.apps.analytics.tasks.refresh_dashboard_snapshot',
+		'schedule': float(DASHBOARD_SNAPSHOT_INTERVAL),
+		# Не копить пересчёты, если воркер не успевает: следующий всё равно будет свежее
+		'options': {'expires': DASHBOARD_SNAPSHOT_INTERVAL},
+	},
+}
+
+# Задержка пересчёта дневной аналитики после доставки заказа (сек.); доставки за это время объединяются
+ANALYTICS_ROLLUP_DELAY = int(os.getenv('ANALYTICS_ROLLUP_DELAY', '30'))
+# Сколько книг хранить в дневном топе TopSellingBook; 0 — все проданные книги (нужно для отчёта по книгам)
+ANALYTICS_TOP_BOOKS_LIMIT = int(os.getenv('ANALYTICS_TOP_BOOKS_LIMIT', '0'))
+# Сколько хранятся файлы фоновых выгрузок отчётов (сек.)
+EXPORT_FILE_TTL = int(os.getenv('EXPORT_FILE_TTL', '604800'))
+# Предельное время выполнения выгрузки (сек.): дольше задачу останавливает Celery, а зависшее
+# в статусе «выполняется» задание (упавший воркер) purge_export_jobs отмечает ошибкой
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', '3600'))
+# Префикс internal-location nginx для отдачи файлов выгрузок через X-Accel-Redirect; пусто — файл отдаёт Django
+EXPORT_ACCEL_REDIRECT = os.getenv('EXPORT_ACCEL_REDIRECT', '')
+
+# Срок резерва товара под позицию корзины (сек.); продлевается при изменении позиции
+CART_HOLD_TTL = int(os.getenv('CART_HOLD_TTL', '900'))
+# Сколько хранится ключ идемпотентности оформления заказа (сек.)
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
 
 # Channels
 CHANNEL_LAYERS = {
@@ -44,6 +44,8 @@ STATIC_URL = '/static/'
 STATIC_ROOT = '/app/staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/app/media'
+# Файлы выгрузок отдаёт nginx (location /protected-exports/ в nginx.conf)
+EXPORT_ACCEL_REDIRECT = os.getenv('EXPORT_ACCEL_REDIRECT', '/protected-exports/')
 
 # Logging
 LOGGING = {
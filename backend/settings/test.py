@@ -8,6 +8,13 @@ DATABASES = {
     }
 }
 
+# Без кэша, чтобы тесты не видели страниц друг друга; тесты кэша включают locmem через override_settings
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
 # Упрощенный хэшер паролей для ускорения тестов
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.MD5PasswordHasher',
@@ -20,65 +20,14 @@ EXECUTE FUNCTION trigger_update_book_rating();
 COMMENT ON TRIGGER update_book_rating_trigger ON reviews_review IS 
 'Автоматически обновляет рейтинг книги при изменении модерированных отзывов';
 
--- 2. Триггер: Валидация запасов при заказе
-CREATE OR REPLACE FUNCTION trigger_validate_stock()
-RETURNS TRIGGER AS $$
-DECLARE
-    available_stock INTEGER;
-BEGIN
-    -- Получаем доступный запас
-    SELECT (stock - reserved) INTO available_stock
-    FROM catalog_inventory
-    WHERE book_id = NEW.book_id;
-    
-    -- Проверяем достаточность
-    IF available_stock < NEW.quantity THEN
-        RAISE EXCEPTION 'Insufficient stock. Available: %, requested: %', 
-            available_stock, NEW.quantity;
-    END IF;
-    
-    -- Резервируем товар
-    UPDATE catalog_inventory
-    SET reserved = reserved + NEW.quantity
-    WHERE book_id = NEW.book_id;
-    
-    RETURN NEW;
-END;
-$$ LANGUAGE plpgsql;
-
-CREATE TRIGGER validate_stock_trigger
-BEFORE INSERT ON orders_orderitem
-FOR EACH ROW
-EXECUTE FUNCTION trigger_validate_stock();
-
-COMMENT ON TRIGGER validate_stock_trigger ON orders_orderitem IS 
-'Проверяет достаточность запасов и резервирует товар при создании заказа';
-
--- 3. Триггер: Освобождение запасов при отмене заказа
-CREATE OR REPLACE FUNCTION trigger_release_stock()
-RETURNS TRIGGER AS $$
-BEGIN
-    -- Освобождаем зарезервированный товар при отмене заказа
-    IF NEW.status = 'cancelled' AND OLD.status != 'cancelled' THEN
-        UPDATE catalog_inventory ci
-        SET reserved = reserved - oi.quantity
-        FROM orders_orderitem oi
-        WHERE ci.book_id = oi.book_id
-        AND oi.order_id = NEW.id;
-    END IF;
-    
-    RETURN NEW;
-END;
-$$ LANGUAGE plpgsql;
-
-CREATE TRIGGER release_stock_trigger
-AFTER UPDATE ON orders_order
-FOR EACH ROW
-WHEN (NEW.status = 'cancelled' AND OLD.status != 'cancelled')
-EXECUTE FUNCTION trigger_release_stock();
-
-COMMENT ON TRIGGER release_stock_trigger ON orders_order IS 
-'Освобождает зарезервированные товары при отмене заказа';
+-- 2-3. Резервирование и списание запасов выполняет приложение (orders/reservations.py,
+-- orders/services.py): корзина держит резерв в catalog_inventory.reserved, оформление
+-- заказа превращает его в списание stock. Прежние триггеры резервирования на
+-- orders_orderitem / orders_order учитывали бы товар повторно, поэтому удаляются.
+DROP TRIGGER IF EXISTS validate_stock_trigger ON orders_orderitem;
+DROP FUNCTION IF EXISTS trigger_validate_stock();
+DROP TRIGGER IF EXISTS release_stock_trigger ON orders_order;
+DROP FUNCTION IF EXISTS trigger_release_stock();
 
 -- 4. Триггер: Автоматический расчет итоговой суммы заказа
 CREATE OR REPLACE FUNCTION trigger_calculate_order_total()
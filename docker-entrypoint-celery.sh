@@ -15,6 +15,6 @@ while ! python -c "import socket; socket.create_connection(('redis', 6379))" 2>/
 done
 echo "Redis is ready!"
 
-# Start Celery worker
+# Start Celery worker (with embedded beat for periodic tasks)
 echo "Starting Celery worker..."
-exec celery -A backend worker -l info
+exec celery -A backend worker --beat -l info